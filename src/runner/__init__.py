@@ -1,183 +1,365 @@
-import contextlib
+import concurrent.futures
 import datetime
+import functools
+import logging
 import os
-import random
-import shutil
-import string
 import time
-import traceback
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, TypeVar, Union,
+)
 
-from . import containers
+from .concurrency import run_concurrently, run_graph
 from .containers import (
-    ClientContainer, AggregatorContainer, CollectorContainer, InteropAPIError,
+    DEFAULT_LOG_SIZE_LIMIT, LOCAL_ADDRESS, ClientContainer,
+    AggregatorContainer, CollectorContainer, DAPContainer, InteropAPIError,
+    encode_base64url,
 )
+from .corpus import open_measurements
 from .dap import generate_auth_token, generate_task_id
 from .models import (
-    FixedSizeQuery, ImageSet, Query, QueryType, TestCase, TimeIntervalQuery,
+    FixedSizeQuery, ImageSet, ProvisionedTask, Query, QueryType, RunOptions,
+    TestCase, TestMetrics, TimeIntervalQuery,
 )
+from .networks import NetworkPool
+from .polling import Backoff, Deadline
+from .pool import ContainerPool, ContainerSet
+from .tracing import span
+from .upload import upload_measurements, upload_measurements_with_asyncio
 from .vdaf import (
-    aggregate_measurements, generate_measurement, generate_vdaf_verify_key,
+    Accumulator, add_aggregates, format_aggregate, generate_vdaf_verify_key,
+    parse_aggregate,
 )
 
-IDENTIFIER_ALPHABET = string.ascii_lowercase + string.digits
-
 LOG_ON_ERROR_DIRECTORY = "error_logs"
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
-def run_test(client, image_set: ImageSet, test_case: TestCase):
-    random_id = "".join(random.choices(IDENTIFIER_ALPHABET, k=10))
-    with contextlib.ExitStack() as stack:
-        network = stack.enter_context(
-            containers.container_network(client, f"dap-interop-{random_id}")
-        )
-        client_container = stack.enter_context(
-            containers.run_container(
-                client,
-                image_set.client,
-                f"dap-client-{random_id}",
-                network,
-                ClientContainer,
-            )
-        )
-        leader_container = stack.enter_context(
-            containers.run_container(
-                client,
-                image_set.leader,
-                f"dap-leader-{random_id}",
-                network,
-                AggregatorContainer,
-            )
-        )
-        helper_container = stack.enter_context(
-            containers.run_container(
-                client,
-                image_set.helper,
-                f"dap-helper-{random_id}",
-                network,
-                AggregatorContainer,
-            )
-        )
-        collector_container = stack.enter_context(
-            containers.run_container(
-                client,
-                image_set.collector,
-                f"dap-collector-{random_id}",
-                network,
-                CollectorContainer,
-            )
-        )
 
+def run_test(client, image_set: ImageSet, test_case: TestCase,
+             options: RunOptions = RunOptions(),
+             pool: Optional[ContainerPool] = None,
+             networks: Optional[NetworkPool] = None,
+             host_address: str = LOCAL_ADDRESS) -> TestMetrics:
+    """
+    Run a test case against the given set of images, and return measurements
+    taken during the test. If a ContainerPool is provided, containers are
+    taken from it and returned to it afterwards. Otherwise, fresh containers
+    are started and removed for this test case, on a network leased from
+    `networks` if given, and reached at `host_address`.
+    """
+    with span("run_test", test_case=test_case.name,
+              client=image_set.client, leader=image_set.leader,
+              helper=image_set.helper, collector=image_set.collector):
+        if pool is not None:
+            container_set = pool.acquire(image_set)
+        else:
+            container_set = ContainerSet(client, image_set, options,
+                                         networks=networks,
+                                         host_address=host_address)
+        for role, container in container_set.roles():
+            container.trace_tags = {"role": role, "test_case": test_case.name}
+            # No single request may take longer than the test case's longest
+            # deadline.
+            container.request_timeout = max(
+                test_case.collection_timeout,
+                options.readiness_timeout_for(container.original_image))
+        # Docker timestamps log lines with second granularity, so back off by
+        # a second to be sure we get all output from this test case.
+        started_at = datetime.datetime.now(datetime.timezone.utc) - \
+            datetime.timedelta(seconds=1)
+        passed = False
         try:
-            run_test_inner(client_container, leader_container,
-                           helper_container, collector_container, test_case)
+            metrics = run_test_inner(
+                container_set.client,
+                container_set.leader,
+                container_set.helper,
+                container_set.collector,
+                test_case,
+                options,
+            )
+            passed = True
+            if container_set.uses > 1:
+                # These containers were already running before this test
+                # case.
+                metrics.startup_times.clear()
+            return metrics
         except Exception:
-            shutil.rmtree(LOG_ON_ERROR_DIRECTORY, ignore_errors=True)
-            os.mkdir(LOG_ON_ERROR_DIRECTORY)
-            for name, container in (("client", client_container),
-                                    ("leader", leader_container),
-                                    ("helper", helper_container),
-                                    ("collector", collector_container)):
-                subdirectory = os.path.join(LOG_ON_ERROR_DIRECTORY, name)
-                os.mkdir(subdirectory)
-                try:
-                    container.copy_logs_directory(subdirectory)
-                except Exception:
-                    traceback.print_exc()
-                    print("Error copying directory from container")
-                    print()
-                try:
-                    container.save_process_logs(os.path.join(
-                        subdirectory, "container_process.log"))
-                except Exception:
-                    traceback.print_exc()
-                    print("Error saving container logs")
-                    print()
+            with span("save_error_logs"):
+                directory = save_error_logs(container_set, test_case,
+                                            started_at, options.max_log_bytes)
+            logger.info("Saved logs from failed test case %s to %s",
+                        test_case.name, directory)
             raise
+        finally:
+            if pool is not None:
+                pool.release(container_set, passed)
+            else:
+                container_set.close()
+
+
+def save_error_logs(container_set: ContainerSet, test_case: TestCase,
+                    started_at: datetime.datetime,
+                    max_log_bytes: int = DEFAULT_LOG_SIZE_LIMIT) -> str:
+    """
+    Save logs from each container after a test case fails, in a new
+    subdirectory of LOG_ON_ERROR_DIRECTORY, and return its path. Logs from
+    the four containers are captured concurrently, and each container's logs
+    are truncated after `max_log_bytes` bytes.
+    """
+    timestamp = started_at.strftime("%Y%m%dT%H%M%S")
+    directory = os.path.join(
+        LOG_ON_ERROR_DIRECTORY,
+        f"{timestamp}-{test_case.name}-{container_set.random_id}",
+    )
+    os.makedirs(directory)
+    with open(os.path.join(directory, "test_case.txt"), "w") as f:
+        print(f"Test case: {test_case.name}", file=f)
+        for name, container in container_set.roles():
+            print(f"{name.capitalize()}: {container.original_image}", file=f)
+        print(f"Containers: dap-*-{container_set.random_id}", file=f)
+        print(f"Test cases run in these containers: {container_set.uses}",
+              file=f)
+        print(f"Started at: {started_at.isoformat()}", file=f)
+        if container_set.uses > 1:
+            print("Process logs only include output since this test case "
+                  "started. Files copied from /logs may include output from "
+                  "earlier test cases.", file=f)
+
+    def save(name: str, container: DAPContainer):
+        with span("save_container_logs", role=name):
+            try:
+                container.save_logs_archive(
+                    os.path.join(directory, f"{name}_logs.tar.gz"),
+                    max_log_bytes,
+                )
+            except Exception:
+                logger.exception("Error copying /logs directory from %s "
+                                 "container", name)
+            try:
+                container.save_process_logs(
+                    os.path.join(directory, f"{name}_process.log.gz"),
+                    started_at if container_set.uses > 1 else None,
+                    max_log_bytes,
+                )
+            except Exception:
+                logger.exception("Error saving %s container logs", name)
+
+    run_concurrently([functools.partial(save, name, container)
+                      for name, container in container_set.roles()])
+    return directory
 
 
 def run_test_inner(client_container: ClientContainer,
                    leader_container: AggregatorContainer,
                    helper_container: AggregatorContainer,
                    collector_container: CollectorContainer,
-                   test_case: TestCase):
-    for container in [client_container, leader_container,
-                      helper_container, collector_container]:
-        container.wait_for_ready()
+                   test_case: TestCase,
+                   options: RunOptions = RunOptions()) -> TestMetrics:
+    task = provision_task(client_container, leader_container,
+                          helper_container, collector_container, test_case,
+                          options)
+    return upload_and_collect(client_container, collector_container, task,
+                              test_case, options)
 
+
+class _TimedIterator(Iterator[T]):
+    "Wraps an iterator, and adds up the time spent producing its items."
+
+    def __init__(self, iterable: Iterable[T]):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+
+    def __next__(self) -> T:
+        started = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+def upload_and_collect(client_container: ClientContainer,
+                       collector_container: CollectorContainer,
+                       task: ProvisionedTask, test_case: TestCase,
+                       options: RunOptions = RunOptions(),
+                       latencies: Optional[List[float]] = None
+                       ) -> TestMetrics:
+    """
+    Upload a test case's measurements to a provisioned task, collect the
+    aggregate result, and raise an exception unless it is correct. If a
+    `latencies` list is provided, the duration in seconds of each upload
+    request is appended to it.
+    """
+    # Unless the expected result was stored with the measurements, they are
+    # generated lazily, and each generated batch is added to the accumulator.
+    accumulator = Accumulator(test_case.vdaf)
+    with open_measurements(test_case, options, accumulator) as (measurements,
+                                                                expected):
+        timed_measurements = _TimedIterator(measurements)
+        upload = (upload_measurements_with_asyncio if options.async_uploads
+                  else upload_measurements)
+        upload_started = time.perf_counter()
+        with span("upload", count=test_case.measurement_count,
+                  **task.trace_tags):
+            # This raises an exception unless every measurement was
+            # acknowledged, so the accumulator holds the total of the
+            # measurements the client accepted.
+            upload_count = upload(
+                client_container,
+                task.task_id,
+                task.leader_endpoint,
+                task.helper_endpoint,
+                test_case.vdaf,
+                timed_measurements,
+                task.time_precision,
+                options.upload_concurrency,
+                options.upload_batch_size,
+                latencies,
+            )
+        upload_time = time.perf_counter() - upload_started
+    expected_aggregate_result = (expected if expected is not None
+                                 else accumulator.result())
+
+    collection_started = time.monotonic()
+    with span("collect", batches=test_case.batch_count, **task.trace_tags):
+        result = collect_batches(collector_container, task, test_case)
+    metrics = TestMetrics(
+        collection_latency=time.monotonic() - collection_started,
+        startup_times=dict(task.startup_times),
+        upload_count=upload_count,
+        upload_time=upload_time,
+        generation_time=timed_measurements.elapsed,
+    )
+
+    if expected_aggregate_result != result:
+        raise Exception(
+            f"Incorrect result, expected {expected_aggregate_result}, "
+            f"got {result}")
+
+    return metrics
+
+
+def provision_task(client_container: ClientContainer,
+                   leader_container: AggregatorContainer,
+                   helper_container: AggregatorContainer,
+                   collector_container: CollectorContainer,
+                   test_case: TestCase,
+                   options: RunOptions = RunOptions()) -> ProvisionedTask:
+    """
+    Wait for the containers to be ready, and then set up a new task for the
+    given test case in the leader, helper, and collector.
+    """
     task_id = generate_task_id()
     aggregator_auth_token = generate_auth_token("leader")
     collector_auth_token = generate_auth_token("collector")
     vdaf_verify_key = generate_vdaf_verify_key(test_case.vdaf)
 
-    leader_endpoint = leader_container.endpoint_for_task(task_id, "leader")
-    helper_endpoint = helper_container.endpoint_for_task(task_id, "helper")
-
-    collector_hpke_config_base64 = collector_container.add_task(
-        task_id,
-        leader_endpoint,
-        test_case.vdaf,
-        collector_auth_token,
-        test_case.query_type,
-    )
-
     # Fix these task parameters for now
     max_batch_query_count = 1
-    min_batch_size = test_case.measurement_count
+    min_batch_size = test_case.batch_size
     time_precision = 3600
     task_expiration = int(datetime.datetime(3000, 1, 1, 0, 0, 0).timestamp())
 
-    leader_container.add_task(
-        task_id,
-        "leader",
-        leader_endpoint,
-        helper_endpoint,
-        test_case.vdaf,
-        aggregator_auth_token,
-        collector_auth_token,
-        vdaf_verify_key,
-        max_batch_query_count,
-        min_batch_size,
-        time_precision,
-        collector_hpke_config_base64,
-        task_expiration,
-        test_case.query_type,
-    )
-    helper_container.add_task(
-        task_id,
-        "helper",
-        leader_endpoint,
-        helper_endpoint,
-        test_case.vdaf,
-        aggregator_auth_token,
-        None,
-        vdaf_verify_key,
-        max_batch_query_count,
-        min_batch_size,
-        time_precision,
-        collector_hpke_config_base64,
-        task_expiration,
-        test_case.query_type,
-    )
+    # Set up the task, running each step as soon as the steps it depends on
+    # are done.
+    def wait_for_ready(container):
+        timeout = options.readiness_timeout_for(container.original_image)
+        return lambda _: container.wait_for_ready(timeout)
 
-    batch_interval_start = int(
-        time.time() // time_precision) * time_precision
-    batch_interval_duration = time_precision * 2
+    def probe_batch_upload(results):
+        if options.upload_batch_size > 1:
+            client_container.supports_batch_upload(
+                task_id, results["leader_endpoint"],
+                results["helper_endpoint"], test_case.vdaf, time_precision)
 
-    measurements = []
-    for _ in range(test_case.measurement_count):
-        measurement = generate_measurement(test_case.vdaf)
-        measurements.append(measurement)
-        client_container.upload(
+    def add_collector_task(results):
+        return collector_container.add_task(
             task_id,
-            leader_endpoint,
-            helper_endpoint,
+            results["leader_endpoint"],
             test_case.vdaf,
-            measurement,
+            collector_auth_token,
+            test_case.query_type,
+        )
+
+    def add_leader_task(results):
+        leader_container.add_task(
+            task_id,
+            "leader",
+            results["leader_endpoint"],
+            results["helper_endpoint"],
+            test_case.vdaf,
+            aggregator_auth_token,
+            collector_auth_token,
+            vdaf_verify_key,
+            max_batch_query_count,
+            min_batch_size,
+            time_precision,
+            results["collector_hpke_config"],
+            task_expiration,
+            test_case.query_type,
+        )
+
+    def add_helper_task(results):
+        helper_container.add_task(
+            task_id,
+            "helper",
+            results["leader_endpoint"],
+            results["helper_endpoint"],
+            test_case.vdaf,
+            aggregator_auth_token,
             None,
+            vdaf_verify_key,
+            max_batch_query_count,
+            min_batch_size,
             time_precision,
+            results["collector_hpke_config"],
+            task_expiration,
+            test_case.query_type,
         )
-    expected_aggregate_result = aggregate_measurements(
-        test_case.vdaf, None, measurements)
+
+    setup_steps = {
+        "client_ready": ((), wait_for_ready(client_container)),
+        "leader_ready": ((), wait_for_ready(leader_container)),
+        "helper_ready": ((), wait_for_ready(helper_container)),
+        "collector_ready": ((), wait_for_ready(collector_container)),
+        # Clients may look up the task's configuration from the aggregators
+        # even when uploading no reports.
+        "batch_upload_probe": (
+            ("client_ready", "leader_task", "helper_task"),
+            probe_batch_upload,
+        ),
+        "leader_endpoint": (
+            ("leader_ready",),
+            lambda _: leader_container.endpoint_for_task(task_id, "leader"),
+        ),
+        "helper_endpoint": (
+            ("helper_ready",),
+            lambda _: helper_container.endpoint_for_task(task_id, "helper"),
+        ),
+        "collector_hpke_config": (
+            ("collector_ready", "leader_endpoint"), add_collector_task),
+        "leader_task": (
+            ("leader_endpoint", "helper_endpoint", "collector_hpke_config"),
+            add_leader_task,
+        ),
+        "helper_task": (
+            ("leader_endpoint", "helper_endpoint", "collector_hpke_config"),
+            add_helper_task,
+        ),
+    }
+    trace_tags = {
+        "test_case": test_case.name,
+        "task_id": encode_base64url(task_id),
+    }
+    setup_results = run_graph({
+        name: (dependencies, traced_step(name, function, trace_tags))
+        for name, (dependencies, function) in setup_steps.items()
+    })
+
+    batch_interval_start = int(
+        time.time() // time_precision) * time_precision
+    batch_interval_duration = time_precision * 2
 
     query: Query
     if test_case.query_type == QueryType.TIME_INTERVAL:
@@ -188,28 +370,78 @@ def run_test_inner(client_container: ClientContainer,
     elif test_case.query_type == QueryType.FIXED_SIZE:
         query = FixedSizeQuery()
 
-    result = None
-    for _ in range(5):
-        if result is not None:
-            break
+    return ProvisionedTask(
+        task_id=task_id,
+        leader_endpoint=setup_results["leader_endpoint"],
+        helper_endpoint=setup_results["helper_endpoint"],
+        time_precision=time_precision,
+        query=query,
+        startup_times={
+            role: setup_results[f"{role}_ready"]
+            for role in ("client", "leader", "helper", "collector")
+        },
+        trace_tags=trace_tags,
+    )
+
+
+def traced_step(name: str, function: Callable[[Dict[str, Any]], Any],
+                tags: Dict[str, str]) -> Callable[[Dict[str, Any]], Any]:
+    "Wrap a setup step so that its execution is recorded as a trace span."
+    def step(results):
+        with span(name, **tags):
+            return function(results)
+    return step
+
+
+def collect_batches(collector_container: CollectorContainer,
+                    task: ProvisionedTask,
+                    test_case: TestCase) -> Union[str, List[str]]:
+    """
+    Collect each of a test case's batches, with up to
+    `test_case.concurrent_collections` collection flows running at once, and
+    return the sum of their aggregate results.
+    """
+    deadline = Deadline(test_case.collection_timeout)
+    if test_case.batch_count == 1:
+        return collect(collector_container, task.task_id, task.query,
+                       deadline)
+
+    def collect_batch(_index: int) -> Union[str, List[str]]:
+        return collect(collector_container, task.task_id, task.query,
+                       deadline)
+
+    with concurrent.futures.ThreadPoolExecutor(
+            test_case.concurrent_collections) as executor:
+        results = list(executor.map(collect_batch,
+                                    range(test_case.batch_count)))
+    return format_aggregate(functools.reduce(
+        add_aggregates, (parse_aggregate(result) for result in results)))
+
+
+def collect(collector_container: CollectorContainer, task_id: bytes,
+            query: Query, deadline: Deadline) -> Union[str, List[str]]:
+    """
+    Run a collection flow, and return the aggregate result. Collection jobs
+    are polled with exponential backoff, and if the collector returns an
+    error, a new collection job is started. Gives up once the deadline
+    passes.
+    """
+    start_backoff = Backoff()
+    while True:
         try:
             handle = collector_container.collection_start(task_id, None, query)
 
-            for _ in range(30):
+            poll_backoff = Backoff()
+            while True:
                 result = collector_container.collection_poll(handle)
                 if result is not None:
-                    break
-                time.sleep(1)
-            else:
-                raise Exception("Timed out waiting for collection to complete")
+                    return result
+                if deadline.expired():
+                    raise Exception(
+                        "Timed out waiting for collection to complete")
+                deadline.sleep(poll_backoff.next_delay())
 
         except InteropAPIError:
-            time.sleep(1)
-            continue
-    else:
-        raise Exception("Timed out waiting for collection flow")
-
-    if expected_aggregate_result != result:
-        raise Exception(
-            f"Incorrect result, expected {expected_aggregate_result}, "
-            f"got {result}")
+            if deadline.expired():
+                raise Exception("Timed out waiting for collection flow")
+            deadline.sleep(start_backoff.next_delay())
@@ -1,96 +1,235 @@
 import argparse
 import collections
-import logging
+import dataclasses
 import sys
 import traceback
+from typing import Dict, List, Optional, Tuple
 
-try:
-    import tomllib  # type: ignore
-except ModuleNotFoundError:
-    import tomli as tomllib  # type: ignore
+from . import LOG_ON_ERROR_DIRECTORY, benchmark, run_test, stress, tracing
+from .cli import (
+    add_image_arguments, add_measurement_arguments, add_upload_arguments,
+    add_verbose_argument, check_positive, configure_logging, docker_client,
+    docker_host_address, load_image_sets, parse_docker_host, run_options,
+)
+from .containers import LOCAL_ADDRESS
+from .corpus import open_measurements
+from .images import DigestCache, ImagePuller, image_set_images
+from .matrix import FULL, ImageLists, coverage
+from .models import ImageSet, RunOptions, TestCase, TestMetrics
+from .networks import NetworkPool, cleanup_orphaned_networks
+from .pool import ContainerPool
+from .results import RerunPolicy, ResultCache, result_key
+from .scheduler import DockerHost, NoHealthyHostsError, Scheduler
+from .test_cases import TEST_CASES
 
-import docker  # type: ignore
+# Images whose containers take longer than this many seconds to become ready,
+# on average, are called out in the summary.
+SLOW_STARTUP_THRESHOLD = 10.0
+
+
+@dataclasses.dataclass
+class TestOutcome:
+    passed: bool
+    # Metrics from the test case, if it was run and passed.
+    metrics: Optional[TestMetrics] = None
+    # Formatted traceback, if the test case was run and failed.
+    error: str = ""
+    # Whether the test case was not run, because of its results from previous
+    # runs. If so, `passed` is whether it passed previously.
+    skipped: bool = False
+
+
+def run_test_capturing_errors(client, image_set: ImageSet,
+                              test_case: TestCase,
+                              options: RunOptions,
+                              pool: Optional[ContainerPool],
+                              puller: Optional[ImagePuller] = None,
+                              results: Optional[ResultCache] = None,
+                              rerun: RerunPolicy = RerunPolicy.ALL,
+                              networks: Optional[NetworkPool] = None,
+                              host_address: str = LOCAL_ADDRESS,
+                              ) -> TestOutcome:
+    """
+    Run one test case, and return its outcome. Exceptions are captured rather
+    than printed so that output from concurrently running tests is not
+    interleaved. If a puller is given, the test case first waits for its
+    images to be pulled. If a result cache is given, the test case is only
+    run if `rerun` allows it, given its previous result, and its new result
+    is recorded. Nothing is recorded if the test case did not run, for
+    example because its images could not be pulled.
+    """
+    ran = False
+    try:
+        if puller is not None:
+            puller.wait(image_set_images(image_set))
+        key = None
+        if results is not None:
+            key = result_key(client, image_set, test_case, options,
+                             pool is not None)
+            previous = results.get(key) if key is not None else None
+            if not rerun.should_run(previous):
+                return TestOutcome(passed=bool(previous), skipped=True)
+        ran = True
+        metrics = run_test(client, image_set, test_case, options, pool,
+                           networks, host_address)
+        outcome = TestOutcome(passed=True, metrics=metrics)
+    except Exception:
+        outcome = TestOutcome(passed=False, error=traceback.format_exc())
+    if results is not None and ran:
+        # Images that were not present before the test case ran have been
+        # pulled by now, so their IDs are known.
+        if key is None:
+            key = result_key(client, image_set, test_case, options,
+                             pool is not None)
+        if key is not None:
+            results.record(key, image_set, test_case, outcome.passed)
+    return outcome
 
-from . import run_test
-from .models import ImageSet
-from .test_cases import TEST_CASES
+
+def connect_docker_hosts(args: argparse.Namespace) -> List[DockerHost]:
+    """
+    Connect to each Docker host given with `--docker-host`, or to the Docker
+    host from the environment if none were given. Hosts that cannot be
+    reached are left out, unless none can be.
+    """
+    if not args.docker_host:
+        return [DockerHost("default", docker_client(args), args.jobs,
+                           address=docker_host_address(args))]
+    hosts = []
+    for value in args.docker_host:
+        url, slots = parse_docker_host(value)
+        try:
+            client = docker_client(args, url)
+        except Exception as e:
+            print(f"Could not connect to Docker host {url}: {e}",
+                  file=sys.stderr)
+            continue
+        hosts.append(DockerHost(url, client, slots or args.jobs,
+                                address=docker_host_address(args, url)))
+    if not hosts:
+        print("Could not connect to any Docker host", file=sys.stderr)
+        sys.exit(1)
+    return hosts
+
+
+def print_coverage(image_sets: List[ImageSet], image_lists: ImageLists):
+    "Print how many pairs of images for interacting roles were tested."
+    print(f"Tested {len(image_sets)} combinations of images, covering:")
+    for (role_a, role_b), (covered, total) in \
+            coverage(image_sets, image_lists).items():
+        print(f"{role_a} and {role_b}: {covered}/{total} pairs of images")
+
+
+def print_startup_times(startup_times: Dict[str, List[float]]):
+    """
+    Print how long containers from each image took to become ready, slowest
+    first.
+    """
+    print("Container startup times:")
+    summaries = sorted(
+        ((sum(times) / len(times), max(times), len(times), image)
+         for image, times in startup_times.items()),
+        reverse=True,
+    )
+    for mean, maximum, count, image in summaries:
+        line = (f"{image}: mean {mean:.2f}s, max {maximum:.2f}s over "
+                f"{count} containers")
+        if mean >= SLOW_STARTUP_THRESHOLD:
+            line += " (slow)"
+        print(line)
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "stress":
+        stress.main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
-        description="Test runner for DAP interoperation tests")
-    parser.add_argument("--image-lists", default="images.toml",
-                        help="TOML file with lists of container images. "
-                        "Defaults to `images.toml`. Tests will be executed "
-                        "with every combination of images from these lists.")
-    parser.add_argument("--client", help="Client container image")
-    parser.add_argument("--leader", help="Leader container image")
-    parser.add_argument("--helper", help="Helper container image")
-    parser.add_argument("--collector", help="Collector container image")
-    parser.add_argument("--pull", action="store_true",
-                        help="Pull updated container images before running")
+        description="Test runner for DAP interoperation tests",
+        epilog="Run `python -m runner benchmark --help` for options to "
+        "benchmark implementations, and `python -m runner stress --help` for "
+        "options to run many tasks at once.")
+    add_image_arguments(parser)
+    parser.add_argument("--reuse-containers", action="store_true",
+                        help="Keep containers running between test cases, "
+                        "and reuse them for subsequent test cases with the "
+                        "same images. Containers are replaced after a test "
+                        "case fails.")
+    parser.add_argument("--max-container-uses", type=int, metavar="N",
+                        help="With --reuse-containers, replace containers "
+                        "after they have been used for N test cases. By "
+                        "default, there is no limit.")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write timing traces of each phase of each test "
+                        "case to FILE, in Chrome trace event format")
+    parser.add_argument("--results-cache", metavar="FILE",
+                        default=".test-results.json",
+                        help="File recording the result of each test case "
+                        "with each combination of image IDs and upload "
+                        "options. Test cases that passed with the same images "
+                        "and options before are skipped. "
+                        "Not used with --fake. Defaults to "
+                        "`.test-results.json`.")
+    rerun_group = parser.add_mutually_exclusive_group()
+    rerun_group.add_argument("--rerun-failed", action="store_true",
+                             help="Only run test cases that failed with the "
+                             "same images before")
+    rerun_group.add_argument("--rerun-all", action="store_true",
+                             help="Run test cases even if they passed with "
+                             "the same images before")
+    parser.add_argument("--no-network-pool", action="store_true",
+                        help="Create and remove a Docker network for each "
+                        "set of containers, instead of reusing networks "
+                        "from a pool")
+    parser.add_argument("--max-log-size", type=int, default=64,
+                        metavar="MIB",
+                        help="Maximum size in MiB of logs saved from each "
+                        "container when a test case fails. Defaults to 64.")
     parser.add_argument("--list", action="store_true",
                         help="List available test cases")
-    parser.add_argument("-v", "--verbose", action="count", help="Verbosity "
-                        "level. This may be specified up to three times.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of test cases to run concurrently on "
+                        "each Docker host. Defaults to 1.")
+    parser.add_argument("--docker-host", action="append", metavar="URL[=N]",
+                        help="Docker daemon to run test cases on, running up "
+                        "to N test cases at a time, or --jobs if N is not "
+                        "given. This may be given multiple times, to spread "
+                        "test cases across hosts. If a host stops "
+                        "responding, its test cases are run on the other "
+                        "hosts. Interop API requests are sent to ports "
+                        "published at the host name in each URL. By default, "
+                        "the Docker daemon is found from the environment.")
+    add_upload_arguments(parser)
+    add_measurement_arguments(parser)
+    parser.add_argument("--generate-corpus", action="store_true",
+                        help="Generate measurements for the selected test "
+                        "cases in the --corpus-dir directory, and exit "
+                        "without running them")
+    add_verbose_argument(parser)
     parser.add_argument("test_case_filter", metavar="FILTER", nargs="*",
                         help="Filter to select test cases")
     args = parser.parse_args()
 
-    logging.basicConfig()
-    if not args.verbose:
-        logging.getLogger().setLevel(logging.ERROR)
-    elif args.verbose == 1:
-        logging.getLogger().setLevel(logging.WARNING)
-    elif args.verbose == 2:
-        logging.getLogger().setLevel(logging.INFO)
-    else:
-        logging.getLogger().setLevel(logging.DEBUG)
+    configure_logging(args.verbose)
+
+    check_positive(args.jobs, "--jobs")
+    check_positive(args.pull_jobs, "--pull-jobs")
+    check_positive(args.upload_concurrency, "--upload-concurrency")
+    check_positive(args.upload_batch_size, "--upload-batch-size")
+    check_positive(args.max_log_size, "--max-log-size")
+    if args.max_container_uses is not None:
+        if not args.reuse_containers:
+            parser.error("--max-container-uses requires --reuse-containers")
+        check_positive(args.max_container_uses, "--max-container-uses")
 
     if args.list:
         for test_case in TEST_CASES:
             print(test_case.name)
         return
 
-    client = docker.from_env()
-    client.ping()
-
-    image_sets = None
-    images_to_pull = set()
-    if args.client or args.leader or args.helper or args.collector:
-        if (not args.client or not args.leader or not args.helper or
-                not args.collector):
-            print("Either all or none of --client, --leader, --helper, and "
-                  "--collector must be provided", file=sys.stderr)
-            sys.exit(2)
-        image_sets = [ImageSet(args.client, args.leader,
-                               args.helper, args.collector)]
-        images_to_pull.add(args.client)
-        images_to_pull.add(args.leader)
-        images_to_pull.add(args.helper)
-        images_to_pull.add(args.collector)
-    else:
-        with open(args.image_lists, "rb") as f:
-            images_dict = tomllib.load(f)
-        image_sets = list()
-        for list_key in ("client", "leader", "helper", "collector"):
-            for image in images_dict[list_key]:
-                images_to_pull.add(image)
-        for client_image in images_dict["client"]:
-            for leader_image in images_dict["leader"]:
-                for helper_image in images_dict["helper"]:
-                    for collector_image in images_dict["collector"]:
-                        image_sets.append(ImageSet(
-                            client_image,
-                            leader_image,
-                            helper_image,
-                            collector_image,
-                        ))
-
-    if args.pull:
-        for image in images_to_pull:
-            client.images.pull(image)
-
     filtered_test_cases = []
     for test_case in TEST_CASES:
         matches = False
@@ -105,38 +244,155 @@ def main():
         if matches:
             filtered_test_cases.append(test_case)
 
+    if args.generate_corpus:
+        if args.corpus_dir is None:
+            print("--generate-corpus requires --corpus-dir", file=sys.stderr)
+            sys.exit(2)
+        options = run_options(args, {})
+        for test_case in filtered_test_cases:
+            with open_measurements(test_case, options):
+                pass
+            print(f"{test_case.name}: {test_case.measurement_count} "
+                  "measurements")
+        return
+
+    hosts = connect_docker_hosts(args)
+
+    image_sets, image_lists, readiness_timeouts = load_image_sets(args)
+    options = dataclasses.replace(
+        run_options(args, readiness_timeouts),
+        max_log_bytes=args.max_log_size * 1024 * 1024,
+    )
+
     any_error = False
     success_counters = collections.OrderedDict(
         (image_set, 0) for image_set in image_sets
     )
-    for image_set in image_sets:
-        for test_case in filtered_test_cases:
-            try:
-                run_test(client, image_set, test_case)
-                print(f"{image_set.client}, {image_set.leader}, "
-                      f"{image_set.helper}, {image_set.collector} - "
-                      f"{test_case.name}: pass")
-                success_counters[image_set] += 1
-            except Exception:
-                traceback.print_exc()
-                print(f"{image_set.client}, {image_set.leader}, "
-                      f"{image_set.helper}, {image_set.collector} - "
-                      f"{test_case.name}: fail")
-                any_error = True
+    startup_times = collections.defaultdict(list)
+    skipped_count = 0
+    tracer = None
+    if args.trace:
+        tracer = tracing.Tracer(args.trace)
+        tracing.set_tracer(tracer)
+
+    for host in hosts:
+        removed = cleanup_orphaned_networks(host.client)
+        if removed:
+            print(f"Removed {removed} networks left behind by earlier runs "
+                  f"on {host.name}", file=sys.stderr)
+        if not args.no_network_pool:
+            host.networks = NetworkPool(host.client, host.slots)
+        if args.reuse_containers:
+            host.pool = ContainerPool(host.client, options,
+                                      args.max_container_uses, host.networks,
+                                      host.address)
+
+    # The fake implementations' images never change, so results from the
+    # fake backend say nothing about whether the harness still works.
+    results = None if args.fake else ResultCache(args.results_cache)
+    if args.rerun_failed:
+        rerun = RerunPolicy.FAILED
+    elif args.rerun_all:
+        rerun = RerunPolicy.ALL
+    else:
+        rerun = RerunPolicy.UNLESS_PASSED
+
+    if args.pull:
+        # Every host's puller records digests in the same file.
+        digests = DigestCache(args.pull_cache)
+        for host in hosts:
+            host.puller = ImagePuller(host.client, args.pull_jobs,
+                                      cache=digests)
+            # Pull images in the order that test cases will use them, so
+            # that the first test cases can start as soon as possible.
+            host.puller.pull(image
+                             for image_set in image_sets
+                             for image in image_set_images(image_set))
+
+    def run(host: DockerHost, item: Tuple[ImageSet, TestCase]
+            ) -> TestOutcome:
+        image_set, test_case = item
+        return run_test_capturing_errors(
+            host.client, image_set, test_case, options, host.pool,
+            host.puller, results, rerun, host.networks, host.address)
+
+    work = [(image_set, test_case)
+            for image_set in image_sets
+            for test_case in filtered_test_cases]
+    try:
+        scheduler = Scheduler(
+            hosts, work, run,
+            lambda outcome: not outcome.passed and not outcome.skipped)
+        futures = scheduler.futures()
+        try:
+            # Report results in submission order, regardless of the order in
+            # which tests finish, so that output is deterministic.
+            for (image_set, test_case), future in zip(work, futures):
+                try:
+                    outcome = future.result()
+                except NoHealthyHostsError as e:
+                    outcome = TestOutcome(passed=False, error=f"{e}\n")
+                prefix = (f"{image_set.client}, {image_set.leader}, "
+                          f"{image_set.helper}, {image_set.collector} - "
+                          f"{test_case.name}")
+                if outcome.skipped:
+                    skipped_count += 1
+                    if outcome.passed:
+                        print(f"{prefix}: pass (previous run)")
+                        success_counters[image_set] += 1
+                    else:
+                        print(f"{prefix}: not run")
+                elif outcome.metrics is not None:
+                    print(f"{prefix}: pass (collected in "
+                          f"{outcome.metrics.collection_latency:.2f}s)")
+                    success_counters[image_set] += 1
+                    for role, startup_time in \
+                            outcome.metrics.startup_times.items():
+                        startup_times[getattr(image_set, role)].append(
+                            startup_time)
+                else:
+                    print(outcome.error, end="", file=sys.stderr)
+                    print(f"{prefix}: fail")
+                    any_error = True
+        finally:
+            for future in futures:
+                future.cancel()
+            scheduler.stop()
+    finally:
+        for host in hosts:
+            host.close()
+        if results is not None:
+            results.close()
+        if tracer is not None:
+            tracing.set_tracer(None)
+            tracer.close()
     print()
 
     if TEST_CASES != filtered_test_cases:
         print(f"Filter selected {len(filtered_test_cases)} out of "
               f"{len(TEST_CASES)} test cases")
 
+    if skipped_count:
+        print(f"Skipped {skipped_count} test cases because of results from "
+              f"previous runs recorded in {args.results_cache}. Pass "
+              "--rerun-all to run them.")
+
     for image_set, success_count in success_counters.items():
         print(f"{image_set.client}, {image_set.leader}, {image_set.helper}, "
               f"{image_set.collector}: {success_count}/"
               f"{len(filtered_test_cases)} passed")
 
+    if args.matrix != FULL:
+        print()
+        print_coverage(image_sets, image_lists)
+
+    if startup_times:
+        print()
+        print_startup_times(startup_times)
+
     if any_error:
-        print("Files captured from the most recent failed test case have been "
-              "saved to the directory ./error_logs/")
+        print("Logs from each failed test case have been saved to a "
+              f"subdirectory of ./{LOG_ON_ERROR_DIRECTORY}/")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+"""
+Asyncio counterparts of the interop API clients in `containers`.
+
+Each class wraps a running DAPContainer, and makes the same interop API
+requests with the same semantics and errors, but from an asyncio event loop.
+Requests are sent over a small HTTP/1.1 client built on asyncio streams,
+which keeps connections alive between requests, so that one event loop can
+drive hundreds of concurrent requests to many containers without a thread per
+request.
+
+Objects in this module must be used, and closed with `aclose()`, within a
+single event loop. The wrapped container is still responsible for the
+container's lifecycle, including waiting for it to become ready.
+"""
+import asyncio
+import json
+from typing import List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+from .containers import (
+    ClientContainer, ConnectionStats, DAPContainer,
+    aggregator_add_task_request_body, collection_poll_result,
+    collection_start_request_body, collector_add_task_request_body,
+    endpoint_for_task_request_body, endpoint_not_implemented, parse_response,
+    upload_batch_request_body, upload_request_body,
+)
+from .models import Query, QueryType
+from .tracing import span
+
+# Default maximum number of connections kept open to each container.
+DEFAULT_POOL_SIZE = 10
+
+
+class _StaleConnection(Exception):
+    "A kept-alive connection was closed by the server before it replied."
+
+
+class HTTPConnectionPool:
+    """
+    Sends HTTP/1.1 POST requests to one host, with up to `maxsize` requests
+    in flight at once, each on its own connection. Connections are kept open
+    and reused for later requests, unless the server closes them.
+    """
+
+    def __init__(self, host: str, port: int,
+                 maxsize: int = DEFAULT_POOL_SIZE):
+        self._host = host
+        self._port = port
+        # IPv6 addresses must be enclosed in brackets in the Host header.
+        self._authority = (f"[{host}]:{port}" if ":" in host
+                           else f"{host}:{port}")
+        self._maxsize = maxsize
+        # Created on first use, so that it belongs to the running loop.
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._idle: List[Tuple[asyncio.StreamReader,
+                               asyncio.StreamWriter]] = []
+        self.opened = 0
+        self.requests = 0
+
+    async def post(self, path: str, body: bytes,
+                   content_type: str = "application/json"
+                   ) -> Tuple[int, bytes]:
+        "Send a POST request, and return the status code and response body."
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._maxsize)
+        request = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self._authority}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode() + body
+        async with self._semaphore:
+            while True:
+                reused = bool(self._idle)
+                if reused:
+                    reader, writer = self._idle.pop()
+                else:
+                    reader, writer = await asyncio.open_connection(
+                        self._host, self._port)
+                    self.opened += 1
+                try:
+                    status, response, keep_alive = await self._exchange(
+                        reader, writer, request)
+                except _StaleConnection:
+                    writer.close()
+                    # The server closed an idle connection without reading
+                    # the request, so it is safe to send it again.
+                    if reused:
+                        continue
+                    raise ConnectionError(
+                        f"Connection to {self._authority} closed "
+                        "without a response")
+                except BaseException:
+                    writer.close()
+                    raise
+                self.requests += 1
+                if keep_alive:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, response
+
+    async def _exchange(self, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter, request: bytes
+                        ) -> Tuple[int, bytes, bool]:
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+        except (ConnectionResetError, BrokenPipeError) as e:
+            raise _StaleConnection() from e
+        if not status_line:
+            raise _StaleConnection()
+        # The reason phrase after the status code is optional.
+        version, _, rest = \
+            status_line.decode("latin-1").rstrip("\r\n").partition(" ")
+        status = rest.partition(" ")[0]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                raise ConnectionError("Connection closed in headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" and (
+            version != "HTTP/1.0" or connection == "keep-alive")
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await _read_chunked(reader)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # The body extends until the server closes the connection.
+            body = await reader.read()
+            keep_alive = False
+        return int(status), body, keep_alive
+
+    async def aclose(self):
+        idle, self._idle = self._idle, []
+        for _reader, writer in idle:
+            writer.close()
+        for _reader, writer in idle:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    chunks = []
+    while True:
+        size_line = await reader.readline()
+        size = int(size_line.split(b";", 1)[0], 16)
+        if not size:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    # Skip any trailer fields, up to the final empty line.
+    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+        pass
+    return b"".join(chunks)
+
+
+class AsyncDAPContainer:
+    """
+    Wraps a DAPContainer. The container may be inspected through the Docker
+    API to find its published port, unless it has already become ready, so
+    this should be created before entering the event loop.
+    """
+
+    def __init__(self, container: DAPContainer,
+                 pool_size: int = DEFAULT_POOL_SIZE):
+        self.container = container
+        self.original_image = container.original_image
+        # Shared with the wrapped container, so that tags added to either
+        # apply to requests from both.
+        self.trace_tags = container.trace_tags
+        # The wrapped container remembers its URL once it is known.
+        url = urlsplit(container.host_base_url())
+        assert url.hostname is not None and url.port is not None
+        self._pool = HTTPConnectionPool(url.hostname, url.port, pool_size)
+
+    def container_base_url(self) -> str:
+        return self.container.container_base_url()
+
+    async def make_request(self, path: str, body: dict) -> dict:
+        with span(path, image=self.original_image,
+                  task_id=body.get("task_id"), **self.trace_tags):
+            status_code, content = await asyncio.wait_for(
+                self._pool.post("/" + path, json.dumps(body).encode()),
+                self.container.request_timeout)
+        return parse_response(self.original_image, path, status_code,
+                              content)
+
+    def connection_stats(self) -> ConnectionStats:
+        return ConnectionStats(self._pool.opened,
+                               self._pool.requests - self._pool.opened)
+
+    async def aclose(self):
+        "Close this object's connections. The container is left running."
+        await self._pool.aclose()
+
+
+class AsyncClientContainer(AsyncDAPContainer):
+    async def upload(self, task_id: bytes, leader_endpoint: str,
+                     helper_endpoint: str, vdaf: dict,
+                     measurement: Union[str, List[str]],
+                     time: Union[int, None], time_precision: int):
+        await self.make_request("internal/test/upload", upload_request_body(
+            task_id, leader_endpoint, helper_endpoint, vdaf, measurement,
+            time, time_precision))
+
+    async def supports_batch_upload(self, task_id: bytes,
+                                    leader_endpoint: str,
+                                    helper_endpoint: str, vdaf: dict,
+                                    time_precision: int) -> bool:
+        "See `ClientContainer.supports_batch_upload()`."
+        cached = ClientContainer.cached_batch_upload_support(
+            self.original_image)
+        if cached is not None:
+            return cached
+
+        try:
+            await self.make_request(
+                "internal/test/upload_batch",
+                upload_batch_request_body(task_id, leader_endpoint,
+                                          helper_endpoint, vdaf, [], None,
+                                          time_precision))
+            supported = True
+        except Exception as e:
+            if not endpoint_not_implemented(e):
+                return False
+            supported = False
+        ClientContainer.record_batch_upload_support(self.original_image,
+                                                    supported)
+        return supported
+
+    async def upload_batch(self, task_id: bytes, leader_endpoint: str,
+                           helper_endpoint: str, vdaf: dict,
+                           measurements: List[Union[str, List[str]]],
+                           time: Union[int, None], time_precision: int):
+        await self.make_request(
+            "internal/test/upload_batch",
+            upload_batch_request_body(task_id, leader_endpoint,
+                                      helper_endpoint, vdaf, measurements,
+                                      time, time_precision))
+
+
+class AsyncAggregatorContainer(AsyncDAPContainer):
+    async def endpoint_for_task(self, task_id: bytes, role: str) -> str:
+        response_body = await self.make_request(
+            "internal/test/endpoint_for_task",
+            endpoint_for_task_request_body(task_id, role,
+                                           self.container.container_name()))
+        raw_endpoint = response_body["endpoint"]
+        return urljoin(self.container_base_url(), raw_endpoint)
+
+    async def add_task(self, task_id: bytes, role: str,
+                       leader_endpoint: str, helper_endpoint: str,
+                       vdaf: dict, leader_token: str,
+                       collector_token: Union[str, None],
+                       vdaf_verify_key: bytes, max_batch_query_count: int,
+                       min_batch_size: int, time_precision: int,
+                       collector_hpke_config_base64: str,
+                       task_expiration: int, query_type: QueryType):
+        await self.make_request(
+            "internal/test/add_task",
+            aggregator_add_task_request_body(
+                task_id, role, leader_endpoint, helper_endpoint, vdaf,
+                leader_token, collector_token, vdaf_verify_key,
+                max_batch_query_count, min_batch_size, time_precision,
+                collector_hpke_config_base64, task_expiration, query_type))
+
+
+class AsyncCollectorContainer(AsyncDAPContainer):
+    async def add_task(self, task_id: bytes, leader_endpoint: str,
+                       vdaf: dict, auth_token: str,
+                       query_type: QueryType) -> str:
+        response_body = await self.make_request(
+            "internal/test/add_task",
+            collector_add_task_request_body(task_id, leader_endpoint, vdaf,
+                                            auth_token, query_type))
+        return response_body["collector_hpke_config"]
+
+    async def collection_start(self, task_id: bytes,
+                               _aggregation_param: None,
+                               query: Query) -> str:
+        response_body = await self.make_request(
+            "internal/test/collection_start",
+            collection_start_request_body(task_id, query))
+        return response_body["handle"]
+
+    async def collection_poll(self, handle: str
+                              ) -> Union[str, List[str], None]:
+        response_body = await self.make_request(
+            "internal/test/collection_poll", {"handle": handle})
+        return collection_poll_result(response_body)
@@ -0,0 +1,234 @@
+"""
+Load benchmarks of DAP implementations, run with `python -m runner benchmark`.
+
+For each combination of images, one set of containers is started, and then
+each iteration provisions new tasks, uploads reports to them, and collects
+them. Results are written as one JSON object per line, per image set.
+"""
+import argparse
+import dataclasses
+import json
+import math
+import sys
+import traceback
+from typing import Dict, List, Optional, Sequence
+
+from . import provision_task, upload_and_collect
+from .cli import (
+    add_image_arguments, add_measurement_arguments, add_upload_arguments,
+    add_verbose_argument,
+    check_positive, configure_logging, docker_client, docker_host_address,
+    load_image_sets, run_options,
+)
+from .containers import LOCAL_ADDRESS
+from .images import ImagePuller, image_set_images
+from .models import ImageSet, RunOptions, TestCase
+from .networks import cleanup_orphaned_networks
+from .pool import ContainerSet
+from .test_cases import TEST_CASES
+
+
+@dataclasses.dataclass
+class IterationResult:
+    # Number of reports uploaded per second, across all tasks.
+    uploads_per_second: float
+    # Time in seconds spent generating or reading measurements while
+    # uploading, across all tasks. This is included in the upload time used
+    # for `uploads_per_second`, unless it overlapped with uploads.
+    generation_seconds: float
+    # Duration in seconds of each upload request.
+    upload_latencies: List[float]
+    # Time in seconds from starting each collection to receiving its result.
+    collection_latencies: List[float]
+
+
+def percentile(values: Sequence[float], fraction: float) -> Optional[float]:
+    """
+    Compute a percentile of the given values, interpolating linearly between
+    the closest ranks. Returns None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = fraction * (len(ordered) - 1)
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def latency_summary(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+def run_iteration(container_set: ContainerSet, test_case: TestCase,
+                  collections: int, options: RunOptions) -> IterationResult:
+    """
+    Provision `collections` tasks one after another. Upload the test case's
+    measurements to each, and collect each task's result once.
+    """
+    upload_latencies: List[float] = []
+    collection_latencies = []
+    upload_time = 0.0
+    upload_count = 0
+    generation_time = 0.0
+    for _ in range(collections):
+        task = provision_task(container_set.client, container_set.leader,
+                              container_set.helper, container_set.collector,
+                              test_case, options)
+        metrics = upload_and_collect(container_set.client,
+                                     container_set.collector, task, test_case,
+                                     options, upload_latencies)
+        upload_time += metrics.upload_time
+        upload_count += metrics.upload_count
+        generation_time += metrics.generation_time
+        collection_latencies.append(metrics.collection_latency)
+
+    return IterationResult(
+        uploads_per_second=upload_count / upload_time,
+        generation_seconds=generation_time,
+        upload_latencies=upload_latencies,
+        collection_latencies=collection_latencies,
+    )
+
+
+def benchmark_image_set(client, image_set: ImageSet, test_case: TestCase,
+                        collections: int, iterations: int, warmup: int,
+                        options: RunOptions,
+                        host_address: str = LOCAL_ADDRESS) -> dict:
+    container_set = ContainerSet(client, image_set, options,
+                                 host_address=host_address)
+    try:
+        results = []
+        for iteration in range(warmup + iterations):
+            result = run_iteration(container_set, test_case, collections,
+                                   options)
+            if iteration >= warmup:
+                results.append(result)
+    finally:
+        container_set.close()
+
+    throughputs = [result.uploads_per_second for result in results]
+    return {
+        "uploads_per_second": {
+            "mean": sum(throughputs) / len(throughputs),
+            "min": min(throughputs),
+            "max": max(throughputs),
+        },
+        "generation_seconds": sum(result.generation_seconds
+                                  for result in results),
+        "upload_latency": latency_summary([
+            latency
+            for result in results
+            for latency in result.upload_latencies
+        ]),
+        "collection_latency": latency_summary([
+            latency
+            for result in results
+            for latency in result.collection_latencies
+        ]),
+        "iterations": [
+            {
+                "uploads_per_second": result.uploads_per_second,
+                "generation_seconds": result.generation_seconds,
+                "upload_latency": latency_summary(result.upload_latencies),
+                "collection_latency": latency_summary(
+                    result.collection_latencies),
+            }
+            for result in results
+        ],
+    }
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="python -m runner benchmark",
+        description="Load benchmark for DAP implementations. Results are "
+        "written to standard output as one JSON object per image set.")
+    add_image_arguments(parser)
+    parser.add_argument("--test-case", default="time_prio3_count_small",
+                        help="Name of the test case whose VDAF and query "
+                        "type are used. Defaults to time_prio3_count_small.")
+    parser.add_argument("--uploads", type=int, default=1000,
+                        help="Number of reports uploaded to each task, "
+                        "rounded down to a whole number of the test case's "
+                        "batches. Defaults to 1000.")
+    parser.add_argument("--collections", type=int, default=1,
+                        help="Number of tasks provisioned and collected in "
+                        "each iteration. Defaults to 1.")
+    parser.add_argument("--iterations", type=int, default=5,
+                        help="Number of measured iterations. Defaults to 5.")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Number of iterations to run before measuring. "
+                        "Defaults to 1.")
+    add_upload_arguments(parser)
+    add_measurement_arguments(parser)
+    add_verbose_argument(parser)
+    args = parser.parse_args(argv)
+
+    configure_logging(args.verbose)
+
+    check_positive(args.uploads, "--uploads")
+    check_positive(args.collections, "--collections")
+    check_positive(args.iterations, "--iterations")
+    check_positive(args.upload_concurrency, "--upload-concurrency")
+    check_positive(args.upload_batch_size, "--upload-batch-size")
+    check_positive(args.pull_jobs, "--pull-jobs")
+    if args.warmup < 0:
+        print("--warmup must not be negative", file=sys.stderr)
+        sys.exit(2)
+
+    for test_case in TEST_CASES:
+        if test_case.name == args.test_case:
+            break
+    else:
+        print(f"Unknown test case {args.test_case}", file=sys.stderr)
+        sys.exit(2)
+    test_case = test_case.with_measurement_count(args.uploads)
+
+    client = docker_client(args)
+    cleanup_orphaned_networks(client)
+
+    image_sets, _, readiness_timeouts = load_image_sets(args)
+    options = run_options(args, readiness_timeouts)
+
+    if args.pull:
+        puller = ImagePuller(client, args.pull_jobs, args.pull_cache)
+        try:
+            images = sorted({image for image_set in image_sets
+                             for image in image_set_images(image_set)})
+            puller.pull(images)
+            puller.wait(images)
+        finally:
+            puller.close()
+
+    any_error = False
+    for image_set in image_sets:
+        record: dict = {
+            "client": image_set.client,
+            "leader": image_set.leader,
+            "helper": image_set.helper,
+            "collector": image_set.collector,
+            "test_case": test_case.name,
+            "uploads": test_case.measurement_count,
+            "collections": args.collections,
+            "upload_concurrency": options.upload_concurrency,
+            "upload_batch_size": options.upload_batch_size,
+        }
+        try:
+            record.update(benchmark_image_set(
+                client, image_set, test_case, args.collections,
+                args.iterations, args.warmup, options,
+                docker_host_address(args),
+            ))
+        except Exception as e:
+            traceback.print_exc()
+            record["error"] = str(e)
+            any_error = True
+        print(json.dumps(record), flush=True)
+
+    if any_error:
+        sys.exit(1)
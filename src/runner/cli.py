@@ -0,0 +1,211 @@
+"""Command line arguments shared by the test runner and its subcommands."""
+import argparse
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import tomllib  # type: ignore
+except ModuleNotFoundError:
+    import tomli as tomllib  # type: ignore
+
+import docker  # type: ignore
+
+from .containers import LOCAL_ADDRESS
+from .fake import FAKE_IMAGE_SET, FakeDockerClient
+from .images import DEFAULT_PULL_JOBS
+from .matrix import FULL, STRATEGIES, ImageLists, select_image_sets
+from .models import ImageSet, RunOptions
+
+
+def add_image_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--image-lists", default="images.toml",
+                        help="TOML file with lists of container images. "
+                        "Tests are run with combinations of images from "
+                        "these lists, chosen by --matrix. Defaults to "
+                        "`images.toml`.")
+    parser.add_argument("--matrix", choices=STRATEGIES, default=FULL,
+                        help="Which combinations of images from the image "
+                        "lists to test. `full` tests every combination. "
+                        "`pairwise` tests each pair of client and leader, "
+                        "client and helper, leader and helper, and leader "
+                        "and collector images together at least once. "
+                        "`leader-helper` tests each pair of leader and "
+                        "helper images, and each client and collector image "
+                        "at least once. Defaults to full.")
+    parser.add_argument("--client", help="Client container image")
+    parser.add_argument("--leader", help="Leader container image")
+    parser.add_argument("--helper", help="Helper container image")
+    parser.add_argument("--collector", help="Collector container image")
+    parser.add_argument("--pull", action="store_true",
+                        help="Pull updated container images. Images are "
+                        "pulled in the background, and each test case waits "
+                        "only for its own images.")
+    parser.add_argument("--pull-jobs", type=int, default=DEFAULT_PULL_JOBS,
+                        help="Number of images to pull concurrently. "
+                        f"Defaults to {DEFAULT_PULL_JOBS}.")
+    parser.add_argument("--pull-cache", default=".image-digests.json",
+                        help="File recording the registry digest each image "
+                        "was last pulled at, so that unchanged images are "
+                        "not pulled again. Defaults to "
+                        "`.image-digests.json`.")
+    parser.add_argument("--fake", action="store_true",
+                        help="Run in-process fake implementations instead of "
+                        "Docker containers, to test the harness itself. "
+                        "Unless images are given explicitly, the fake "
+                        "client, aggregator, and collector images are used.")
+    parser.add_argument("--fake-latency", type=float, default=0.0,
+                        help="With --fake, delay each interop API request by "
+                        "this many seconds. Defaults to 0.")
+    parser.add_argument("--readiness-timeout", type=float, default=120.0,
+                        help="Number of seconds to wait for each container "
+                        "to become ready. This may be overridden for "
+                        "individual images in the `readiness_timeout` table "
+                        "of the image lists file. Defaults to 120.")
+
+
+def add_upload_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--upload-concurrency", type=int, default=1,
+                        help="Number of report uploads to send concurrently "
+                        "within each test case. Defaults to 1.")
+    parser.add_argument("--upload-batch-size", type=int, default=100,
+                        help="Maximum number of reports to send in each "
+                        "upload request, for clients that support batch "
+                        "uploads. Set to 1 to disable batching. Defaults to "
+                        "100.")
+    parser.add_argument("--async-uploads", action="store_true",
+                        help="Send report uploads from an asyncio event "
+                        "loop, rather than from a thread per concurrent "
+                        "upload.")
+
+
+def add_measurement_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--seed", type=int,
+                        help="Generate measurements from this seed, so that "
+                        "each test case uploads the same measurements on "
+                        "every run. By default, measurements are random.")
+    parser.add_argument("--corpus-dir", metavar="DIRECTORY",
+                        help="Store each test case's measurements in "
+                        "DIRECTORY the first time they are generated, and "
+                        "reuse them on later runs with the same seed. If "
+                        "--seed is not given, a seed of 0 is used.")
+
+
+def add_verbose_argument(parser: argparse.ArgumentParser):
+    parser.add_argument("-v", "--verbose", action="count", help="Verbosity "
+                        "level. This may be specified up to three times.")
+
+
+def configure_logging(verbose):
+    logging.basicConfig()
+    if not verbose:
+        logging.getLogger().setLevel(logging.ERROR)
+    elif verbose == 1:
+        logging.getLogger().setLevel(logging.WARNING)
+    elif verbose == 2:
+        logging.getLogger().setLevel(logging.INFO)
+    else:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+
+def check_positive(value: int, flag: str):
+    if value < 1:
+        print(f"{flag} must be at least 1", file=sys.stderr)
+        sys.exit(2)
+
+
+def load_image_sets(args: argparse.Namespace
+                    ) -> Tuple[List[ImageSet], ImageLists, Dict[str, float]]:
+    """
+    Determine which combinations of images to test, either from the
+    `--client`, `--leader`, `--helper`, and `--collector` arguments, or from
+    the image lists file, using the strategy chosen with `--matrix`. Returns
+    the list of image sets, the lists of images for each role, and the
+    per-image readiness timeouts from the image lists file.
+    """
+    readiness_timeouts: Dict[str, float] = {}
+    if args.fake and not (args.client or args.leader or args.helper or
+                          args.collector):
+        lists = ImageLists([FAKE_IMAGE_SET.client], [FAKE_IMAGE_SET.leader],
+                           [FAKE_IMAGE_SET.helper],
+                           [FAKE_IMAGE_SET.collector])
+    elif args.client or args.leader or args.helper or args.collector:
+        if (not args.client or not args.leader or not args.helper or
+                not args.collector):
+            print("Either all or none of --client, --leader, --helper, and "
+                  "--collector must be provided", file=sys.stderr)
+            sys.exit(2)
+        lists = ImageLists([args.client], [args.leader], [args.helper],
+                           [args.collector])
+    else:
+        with open(args.image_lists, "rb") as f:
+            images_dict = tomllib.load(f)
+        readiness_timeouts = images_dict.get("readiness_timeout", {})
+        lists = ImageLists(
+            images_dict["client"],
+            images_dict["leader"],
+            images_dict["helper"],
+            images_dict["collector"],
+        )
+    return (select_image_sets(lists, args.matrix), lists,
+            readiness_timeouts)
+
+
+def docker_client(args: argparse.Namespace, base_url: Optional[str] = None):
+    """
+    Connect to Docker, or create a fake Docker client if `--fake` was given.
+    The Docker daemon is found from the environment, unless `base_url` is
+    given.
+    """
+    if args.fake:
+        return FakeDockerClient(args.fake_latency)
+    if base_url is not None:
+        client = docker.DockerClient(base_url=base_url)
+    else:
+        client = docker.from_env()
+    client.ping()
+    return client
+
+
+def docker_host_address(args: argparse.Namespace,
+                        url: Optional[str] = None) -> str:
+    """
+    Work out the address at which ports published by a Docker daemon can be
+    reached, from its URL, or from the environment if `url` is not given.
+    This is the daemon's host name for `tcp://` and `ssh://` URLs, and the
+    loopback address for local daemons and the fake backend.
+    """
+    if url is None:
+        url = os.environ.get("DOCKER_HOST")
+    if args.fake or not url:
+        return LOCAL_ADDRESS
+    parts = urlsplit(url)
+    if parts.scheme in ("tcp", "http", "https", "ssh") and parts.hostname:
+        return parts.hostname
+    return LOCAL_ADDRESS
+
+
+def parse_docker_host(value: str) -> Tuple[str, Optional[int]]:
+    """
+    Parse a `--docker-host` argument, of the form URL or URL=SLOTS, into the
+    URL and the number of slots, if given.
+    """
+    url, separator, slots = value.rpartition("=")
+    if separator and slots.isdigit() and int(slots) > 0:
+        return url, int(slots)
+    return value, None
+
+
+def run_options(args: argparse.Namespace,
+                readiness_timeouts: Dict[str, float]) -> RunOptions:
+    return RunOptions(
+        upload_concurrency=args.upload_concurrency,
+        upload_batch_size=args.upload_batch_size,
+        async_uploads=args.async_uploads,
+        readiness_timeout=args.readiness_timeout,
+        readiness_timeouts=readiness_timeouts,
+        seed=args.seed,
+        corpus_directory=args.corpus_dir,
+    )
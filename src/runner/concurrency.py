@@ -0,0 +1,81 @@
+import concurrent.futures
+from typing import (
+    Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar,
+)
+
+T = TypeVar("T")
+
+
+def run_concurrently(functions: Sequence[Callable[[], T]],
+                     on_success: Optional[Callable[[T], Any]] = None
+                     ) -> List[T]:
+    """
+    Call each function on its own thread, and return their results in order.
+    All functions are run to completion, even if some of them fail. Then,
+    `on_success` is called with each successful result, in order, before the
+    first exception (if any) is re-raised. This allows resources acquired by
+    the successful calls to be cleaned up after a partial failure.
+    """
+    with concurrent.futures.ThreadPoolExecutor(len(functions)) as executor:
+        futures = [executor.submit(function) for function in functions]
+        concurrent.futures.wait(futures)
+    if on_success is not None:
+        for future in futures:
+            if future.exception() is None:
+                on_success(future.result())
+    return [future.result() for future in futures]
+
+
+def run_graph(steps: Dict[str, Tuple[Sequence[str],
+                                     Callable[[Dict[str, Any]], Any]]]
+              ) -> Dict[str, Any]:
+    """
+    Run a set of interdependent steps, each as soon as the steps it depends
+    on have completed. Steps are given as a dictionary mapping each step's
+    name to a tuple of the names of its dependencies, and a function. The
+    function is called with a dictionary of the results of all steps that
+    have completed so far, and its return value becomes the step's result.
+    Returns a dictionary of all steps' results.
+
+    If a step fails, no further steps are started, and the first exception is
+    re-raised once all running steps have finished.
+    """
+    for name, (dependencies, _function) in steps.items():
+        for dependency in dependencies:
+            if dependency not in steps:
+                raise ValueError(
+                    f"Step {name} depends on unknown step {dependency}")
+
+    results: Dict[str, Any] = {}
+    remaining = dict(steps)
+    running: Dict[concurrent.futures.Future, str] = {}
+    error: Optional[BaseException] = None
+    with concurrent.futures.ThreadPoolExecutor(len(steps) or 1) as executor:
+        while True:
+            if error is None:
+                for name, (dependencies, function) in list(remaining.items()):
+                    if all(dependency in results
+                           for dependency in dependencies):
+                        del remaining[name]
+                        future = executor.submit(function, dict(results))
+                        running[future] = name
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(
+                running,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    if error is None:
+                        error = future.exception()
+                else:
+                    results[name] = future.result()
+
+    if error is not None:
+        raise error
+    if remaining:
+        raise ValueError(
+            f"Dependency cycle among steps: {', '.join(sorted(remaining))}")
+    return results
@@ -1,17 +1,74 @@
 import base64
 import contextlib
+from dataclasses import dataclass
+import datetime
+import gzip
 import io
+import itertools
+import json
 import os
-import shutil
+import threading
+import time
 from urllib.parse import urljoin
 import tarfile
-from typing import List, Union
+from typing import (
+    BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union,
+)
 
 import docker  # type: ignore
 import requests
 import requests.adapters
 
+from runner.logbuffer import (
+    DEFAULT_MEMORY_LIMIT, DEFAULT_SPILL_LIMIT, LogBuffer, LogStreamer,
+)
 from runner.models import Query, QueryType
+from runner.networks import owner_labels
+from runner.polling import Backoff, Deadline
+from runner.tracing import span
+
+# Default time in seconds to wait for a container's interop API to become
+# ready.
+DEFAULT_READINESS_TIMEOUT = 120.0
+
+# Maximum number of bytes of log output saved from each container when a
+# test fails, separately for its /logs directory and its process output.
+DEFAULT_LOG_SIZE_LIMIT = 64 * 1024 * 1024
+
+# Compression level for saved logs. Log output compresses well even at low
+# levels, and capture should not take long.
+LOG_COMPRESSION_LEVEL = 6
+
+# Name of the file added to a logs archive when files were truncated.
+TRUNCATED_LOGS_NOTE = "TRUNCATED.txt"
+
+# Size of the chunks in which files are read when streaming them into a
+# container.
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Minimum time in seconds between checks of a container's state while
+# waiting for it to become ready.
+STATE_CHECK_INTERVAL = 1.0
+
+# Default time in seconds to wait for a response to an interop API request.
+DEFAULT_REQUEST_TIMEOUT = 300.0
+
+# Address at which ports published by a local Docker daemon are reached.
+LOCAL_ADDRESS = "127.0.0.1"
+
+
+# Status codes meaning that an optional interop API endpoint is not
+# implemented.
+NOT_IMPLEMENTED_STATUSES = (404, 405, 501)
+
+
+class BadStatusError(Exception):
+    "An interop API request that failed with an HTTP error status."
+
+    def __init__(self, image: str, path: str, status_code: int, text: str):
+        self.status_code = status_code
+        super().__init__(f"Bad status code {status_code} from {image} upon "
+                         f"{path} request: {text}")
 
 
 class InteropAPIError(Exception):
@@ -25,41 +82,139 @@ class InteropAPIError(Exception):
 
 
 class GeneratorStreamAdapter(io.RawIOBase):
+    """
+    A readable stream over the byte strings produced by a generator, such as
+    the archive stream returned by Docker. Chunks are read through a
+    memoryview, so reading a large chunk through a small buffer does not copy
+    the rest of the chunk on each read.
+    """
+
     def __init__(self, gen):
         self.gen = gen
-        self.remainder = b""
+        self._chunk = memoryview(b"")
+        self._offset = 0
 
     def readable(self):
         return True
 
-    def readinto(self, buffer):
-        if self.remainder:
-            chunk = self.remainder
-        else:
+    def _next_chunk(self) -> bool:
+        "Advance to the next non-empty chunk. Returns False at the end."
+        while self._offset >= len(self._chunk):
             try:
                 chunk = next(self.gen)
             except StopIteration:
-                return 0
+                return False
+            self._chunk = memoryview(chunk).cast("B")
+            self._offset = 0
+        return True
 
-        if len(chunk) <= len(buffer):
-            length = len(chunk)
-            buffer[:length] = chunk
-            self.remainder = b""
-            return length
-        else:
-            length = len(buffer)
-            buffer[:length] = chunk[:length]
-            self.remainder = chunk[length:]
-            return length
+    def readinto(self, buffer):
+        if not self._next_chunk():
+            return 0
+        with memoryview(buffer) as view, view.cast("B") as destination:
+            length = min(len(destination), len(self._chunk) - self._offset)
+            destination[:length] = \
+                self._chunk[self._offset:self._offset + length]
+        self._offset += length
+        return length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        if not self._next_chunk():
+            return b""
+        # Return the rest of the current chunk, or as much of it as was
+        # asked for, with a single copy.
+        length = min(size, len(self._chunk) - self._offset)
+        data = self._chunk[self._offset:self._offset + length].tobytes()
+        self._offset += length
+        return data
+
+
+def iter_stream(stream: BinaryIO, chunk_size: int = io.DEFAULT_BUFFER_SIZE
+                ) -> Iterator[bytes]:
+    "Read a stream as an iterator of byte strings, until the end."
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def tar_stream(files: Iterable[Tuple[str, str]],
+               chunk_size: int = ARCHIVE_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Generate a tar archive containing local files, given as pairs of the
+    name in the archive and the local path. The archive is produced lazily,
+    reading each file in chunks, so it may be streamed to Docker without
+    holding whole files in memory.
+    """
+    for name, path in files:
+        with open(path, "rb") as f:
+            info = tarfile.TarInfo(name)
+            stat = os.fstat(f.fileno())
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = stat.st_mode & 0o777
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            written = 0
+            for chunk in iter_stream(f, chunk_size):
+                # Stop at the size in the header, even if the file grew.
+                chunk = chunk[:info.size - written]
+                written += len(chunk)
+                yield chunk
+                if written == info.size:
+                    break
+            if written < info.size:
+                raise Exception(f"{path} was truncated while archiving")
+            if info.size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE -
+                                     info.size % tarfile.BLOCKSIZE)
+    # An archive ends with two empty blocks.
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+@dataclass(frozen=True)
+class ConnectionStats:
+    "Counts of HTTP connections opened and reused by a container's session."
+    opened: int
+    reused: int
 
 
 class DAPContainer:
-    def __init__(self, container, image):
+    def __init__(self, container, image,
+                 pool_size: int = requests.adapters.DEFAULT_POOLSIZE,
+                 host_address: str = LOCAL_ADDRESS):
         # Save the original image and tag for use in user-facing output. The
         # docker library will include other tags which point to the same image
         # when round-tripping through the Image class.
         self.original_image = image
         self._container = container
+        # Address of the Docker host, at which the container's ports are
+        # published.
+        self.host_address = host_address
+        self._host_base_url: Optional[str] = None
+        self._created_at = time.monotonic()
+        # Arguments added to trace spans for requests to this container.
+        self.trace_tags: Dict[str, str] = {}
+        # Seconds to wait for a response to each interop API request, so that
+        # a request to a host that has dropped off the network fails rather
+        # than blocking forever.
+        self.request_timeout = DEFAULT_REQUEST_TIMEOUT
+        # Seconds between creating this object and the container first
+        # becoming ready, once known.
+        self.startup_time: Optional[float] = None
+        self._log_streamer: Optional[LogStreamer] = None
+
+        # Keep connections to the interop API alive between requests. The
+        # connection pool should be at least as large as the number of
+        # concurrent requests made to this container.
+        self._adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", self._adapter)
 
     def port(self) -> str:
         if not self._container.attrs["NetworkSettings"]["Ports"]:
@@ -72,87 +227,247 @@ class DAPContainer:
             raise Exception(f"Could not find forwarded port: {fwds}")
 
     def host_base_url(self) -> str:
-        return f"http://127.0.0.1:{self.port()}/"
+        # The forwarded port does not change for the lifetime of the
+        # container, so only inspect the container once.
+        if self._host_base_url is None:
+            host = self.host_address
+            if ":" in host:
+                # IPv6 addresses must be enclosed in brackets in URLs.
+                host = f"[{host}]"
+            self._host_base_url = f"http://{host}:{self.port()}/"
+        return self._host_base_url
+
+    def container_name(self) -> str:
+        return self._container.name
 
     def container_base_url(self) -> str:
-        return f"http://{self._container.name}:8080/"
+        return f"http://{self.container_name()}:8080/"
 
     def make_request(self, path: str, body: dict) -> dict:
         url = self.host_base_url() + path
-        response = requests.post(url, json=body)
-        if response.status_code != 200:
-            raise Exception(
-                f"Bad status code {response.status_code} from "
-                f"{self.original_image} upon {path} request: "
-                f"{response.text}"
-            )
-        response_body = response.json()
-        if response_body["status"] in ("success", "complete", "in progress"):
-            return response_body
-        else:
-            error_message = response_body.get("error", "")
-            raise InteropAPIError(
-                self.original_image,
-                path,
-                error_message,
-            )
+        with span(path, image=self.original_image,
+                  task_id=body.get("task_id"), **self.trace_tags):
+            response = self._session.post(url, json=body,
+                                          timeout=self.request_timeout)
+        return parse_response(self.original_image, path,
+                              response.status_code, response.content)
+
+    def connection_stats(self) -> ConnectionStats:
+        opened = 0
+        requests_sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+        return ConnectionStats(opened, requests_sent - opened)
+
+    def close(self):
+        self._session.close()
+
+    def start_log_stream(self, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                         spill_limit: int = DEFAULT_SPILL_LIMIT):
+        """
+        Start streaming the container's process output into a bounded buffer
+        in the background, so that `save_process_logs()` need not fetch it
+        from Docker.
+        """
+        self._log_streamer = LogStreamer(
+            self._container, LogBuffer(memory_limit, spill_limit),
+            self._container.name)
+
+    def remove(self):
+        "Close this object's connections, and remove the container."
+        with span("remove_container", image=self.original_image,
+                  container=self._container.name):
+            try:
+                self.close()
+            finally:
+                try:
+                    self._container.remove(force=True)
+                finally:
+                    if self._log_streamer is not None:
+                        self._log_streamer.stop()
+                        self._log_streamer.buffer.close()
+
+    def wait_for_ready(self,
+                       timeout: float = DEFAULT_READINESS_TIMEOUT) -> float:
+        """
+        Wait until the container's interop API responds to
+        `/internal/test/ready`, probing it at short intervals. Returns the
+        number of seconds from when this object was created until the
+        container first became ready. Fails early if Docker reports that the
+        container has exited or is unhealthy.
+        """
+        if self.startup_time is not None:
+            return self.startup_time
 
-    def wait_for_ready(self):
-        session = requests.Session()
-        session.mount(
-            "http://",
-            requests.adapters.HTTPAdapter(
-                max_retries=requests.adapters.Retry(
-                    total=10,
-                    allowed_methods=["POST"],
-                    backoff_factor=0.5,
-                ),
-            ),
-        )
         url = f"{self.host_base_url()}internal/test/ready"
-        response = session.post(url)
-        if response.status_code == 200:
-            return
-        else:
+        deadline = Deadline(timeout)
+        backoff = Backoff(initial=0.02, maximum=0.25)
+        next_state_check = time.monotonic() + STATE_CHECK_INTERVAL
+        while True:
+            try:
+                response = self._session.post(
+                    url, timeout=max(deadline.remaining(), 1.0))
+            except requests.exceptions.ConnectionError as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    self.startup_time = time.monotonic() - self._created_at
+                    return self.startup_time
+                raise Exception(
+                    f"Container {self.original_image} replied to "
+                    "/internal/test/ready with a status code of "
+                    f"{response.status_code}"
+                )
+
+            if deadline.expired():
+                raise Exception(
+                    f"Container {self.original_image} did not become ready "
+                    f"within {timeout} seconds: {error}"
+                )
+            if time.monotonic() >= next_state_check:
+                self._check_state()
+                next_state_check = time.monotonic() + STATE_CHECK_INTERVAL
+            deadline.sleep(backoff.next_delay())
+
+    def _check_state(self):
+        "Raise an exception if the container has stopped or is unhealthy."
+        self._container.reload()
+        state = self._container.attrs["State"]
+        if state["Status"] in ("exited", "dead"):
             raise Exception(
-                f"Container {self._container.image.tags} replied to "
-                "/internal/test/ready with a status code of "
-                f"{response.status_code}"
+                f"Container {self.original_image} exited with code "
+                f"{state.get('ExitCode')} before becoming ready"
+            )
+        health = state.get("Health")
+        if health is not None and health["Status"] == "unhealthy":
+            raise Exception(
+                f"Container {self.original_image} is unhealthy"
             )
 
-    def copy_logs_directory(self, directory: str):
+    def save_logs_archive(self, path: str,
+                          max_bytes: int = DEFAULT_LOG_SIZE_LIMIT):
+        """
+        Save the contents of the container's /logs directory to a gzipped tar
+        file at `path`. The archive is streamed from Docker and recompressed
+        without being extracted. Once `max_bytes` of file contents have been
+        saved, the remaining files are truncated or left out, and a file
+        named TRUNCATED_LOGS_NOTE is added describing what was dropped.
+        """
         gen, _stat_info = self._container.get_archive("/logs")
+        # Streaming mode reads whole records from the adapter, so no further
+        # buffering is needed.
         stream = GeneratorStreamAdapter(gen)
-        buffered_stream = io.BufferedReader(stream)
-        with tarfile.open(fileobj=buffered_stream, mode="r|") as tf:
-            for entry in tf:
+        remaining = max_bytes
+        dropped = []
+        with tarfile.open(fileobj=stream, mode="r|") as source, \
+                tarfile.open(path, mode="w:gz",
+                             compresslevel=LOG_COMPRESSION_LEVEL) as archive:
+            for entry in source:
                 assert not os.path.isabs(entry.name)
                 assert ".." not in entry.name
                 if entry.type == tarfile.REGTYPE:
-                    extract_file = tf.extractfile(entry)
+                    extract_file = source.extractfile(entry)
                     # This shouldn't be None, we checked type == REGTYPE.
                     assert extract_file is not None
+                    if entry.size > remaining:
+                        dropped.append(
+                            f"{entry.name}: saved {remaining} of "
+                            f"{entry.size} bytes")
+                        entry.size = remaining
+                    remaining -= entry.size
+                    # This copies exactly entry.size bytes.
+                    archive.addfile(entry, extract_file)
+                elif entry.type == tarfile.DIRTYPE:
+                    archive.addfile(entry)
+            if dropped:
+                note = (f"Files were truncated after {max_bytes} bytes in "
+                        "total.\n" + "\n".join(dropped) + "\n").encode()
+                info = tarfile.TarInfo(TRUNCATED_LOGS_NOTE)
+                info.size = len(note)
+                info.mtime = int(time.time())
+                archive.addfile(info, io.BytesIO(note))
+
+    def put_files(self, directory: str, files: Iterable[Tuple[str, str]]):
+        """
+        Copy local files into `directory` in the container. Files are given
+        as pairs of the path relative to `directory`, and the local path.
+        They are streamed to Docker as a tar archive, without building the
+        archive in memory or on disk.
+        """
+        with span("put_files", image=self.original_image,
+                  directory=directory):
+            if not self._container.put_archive(directory, tar_stream(files)):
+                raise Exception(f"Could not copy files into {directory} in "
+                                f"{self.original_image} container")
+
+    def save_process_logs(self, path: str,
+                          since: Optional[datetime.datetime] = None,
+                          max_bytes: int = DEFAULT_LOG_SIZE_LIMIT):
+        """
+        Save stdout and stderr output from the container, combined together,
+        to a gzipped file at `path`, optionally starting from a given time.
+        If the output is being streamed in the background, it is saved from
+        the log buffer, with output left out from the middle if it exceeds
+        `max_bytes` bytes. Otherwise, it is fetched from Docker, and output
+        after the first `max_bytes` bytes is left out.
+        """
+        if self._log_streamer is not None:
+            with gzip.open(path, "wb",
+                           compresslevel=LOG_COMPRESSION_LEVEL) as f:
+                written = self._log_streamer.buffer.write_to(
+                    f, since.timestamp() if since is not None else None,
+                    max_bytes)
+            # Only keep the file if the log output is non-empty.
+            if not written:
+                os.unlink(path)
+            return
 
-                    name = entry.name
-                    if name.startswith("logs/"):
-                        name = name[5:]
-                    destination = os.path.join(directory, name)
-                    os.makedirs(os.path.dirname(destination), exist_ok=True)
-                    with open(destination, "wb") as dest_file:
-                        shutil.copyfileobj(extract_file, dest_file)
-
-    def save_process_logs(self, path: str):
-        # Get stdout and stderr output from the container, combined together.
-        gen = self._container.logs(stream=True, follow=False)
+        gen = self._container.logs(stream=True, follow=False, since=since)
 
         # Write this out to a file at the given path, only lazily creating
         # the file if the log output is non-empty.
         first_chunk = next(gen, None)
-        if first_chunk is not None:
-            with open(path, "wb") as f:
-                f.write(first_chunk)
-                for chunk in gen:
-                    f.write(chunk)
+        if first_chunk is None:
+            return
+        remaining = max_bytes
+        with gzip.open(path, "wb", compresslevel=LOG_COMPRESSION_LEVEL) as f:
+            for chunk in itertools.chain([first_chunk], gen):
+                if len(chunk) > remaining:
+                    f.write(chunk[:remaining])
+                    f.write(f"\n[Truncated after {max_bytes} bytes]\n"
+                            .encode())
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+
+
+def parse_response(image: str, path: str, status_code: int,
+                   content: bytes) -> dict:
+    """
+    Decode the body of a response from an interop API request, raising an
+    exception if the request failed.
+    """
+    if status_code != 200:
+        raise BadStatusError(image, path, status_code,
+                             content.decode(errors="replace"))
+    response_body = json.loads(content)
+    if response_body["status"] in ("success", "complete", "in progress"):
+        return response_body
+    else:
+        error_message = response_body.get("error", "")
+        raise InteropAPIError(image, path, error_message)
+
+
+def endpoint_not_implemented(error: Exception) -> bool:
+    """
+    Whether an error from an interop API request means that the endpoint is
+    not implemented, rather than that this particular request failed.
+    """
+    return (isinstance(error, BadStatusError) and
+            error.status_code in NOT_IMPLEMENTED_STATUSES)
 
 
 def encode_base64url(data: bytes) -> str:
@@ -162,33 +477,183 @@ def encode_base64url(data: bytes) -> str:
     return base64.b64encode(data, b"-_").rstrip(b"=").decode("ASCII")
 
 
+# Builders for the bodies of interop API requests, shared by the blocking
+# containers below and their asyncio counterparts in `async_containers`.
+
+
+def upload_request_body(task_id: bytes, leader_endpoint: str,
+                        helper_endpoint: str, vdaf: dict,
+                        measurement: Union[str, List[str]],
+                        time: Union[int, None], time_precision: int) -> dict:
+    request_body = {
+        "task_id": encode_base64url(task_id),
+        "leader": leader_endpoint,
+        "helper": helper_endpoint,
+        "vdaf": vdaf,
+        "measurement": measurement,
+        "time_precision": time_precision,
+    }
+    if time is not None:
+        request_body["time"] = time
+    return request_body
+
+
+def upload_batch_request_body(task_id: bytes, leader_endpoint: str,
+                              helper_endpoint: str, vdaf: dict,
+                              measurements: List[Union[str, List[str]]],
+                              time: Union[int, None],
+                              time_precision: int) -> dict:
+    request_body = {
+        "task_id": encode_base64url(task_id),
+        "leader": leader_endpoint,
+        "helper": helper_endpoint,
+        "vdaf": vdaf,
+        "measurements": measurements,
+        "time_precision": time_precision,
+    }
+    if time is not None:
+        request_body["time"] = time
+    return request_body
+
+
+def endpoint_for_task_request_body(task_id: bytes, role: str,
+                                   hostname: str) -> dict:
+    return {
+        "task_id": encode_base64url(task_id),
+        "role": role,
+        "hostname": hostname,
+    }
+
+
+def aggregator_add_task_request_body(
+        task_id: bytes, role: str, leader_endpoint: str,
+        helper_endpoint: str, vdaf: dict, leader_token: str,
+        collector_token: Union[str, None], vdaf_verify_key: bytes,
+        max_batch_query_count: int, min_batch_size: int,
+        time_precision: int, collector_hpke_config_base64: str,
+        task_expiration: int, query_type: QueryType) -> dict:
+    request_body = {
+        "task_id": encode_base64url(task_id),
+        "leader": leader_endpoint,
+        "helper": helper_endpoint,
+        "vdaf": vdaf,
+        "leader_authentication_token": leader_token,
+        "role": role,
+        "vdaf_verify_key": encode_base64url(vdaf_verify_key),
+        "max_batch_query_count": max_batch_query_count,
+        "query_type": query_type.value,
+        "min_batch_size": min_batch_size,
+        "time_precision": time_precision,
+        "collector_hpke_config": collector_hpke_config_base64,
+        "task_expiration": task_expiration,
+    }
+    if collector_token is not None:
+        request_body["collector_authentication_token"] = collector_token
+    if query_type == QueryType.FIXED_SIZE:
+        request_body["max_batch_size"] = min_batch_size
+    return request_body
+
+
+def collector_add_task_request_body(task_id: bytes, leader_endpoint: str,
+                                    vdaf: dict, auth_token: str,
+                                    query_type: QueryType) -> dict:
+    return {
+        "task_id": encode_base64url(task_id),
+        "leader": leader_endpoint,
+        "vdaf": vdaf,
+        "collector_authentication_token": auth_token,
+        "query_type": query_type.value,
+    }
+
+
+def collection_start_request_body(task_id: bytes, query: Query) -> dict:
+    return {
+        "task_id": encode_base64url(task_id),
+        "agg_param": "",
+        "query": query.to_json(),
+    }
+
+
+def collection_poll_result(response_body: dict
+                           ) -> Union[str, List[str], None]:
+    "The aggregate result from a collection poll, or None if not ready."
+    if response_body["status"] == "in progress":
+        return None
+    else:
+        return response_body["result"]
+
+
 class ClientContainer(DAPContainer):
+    # Results of probing for batch upload support, keyed by image. Each image
+    # is only probed once per run.
+    _batch_upload_support: Dict[str, bool] = {}
+    _batch_upload_support_lock = threading.Lock()
+
     def upload(self, task_id: bytes, leader_endpoint: str,
                helper_endpoint: str, vdaf: dict,
                measurement: Union[str, List[str]], time: Union[int, None],
                time_precision: int):
-        request_body = {
-            "task_id": encode_base64url(task_id),
-            "leader": leader_endpoint,
-            "helper": helper_endpoint,
-            "vdaf": vdaf,
-            "measurement": measurement,
-            "time_precision": time_precision,
-        }
-        if time is not None:
-            request_body["time"] = time
-        self.make_request("internal/test/upload", request_body)
+        self.make_request("internal/test/upload", upload_request_body(
+            task_id, leader_endpoint, helper_endpoint, vdaf, measurement,
+            time, time_precision))
+
+    def supports_batch_upload(self, task_id: bytes, leader_endpoint: str,
+                              helper_endpoint: str, vdaf: dict,
+                              time_precision: int) -> bool:
+        """
+        Determine whether this client implements the optional
+        `/internal/test/upload_batch` endpoint, by sending it a request for
+        the given task with no measurements. If it is not, uploads should
+        fall back to `upload()`. The answer is remembered for the image,
+        unless the probe failed for another reason than the endpoint not
+        existing, such as a connection reset while the client was starting,
+        in which case it is probed again next time.
+        """
+        cached = self.cached_batch_upload_support(self.original_image)
+        if cached is not None:
+            return cached
+
+        try:
+            self.make_request(
+                "internal/test/upload_batch",
+                upload_batch_request_body(task_id, leader_endpoint,
+                                          helper_endpoint, vdaf, [], None,
+                                          time_precision))
+            supported = True
+        except Exception as e:
+            if not endpoint_not_implemented(e):
+                return False
+            supported = False
+        self.record_batch_upload_support(self.original_image, supported)
+        return supported
+
+    @classmethod
+    def cached_batch_upload_support(cls, image: str) -> Optional[bool]:
+        with cls._batch_upload_support_lock:
+            return cls._batch_upload_support.get(image)
+
+    @classmethod
+    def record_batch_upload_support(cls, image: str, supported: bool):
+        with cls._batch_upload_support_lock:
+            cls._batch_upload_support[image] = supported
+
+    def upload_batch(self, task_id: bytes, leader_endpoint: str,
+                     helper_endpoint: str, vdaf: dict,
+                     measurements: List[Union[str, List[str]]],
+                     time: Union[int, None], time_precision: int):
+        self.make_request(
+            "internal/test/upload_batch",
+            upload_batch_request_body(task_id, leader_endpoint,
+                                      helper_endpoint, vdaf, measurements,
+                                      time, time_precision))
 
 
 class AggregatorContainer(DAPContainer):
     def endpoint_for_task(self, task_id: bytes, role: str):
-        request_body = {
-            "task_id": encode_base64url(task_id),
-            "role": role,
-            "hostname": self._container.name,
-        }
         response_body = self.make_request(
-            "internal/test/endpoint_for_task", request_body)
+            "internal/test/endpoint_for_task",
+            endpoint_for_task_request_body(task_id, role,
+                                           self.container_name()))
         raw_endpoint = response_body["endpoint"]
         return urljoin(self.container_base_url(), raw_endpoint)
 
@@ -199,89 +664,89 @@ class AggregatorContainer(DAPContainer):
                  min_batch_size: int, time_precision: int,
                  collector_hpke_config_base64: str, task_expiration: int,
                  query_type: QueryType):
-        request_body = {
-            "task_id": encode_base64url(task_id),
-            "leader": leader_endpoint,
-            "helper": helper_endpoint,
-            "vdaf": vdaf,
-            "leader_authentication_token": leader_token,
-            "role": role,
-            "vdaf_verify_key": encode_base64url(vdaf_verify_key),
-            "max_batch_query_count": max_batch_query_count,
-            "query_type": query_type.value,
-            "min_batch_size": min_batch_size,
-            "time_precision": time_precision,
-            "collector_hpke_config": collector_hpke_config_base64,
-            "task_expiration": task_expiration,
-        }
-        if collector_token is not None:
-            request_body["collector_authentication_token"] = collector_token
-        if query_type == QueryType.FIXED_SIZE:
-            request_body["max_batch_size"] = min_batch_size
-        self.make_request("internal/test/add_task", request_body)
+        self.make_request(
+            "internal/test/add_task",
+            aggregator_add_task_request_body(
+                task_id, role, leader_endpoint, helper_endpoint, vdaf,
+                leader_token, collector_token, vdaf_verify_key,
+                max_batch_query_count, min_batch_size, time_precision,
+                collector_hpke_config_base64, task_expiration, query_type))
 
 
 class CollectorContainer(DAPContainer):
     def add_task(self, task_id: bytes, leader_endpoint: str,
                  vdaf: dict, auth_token: str, query_type: QueryType) -> str:
-        request_body = {
-            "task_id": encode_base64url(task_id),
-            "leader": leader_endpoint,
-            "vdaf": vdaf,
-            "collector_authentication_token": auth_token,
-            "query_type": query_type.value,
-        }
         response_body = self.make_request(
-            "internal/test/add_task", request_body)
+            "internal/test/add_task",
+            collector_add_task_request_body(task_id, leader_endpoint, vdaf,
+                                            auth_token, query_type))
         return response_body["collector_hpke_config"]
 
     def collection_start(self, task_id: bytes, _aggregation_param: None,
                          query: Query) -> str:
-        request_body = {
-            "task_id": encode_base64url(task_id),
-            "agg_param": "",
-            "query": query.to_json(),
-        }
         response_body = self.make_request(
-            "internal/test/collection_start", request_body)
+            "internal/test/collection_start",
+            collection_start_request_body(task_id, query))
         return response_body["handle"]
 
     def collection_poll(self, handle: str) -> Union[str, List[str], None]:
-        request_body = {"handle": handle}
         response_body = self.make_request(
-            "internal/test/collection_poll", request_body)
-        if response_body["status"] == "in progress":
-            return None
-        else:
-            return response_body["result"]
+            "internal/test/collection_poll", {"handle": handle})
+        return collection_poll_result(response_body)
 
 
 @contextlib.contextmanager
 def container_network(client: docker.DockerClient, name: str):
-    network = client.networks.create(
-        name,
-        driver="bridge",
-        check_duplicate=True,
-    )
+    with span("create_network", network=name):
+        network = client.networks.create(
+            name,
+            driver="bridge",
+            check_duplicate=True,
+            labels=owner_labels(),
+        )
     try:
         yield network
     finally:
-        network.remove()
+        with span("remove_network", network=name):
+            network.remove()
+
+
+def start_container(client: docker.DockerClient, image: str, name: str,
+                    network, constructor,
+                    pool_size: int = requests.adapters.DEFAULT_POOLSIZE,
+                    host_address: str = LOCAL_ADDRESS):
+    """
+    Start a container, and wrap it in the given DAPContainer subclass. The
+    caller is responsible for calling `remove()` on the returned object.
+    """
+    with span("start_container", image=image, container=name):
+        container = client.containers.run(
+            image,
+            detach=True,
+            name=name,
+            network=network.name,
+            ports={
+                "8080/tcp": None,
+            }
+        )
+    try:
+        dap_container = constructor(container, image, pool_size,
+                                    host_address)
+        dap_container.start_log_stream()
+        return dap_container
+    except BaseException:
+        container.remove(force=True)
+        raise
 
 
 @contextlib.contextmanager
 def run_container(client: docker.DockerClient, image: str, name: str, network,
-                  constructor):
-    container = client.containers.run(
-        image,
-        detach=True,
-        name=name,
-        network=network.name,
-        ports={
-            "8080/tcp": None,
-        }
-    )
+                  constructor,
+                  pool_size: int = requests.adapters.DEFAULT_POOLSIZE,
+                  host_address: str = LOCAL_ADDRESS):
+    dap_container = start_container(client, image, name, network,
+                                    constructor, pool_size, host_address)
     try:
-        yield constructor(container, image)
+        yield dap_container
     finally:
-        container.remove(force=True)
+        dap_container.remove()
@@ -0,0 +1,220 @@
+"""
+Seeded measurement corpora, stored on disk so that a test case can be re-run
+with byte-identical inputs without regenerating them.
+
+A corpus file starts with the 8 byte magic string CORPUS_MAGIC, followed by
+every value of every measurement as a little-endian unsigned 64-bit integer.
+After the values comes a JSON object describing the corpus, including its
+expected aggregate result, and then the length of that JSON object as a
+little-endian unsigned 32-bit integer. Corpus files are memory-mapped while
+measurements are uploaded, so they are never read into memory all at once.
+"""
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .files import atomic_write
+from .models import RunOptions, TestCase
+from .tracing import span
+from .vdaf import (
+    WIRE_CHUNK_SIZE, Accumulator, add_aggregates, format_aggregate,
+    generate_measurement_stream, generate_measurements, make_rng,
+    vector_length,
+)
+
+CORPUS_MAGIC = b"DAPCORP1"
+
+_TRAILER = struct.Struct("<I")
+
+# Locks held while a corpus file is generated, keyed by path, so that test
+# cases running concurrently do not generate the same corpus twice.
+_generation_locks: Dict[str, threading.Lock] = {}
+_generation_locks_lock = threading.Lock()
+
+
+class CorpusError(Exception):
+    "A corpus file is malformed."
+
+
+def test_case_seed(seed: int, test_case: TestCase) -> int:
+    """
+    Derive the seed used for one test case's measurements from the seed
+    given on the command line, so that test cases with the same VDAF do not
+    upload the same measurements.
+    """
+    digest = hashlib.sha256(f"{seed}:{test_case.name}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def corpus_path(directory: str, test_case: TestCase, seed: int) -> str:
+    return os.path.join(
+        directory,
+        f"{test_case.name}-{test_case.measurement_count}-seed{seed}.corpus",
+    )
+
+
+def write_corpus(path: str, vdaf_dict: dict, count: int, seed: int):
+    """
+    Generate `count` measurements for the given VDAF from `seed`, and write
+    them to a corpus file at `path`. The file is written under a temporary
+    name and then renamed, so a partially written corpus is never used.
+    """
+    rng = make_rng(seed)
+    totals: Union[int, List[int], None] = None
+    with atomic_write(path, "wb") as f:
+        f.write(CORPUS_MAGIC)
+        for start in range(0, count, WIRE_CHUNK_SIZE):
+            batch = generate_measurements(
+                vdaf_dict, min(WIRE_CHUNK_SIZE, count - start), rng)
+            f.write(batch.to_bytes())
+            batch_totals = batch.totals()
+            totals = (batch_totals if totals is None
+                      else add_aggregates(totals, batch_totals))
+        if totals is None:
+            totals = generate_measurements(vdaf_dict, 0, rng).totals()
+        metadata = json.dumps({
+            "vdaf": vdaf_dict,
+            "count": count,
+            "seed": seed,
+            "expected_aggregate": format_aggregate(totals),
+        }).encode()
+        f.write(metadata)
+        f.write(_TRAILER.pack(len(metadata)))
+
+
+class Corpus:
+    """
+    A memory-mapped corpus file. Iterating over a corpus yields its
+    measurements in the wire format accepted by the client interop API.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_metadata()
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    def _read_metadata(self) -> None:
+        size = len(self._mmap)
+        if (size < len(CORPUS_MAGIC) + _TRAILER.size or
+                self._mmap[:len(CORPUS_MAGIC)] != CORPUS_MAGIC):
+            raise CorpusError(f"{self.path} is not a corpus file")
+        (metadata_length,) = _TRAILER.unpack_from(self._mmap,
+                                                  size - _TRAILER.size)
+        metadata_start = size - _TRAILER.size - metadata_length
+        if metadata_start < len(CORPUS_MAGIC):
+            raise CorpusError(f"{self.path} is truncated")
+        try:
+            metadata = json.loads(
+                self._mmap[metadata_start:size - _TRAILER.size])
+        except ValueError as e:
+            raise CorpusError(f"{self.path} has invalid metadata: {e}")
+        self.vdaf_dict: dict = metadata["vdaf"]
+        self.count: int = metadata["count"]
+        self.seed: int = metadata["seed"]
+        self.expected_aggregate: Union[str, List[str]] = \
+            metadata["expected_aggregate"]
+        self._width = vector_length(self.vdaf_dict)
+        if (metadata_start - len(CORPUS_MAGIC) !=
+                self.count * max(self._width, 1) * 8):
+            raise CorpusError(f"{self.path} is truncated")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Union[str, List[str]]]:
+        width = self._width
+        values_per_chunk = WIRE_CHUNK_SIZE * max(width, 1)
+        end = len(CORPUS_MAGIC) + self.count * max(width, 1) * 8
+        for offset in range(len(CORPUS_MAGIC), end, values_per_chunk * 8):
+            chunk_end = min(offset + values_per_chunk * 8, end)
+            # Copy each chunk out of the mapping, so that no view of it
+            # outlives this iteration and prevents the corpus being closed.
+            with memoryview(self._mmap) as view:
+                with view[offset:chunk_end].cast("Q") as values:
+                    chunk = values.tolist()
+            if sys.byteorder != "little":
+                chunk = [int.from_bytes(value.to_bytes(8, "big"), "little")
+                         for value in chunk]
+            if width:
+                for i in range(0, len(chunk), width):
+                    yield [str(value) for value in chunk[i:i + width]]
+            else:
+                for value in chunk:
+                    yield str(value)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self) -> "Corpus":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_or_create_corpus(directory: str, test_case: TestCase,
+                          seed: int) -> Corpus:
+    """
+    Open the corpus for a test case and run seed in `directory`, generating
+    it first if it does not exist yet, or if it was generated for a different
+    VDAF.
+    """
+    path = corpus_path(directory, test_case, seed)
+    measurement_seed = test_case_seed(seed, test_case)
+    with _generation_locks_lock:
+        lock = _generation_locks.setdefault(path, threading.Lock())
+    with lock:
+        if os.path.exists(path):
+            try:
+                corpus = Corpus(path)
+            except CorpusError:
+                pass
+            else:
+                if (corpus.vdaf_dict == test_case.vdaf and
+                        corpus.count == test_case.measurement_count and
+                        corpus.seed == measurement_seed):
+                    return corpus
+                corpus.close()
+        os.makedirs(directory, exist_ok=True)
+        with span("generate_corpus", test_case=test_case.name,
+                  count=test_case.measurement_count):
+            write_corpus(path, test_case.vdaf, test_case.measurement_count,
+                         measurement_seed)
+        return Corpus(path)
+
+
+@contextlib.contextmanager
+def open_measurements(test_case: TestCase, options: RunOptions,
+                      accumulator: Optional[Accumulator] = None
+                      ) -> Iterator[Tuple[Iterable[Union[str, List[str]]],
+                                          Optional[Union[str, List[str]]]]]:
+    """
+    Provide the measurements to upload for a test case, and their expected
+    aggregate result, if it is already known. Measurements come from a
+    corpus file if `options.corpus_directory` is set, and are otherwise
+    generated as they are uploaded, from the test case's seed if
+    `options.seed` is set. Generated measurements are added to `accumulator`
+    as they are generated, if it is given.
+    """
+    if options.corpus_directory is not None:
+        with load_or_create_corpus(options.corpus_directory, test_case,
+                                   options.seed or 0) as corpus:
+            yield corpus, corpus.expected_aggregate
+        return
+    seed_for_test: Optional[int] = None
+    if options.seed is not None:
+        seed_for_test = test_case_seed(options.seed, test_case)
+    yield generate_measurement_stream(test_case.vdaf,
+                                      test_case.measurement_count,
+                                      seed_for_test, accumulator), None
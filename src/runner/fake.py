@@ -0,0 +1,499 @@
+"""
+An in-process stand-in for Docker and DAP implementations, for exercising
+and profiling the test harness itself.
+
+FakeDockerClient implements the parts of `docker.DockerClient` that the
+harness uses. Running one of the FAKE_*_IMAGE images starts an HTTP server
+on a local port, which implements the interop test API for that role. No
+cryptography is performed: the client hands measurements directly to the
+leader, and the leader computes aggregate results in the clear, using
+`runner.vdaf.aggregate_measurements`.
+"""
+import base64
+import hashlib
+import http.server
+import io
+import json
+import posixpath
+import secrets
+import sys
+import tarfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .containers import GeneratorStreamAdapter
+from .models import ImageSet
+from .vdaf import aggregate_measurements
+
+FAKE_CLIENT_IMAGE = "fake-client"
+FAKE_AGGREGATOR_IMAGE = "fake-aggregator"
+FAKE_COLLECTOR_IMAGE = "fake-collector"
+
+FAKE_IMAGE_SET = ImageSet(
+    FAKE_CLIENT_IMAGE,
+    FAKE_AGGREGATOR_IMAGE,
+    FAKE_AGGREGATOR_IMAGE,
+    FAKE_COLLECTOR_IMAGE,
+)
+
+
+class FakeError(Exception):
+    "An error to be returned from the interop API, with status \"error\"."
+
+
+class FakeService:
+    "Base class for the interop API of one fake container."
+
+    def __init__(self, network: "FakeNetwork", name: str, latency: float):
+        self.network = network
+        self.name = name
+        self.latency = latency
+        self.lock = threading.Lock()
+        # Notified when a line is logged, or the container is removed.
+        self.logged = threading.Condition(self.lock)
+        self.log_lines: List[bytes] = []
+        self.stopped = False
+
+    def log(self, message: str):
+        with self.lock:
+            self.log_lines.append(f"{self.name}: {message}\n".encode())
+            self.logged.notify_all()
+
+    def handle(self, path: str, body: dict) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        if path == "/internal/test/ready":
+            return {"status": "success"}
+        handler = getattr(self, path[len("/internal/test/"):], None)
+        if not path.startswith("/internal/test/") or handler is None:
+            raise KeyError(path)
+        try:
+            return handler(body)
+        except FakeError as e:
+            self.log(f"{path} failed: {e}")
+            return {"status": "error", "error": str(e)}
+
+
+def _hostname(url: str) -> str:
+    hostname = urlparse(url).hostname
+    if hostname is None:
+        raise FakeError(f"No hostname in {url}")
+    return hostname
+
+
+class FakeClient(FakeService):
+    def upload(self, body: dict) -> dict:
+        return self.upload_batch({
+            **body,
+            "measurements": [body["measurement"]],
+        })
+
+    def upload_batch(self, body: dict) -> dict:
+        missing = {"task_id", "leader", "helper", "vdaf", "measurements",
+                   "time_precision"} - set(body)
+        if missing:
+            raise FakeError(f"missing fields: {', '.join(sorted(missing))}")
+        if not body["measurements"]:
+            return {"status": "success"}
+        leader = self.network.lookup(_hostname(body["leader"]))
+        if not isinstance(leader, FakeAggregator):
+            raise FakeError(f"{body['leader']} is not an aggregator")
+        leader.receive_reports(body["task_id"], body["measurements"],
+                               body.get("time", time.time()))
+        return {"status": "success"}
+
+
+class FakeTask:
+    def __init__(self, body: dict):
+        self.vdaf = body["vdaf"]
+        self.query_type = body["query_type"]
+        self.min_batch_size = body["min_batch_size"]
+        self.max_batch_size = body.get("max_batch_size")
+        # Uncollected reports, as pairs of timestamp and measurement.
+        self.reports: List[Tuple[float, object]] = []
+
+
+class FakeAggregator(FakeService):
+    def __init__(self, network: "FakeNetwork", name: str, latency: float):
+        super().__init__(network, name, latency)
+        self.tasks: Dict[str, FakeTask] = {}
+
+    def endpoint_for_task(self, body: dict) -> dict:
+        return {"status": "success", "endpoint": "/"}
+
+    def add_task(self, body: dict) -> dict:
+        with self.lock:
+            self.tasks[body["task_id"]] = FakeTask(body)
+        self.log(f"added task {body['task_id']} as {body['role']}")
+        return {"status": "success"}
+
+    def receive_reports(self, task_id: str, measurements: list,
+                        timestamp: float):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                raise FakeError(f"Unknown task {task_id}")
+            task.reports.extend(
+                (timestamp, measurement) for measurement in measurements)
+
+    def collect(self, task_id: str, query: dict) -> Tuple[object, int]:
+        """
+        Remove the reports matching a query from the task, and return their
+        aggregate result and count.
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                raise FakeError(f"Unknown task {task_id}")
+            if query["type"] == 1:
+                start = query["batch_interval_start"]
+                end = start + query["batch_interval_duration"]
+                batch = [report for report in task.reports
+                         if start <= report[0] < end]
+                remaining = [report for report in task.reports
+                             if not start <= report[0] < end]
+            else:
+                size = task.max_batch_size or len(task.reports)
+                batch = task.reports[:size]
+                remaining = task.reports[size:]
+            if len(batch) < task.min_batch_size:
+                raise FakeError(
+                    f"Batch has {len(batch)} reports, fewer than the "
+                    f"minimum of {task.min_batch_size}")
+            task.reports = remaining
+        measurements = [measurement for _, measurement in batch]
+        result = aggregate_measurements(task.vdaf, None,
+                                        measurements)  # type: ignore
+        return result, len(batch)
+
+
+class FakeCollector(FakeService):
+    def __init__(self, network: "FakeNetwork", name: str, latency: float):
+        super().__init__(network, name, latency)
+        self.tasks: Dict[str, str] = {}
+        self.jobs: Dict[str, dict] = {}
+
+    def add_task(self, body: dict) -> dict:
+        with self.lock:
+            self.tasks[body["task_id"]] = body["leader"]
+        hpke_config = base64.urlsafe_b64encode(secrets.token_bytes(32))
+        return {
+            "status": "success",
+            "collector_hpke_config": hpke_config.rstrip(b"=").decode(),
+        }
+
+    def collection_start(self, body: dict) -> dict:
+        with self.lock:
+            leader_endpoint = self.tasks.get(body["task_id"])
+        if leader_endpoint is None:
+            raise FakeError(f"Unknown task {body['task_id']}")
+        leader = self.network.lookup(_hostname(leader_endpoint))
+        if not isinstance(leader, FakeAggregator):
+            raise FakeError(f"{leader_endpoint} is not an aggregator")
+        result, report_count = leader.collect(body["task_id"], body["query"])
+        handle = secrets.token_hex(16)
+        with self.lock:
+            self.jobs[handle] = {
+                "status": "complete",
+                "result": result,
+                "report_count": report_count,
+            }
+        return {"status": "success", "handle": handle}
+
+    def collection_poll(self, body: dict) -> dict:
+        with self.lock:
+            job = self.jobs.get(body["handle"])
+        if job is None:
+            raise FakeError(f"Unknown collection job {body['handle']}")
+        return job
+
+
+class FakeNetwork:
+    def __init__(self, client: "FakeDockerClient", name: str,
+                 labels: Optional[Dict[str, str]] = None):
+        self.client = client
+        self.name = name
+        self.labels = labels or {}
+        self.services: Dict[str, FakeService] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def attrs(self) -> dict:
+        with self.lock:
+            containers = {name: {"Name": name} for name in self.services}
+        return {"Name": self.name, "Labels": self.labels,
+                "Containers": containers}
+
+    def reload(self):
+        pass
+
+    def lookup(self, hostname: str) -> FakeService:
+        with self.lock:
+            service = self.services.get(hostname)
+        if service is None:
+            raise FakeError(f"Could not resolve {hostname}")
+        return service
+
+    def remove(self):
+        with self.lock:
+            if self.services:
+                raise Exception(
+                    f"Network {self.name} still has containers attached")
+        self.client.networks.forget(self.name)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: FakeService
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length)
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            response = self.server.service.handle(  # type: ignore
+                self.path, body)
+            status = 200
+        except KeyError:
+            response = {"status": "error", "error": "not found"}
+            status = 404
+        encoded = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before the response is written.
+        if isinstance(sys.exc_info()[1],
+                      (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeImage:
+    def __init__(self, name: str):
+        self.tags = [name]
+        self.id = "sha256:" + name.encode().hex()
+        self.attrs: dict = {"RepoDigests": []}
+
+
+class FakeContainer:
+    def __init__(self, network: FakeNetwork, name: str, image: str,
+                 service: FakeService):
+        self.network = network
+        self.name = name
+        self.image = FakeImage(image)
+        self.service = service
+        self._server = _Server(("127.0.0.1", 0), _RequestHandler)
+        self._server.service = service  # type: ignore
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,), daemon=True)
+        self._thread.start()
+        port = str(self._server.server_address[1])
+        self.attrs: dict = {
+            "NetworkSettings": {
+                "Ports": {
+                    "8080/tcp": [{"HostIp": "0.0.0.0", "HostPort": port}],
+                },
+            },
+            "State": {"Status": "running"},
+        }
+        # Files copied into the container with put_archive, keyed by path.
+        self.files: Dict[str, bytes] = {}
+
+    def reload(self):
+        pass
+
+    def logs(self, stream: bool = False, follow: bool = False, since=None):
+        if stream and follow:
+            return _FollowedLogs(self.service)
+        with self.service.lock:
+            lines = list(self.service.log_lines)
+        if stream:
+            return iter(lines)
+        return b"".join(lines)
+
+    def get_archive(self, path: str):
+        data = b"".join(self.logs(stream=True))
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tf:
+            info = tarfile.TarInfo("logs/fake.log")
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+        contents = buffer.getvalue()
+        chunks = (contents[i:i + 4096]
+                  for i in range(0, len(contents), 4096))
+        return chunks, {"name": "logs"}
+
+    def put_archive(self, path: str, data) -> bool:
+        "Extract a tar archive, given as bytes or chunks, into `files`."
+        chunks = [data] if isinstance(data, bytes) else data
+        with tarfile.open(fileobj=GeneratorStreamAdapter(iter(chunks)),
+                          mode="r|") as tf:
+            for entry in tf:
+                extract_file = tf.extractfile(entry)
+                if extract_file is not None:
+                    destination = posixpath.join(path, entry.name)
+                    self.files[destination] = extract_file.read()
+        return True
+
+    def remove(self, force: bool = False):
+        self._server.shutdown()
+        self._server.server_close()
+        self.attrs["State"]["Status"] = "exited"
+        with self.service.logged:
+            self.service.stopped = True
+            self.service.logged.notify_all()
+        with self.network.lock:
+            self.network.services.pop(self.name, None)
+        self.network.client.containers.forget(self.name)
+
+
+class _FollowedLogs:
+    """
+    Yields a fake container's log lines as they are logged, until the
+    container is removed, or the stream is closed from another thread.
+    """
+
+    def __init__(self, service: FakeService):
+        self._service = service
+        self._index = 0
+        self._closed = False
+        self._lines: List[bytes] = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        service = self._service
+        while not self._lines:
+            with service.logged:
+                service.logged.wait_for(
+                    lambda: self._index < len(service.log_lines) or
+                    service.stopped or self._closed)
+                if self._closed:
+                    raise StopIteration
+                self._lines = service.log_lines[self._index:]
+                self._index = len(service.log_lines)
+                if not self._lines and service.stopped:
+                    raise StopIteration
+        return self._lines.pop(0)
+
+    def close(self):
+        with self._service.logged:
+            self._closed = True
+            self._service.logged.notify_all()
+
+
+class FakeNetworks:
+    def __init__(self, client: "FakeDockerClient"):
+        self._client = client
+        self._lock = threading.Lock()
+        self._networks: Dict[str, FakeNetwork] = {}
+
+    def create(self, name: str, driver: Optional[str] = None,
+               check_duplicate: bool = False,
+               labels: Optional[Dict[str, str]] = None,
+               **kwargs) -> FakeNetwork:
+        with self._lock:
+            if check_duplicate and name in self._networks:
+                raise Exception(f"Network {name} already exists")
+            network = FakeNetwork(self._client, name, labels)
+            self._networks[name] = network
+            return network
+
+    def list(self, names: Optional[List[str]] = None) -> List[FakeNetwork]:
+        "List networks whose names contain any of `names`, like Docker."
+        with self._lock:
+            return [network for name, network in self._networks.items()
+                    if names is None or any(part in name for part in names)]
+
+    def get(self, name: str) -> FakeNetwork:
+        with self._lock:
+            return self._networks[name]
+
+    def forget(self, name: str):
+        with self._lock:
+            self._networks.pop(name, None)
+
+
+class FakeContainers:
+    def __init__(self, client: "FakeDockerClient"):
+        self._client = client
+        self._lock = threading.Lock()
+        self._containers: Dict[str, FakeContainer] = {}
+
+    def get(self, name: str) -> FakeContainer:
+        with self._lock:
+            return self._containers[name]
+
+    def forget(self, name: str):
+        with self._lock:
+            self._containers.pop(name, None)
+
+    def run(self, image: str, detach: bool = False,
+            name: Optional[str] = None, network: Optional[str] = None,
+            **kwargs) -> FakeContainer:
+        assert name is not None and network is not None
+        fake_network = self._client.networks.get(network)
+        role = image.split(":")[0]
+        service: FakeService
+        if role == FAKE_CLIENT_IMAGE:
+            service = FakeClient(fake_network, name, self._client.latency)
+        elif role == FAKE_AGGREGATOR_IMAGE:
+            service = FakeAggregator(fake_network, name,
+                                     self._client.latency)
+        elif role == FAKE_COLLECTOR_IMAGE:
+            service = FakeCollector(fake_network, name, self._client.latency)
+        else:
+            raise Exception(f"No fake implementation for image {image}")
+        container = FakeContainer(fake_network, name, image, service)
+        with fake_network.lock:
+            fake_network.services[name] = service
+        with self._lock:
+            self._containers[name] = container
+        return container
+
+
+class FakeRegistryData:
+    def __init__(self, name: str):
+        self.id = "sha256:" + hashlib.sha256(name.encode()).hexdigest()
+
+
+class FakeImages:
+    def pull(self, image: str):
+        return FakeImage(image)
+
+    def get_registry_data(self, image: str) -> FakeRegistryData:
+        return FakeRegistryData(image)
+
+    def get(self, image: str) -> FakeImage:
+        return FakeImage(image)
+
+
+class FakeDockerClient:
+    """
+    A stand-in for `docker.DockerClient`, which runs fake DAP implementations
+    in this process. Each interop API request is delayed by `latency`
+    seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.networks = FakeNetworks(self)
+        self.containers = FakeContainers(self)
+        self.images = FakeImages()
+
+    def ping(self):
+        return True
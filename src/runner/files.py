@@ -0,0 +1,23 @@
+import contextlib
+import os
+import tempfile
+from typing import IO, Iterator
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = "w") -> Iterator[IO]:
+    """
+    Open a temporary file in the same directory as `path` for writing, and
+    rename it to `path` once the block exits without an exception. Other
+    readers of `path` never see a partially written file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
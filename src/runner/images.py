@@ -0,0 +1,137 @@
+"""
+Pulling container images in the background, while test cases run.
+
+Before pulling an image, its digest is looked up in the registry. The pull is
+skipped if the local copy of the image already has that digest, either
+according to the image's repository digests, or according to a cache file
+recording which registry digest each image was last pulled at.
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from .files import atomic_write
+from .models import ImageSet
+from .tracing import span
+
+DEFAULT_PULL_JOBS = 4
+
+logger = logging.getLogger(__name__)
+
+
+def image_set_images(image_set: ImageSet) -> Tuple[str, str, str, str]:
+    return (image_set.client, image_set.leader, image_set.helper,
+            image_set.collector)
+
+
+class DigestCache:
+    """
+    A JSON file mapping each image name to the registry digest it was last
+    pulled at, and the ID of the local image that pull produced.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, str]] = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                logger.warning("Ignoring malformed image digest cache %s",
+                               path)
+
+    def get(self, image: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(image)
+        if entry is None:
+            return None
+        return entry["digest"], entry["image_id"]
+
+    def record(self, image: str, digest: str, image_id: str):
+        with self._lock:
+            self._entries[image] = {"digest": digest, "image_id": image_id}
+            if self._path is not None:
+                with atomic_write(self._path) as f:
+                    json.dump(self._entries, f, indent=2, sort_keys=True)
+
+
+class ImagePuller:
+    """
+    Pulls images on a pool of `jobs` worker threads. Images are pulled in
+    the order they are first passed to `pull()`, and `wait()` blocks until
+    particular images are available. If a DigestCache is given, it is used
+    instead of reading `cache_path`, so that pullers for several Docker
+    hosts can share one file.
+    """
+
+    def __init__(self, client, jobs: int = DEFAULT_PULL_JOBS,
+                 cache_path: Optional[str] = None,
+                 cache: Optional[DigestCache] = None):
+        self._client = client
+        self._cache = cache if cache is not None else DigestCache(cache_path)
+        self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+        self._lock = threading.Lock()
+        self._futures: Dict[str, concurrent.futures.Future] = {}
+
+    def pull(self, images: Iterable[str]):
+        "Start pulling each image in the background, unless already started."
+        with self._lock:
+            for image in images:
+                if image not in self._futures:
+                    self._futures[image] = self._executor.submit(
+                        self._pull, image)
+
+    def wait(self, images: Iterable[str]):
+        """
+        Wait until each of the given images has been pulled, or found to be
+        up to date. Raises the exception from pulling any of them, if one
+        failed.
+        """
+        for image in images:
+            with self._lock:
+                future = self._futures.get(image)
+            if future is not None:
+                future.result()
+
+    def _pull(self, image: str) -> bool:
+        "Pull an image if it is out of date. Returns whether it was pulled."
+        with span("pull_image", image=image):
+            try:
+                digest: Optional[str] = \
+                    self._client.images.get_registry_data(image).id
+            except Exception as e:
+                # Registry lookups may not be supported where pulls are, for
+                # example with some credential helpers. Pull unconditionally.
+                logger.info("Could not look up digest of %s: %s", image, e)
+                digest = None
+            if digest is not None and self._is_current(image, digest):
+                logger.info("%s is up to date", image)
+                return False
+            logger.info("Pulling %s", image)
+            pulled = self._client.images.pull(image)
+            if digest is not None:
+                self._cache.record(image, digest, pulled.id)
+            return True
+
+    def _is_current(self, image: str, digest: str) -> bool:
+        try:
+            local = self._client.images.get(image)
+        except Exception:
+            return False
+        if self._cache.get(image) == (digest, local.id):
+            return True
+        repo_digests = local.attrs.get("RepoDigests") or []
+        return any(repo_digest.endswith("@" + digest)
+                   for repo_digest in repo_digests)
+
+    def close(self):
+        "Cancel pulls that have not started, and wait for the rest."
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+        self._executor.shutdown(wait=True)
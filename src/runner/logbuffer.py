@@ -0,0 +1,191 @@
+"""
+Bounded buffers for container log output, which is streamed from each
+container in the background while it runs, so that it is available as soon
+as a test case fails.
+"""
+import bisect
+import collections
+import logging
+import tempfile
+import threading
+import time
+from typing import IO, Deque, List, Optional, Tuple
+
+# Number of bytes of the most recent log output kept in memory, per
+# container.
+DEFAULT_MEMORY_LIMIT = 1024 * 1024
+
+# Number of bytes of older log output written to a temporary file, per
+# container, once it no longer fits in memory.
+DEFAULT_SPILL_LIMIT = 64 * 1024 * 1024
+
+# Granularity in seconds with which the times output was received are
+# recorded for output moved to disk. Docker's log timestamps are no finer.
+SPILL_TIME_RESOLUTION = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class LogBuffer:
+    """
+    Keeps the most recent `memory_limit` bytes of log output in memory.
+    Older output is moved to a temporary file, until that holds
+    `spill_limit` bytes, and after that it is discarded. When saved, the
+    buffer thus holds the start and the end of the log, with a note where
+    output was discarded in between.
+    """
+
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 spill_limit: int = DEFAULT_SPILL_LIMIT):
+        self._memory_limit = memory_limit
+        self._spill_limit = spill_limit
+        self._lock = threading.Lock()
+        # Chunks of output, with the time each was received.
+        self._chunks: Deque[Tuple[float, bytes]] = collections.deque()
+        self._memory_size = 0
+        self._spill: Optional[IO[bytes]] = None
+        self._spill_size = 0
+        # Times at which spilled output was received, at most one per
+        # SPILL_TIME_RESOLUTION, and the offset in the spill file of the
+        # first output received at each.
+        self._spill_times: List[float] = []
+        self._spill_offsets: List[int] = []
+        self._discarded = 0
+        self._closed = False
+
+    def append(self, data: bytes):
+        if not data:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self._chunks.append((time.time(), data))
+            self._memory_size += len(data)
+            while self._memory_size > self._memory_limit and \
+                    len(self._chunks) > 1:
+                received, chunk = self._chunks.popleft()
+                self._memory_size -= len(chunk)
+                self._evict(received, chunk)
+
+    def _evict(self, received: float, chunk: bytes):
+        space = self._spill_limit - self._spill_size
+        if space > 0:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile()
+            if not self._spill_times or \
+                    received >= self._spill_times[-1] + SPILL_TIME_RESOLUTION:
+                self._spill_times.append(received)
+                self._spill_offsets.append(self._spill_size)
+            self._spill.write(chunk[:space])
+            self._spill_size += min(len(chunk), space)
+        self._discarded += max(len(chunk) - max(space, 0), 0)
+
+    def write_to(self, f, since: Optional[float] = None,
+                 max_bytes: Optional[int] = None) -> int:
+        """
+        Write buffered output to a file, and return the number of bytes
+        written. If `since` is given, as a Unix timestamp, output received
+        before then is left out, give or take SPILL_TIME_RESOLUTION for
+        output moved to disk. If
+        `max_bytes` is given, output is left out from the middle as needed,
+        so that no more than that is written, apart from a note saying how
+        much was left out.
+        """
+        with self._lock:
+            tail = [chunk for received, chunk in self._chunks
+                    if since is None or received >= since]
+            tail_size = sum(len(chunk) for chunk in tail)
+            head_start = head_size = 0
+            if self._spill is not None:
+                if since is not None:
+                    # Include the segment that may contain `since`.
+                    index = max(bisect.bisect_right(self._spill_times,
+                                                    since) - 1, 0)
+                    if self._spill_times[index] + SPILL_TIME_RESOLUTION \
+                            <= since:
+                        index += 1
+                    if index < len(self._spill_offsets):
+                        head_start = self._spill_offsets[index]
+                    else:
+                        head_start = self._spill_size
+                head_size = self._spill_size - head_start
+            discarded = self._discarded if head_size else 0
+            if max_bytes is not None and head_size + tail_size > max_bytes:
+                keep = max(max_bytes - tail_size, 0)
+                discarded += head_size - keep
+                head_size = keep
+            # If even the in-memory output is too large, keep its end.
+            skip = 0
+            if max_bytes is not None and tail_size > max_bytes:
+                skip = tail_size - max_bytes
+                discarded += skip
+            written = 0
+            if head_size:
+                assert self._spill is not None
+                self._spill.seek(head_start)
+                written += _copy(self._spill, f, head_size)
+                self._spill.seek(0, 2)
+            if discarded:
+                note = f"\n[{discarded} bytes of output discarded]\n"
+                written += f.write(note.encode())
+            for chunk in tail:
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                written += f.write(chunk[skip:])
+                skip = 0
+            return written
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._chunks.clear()
+            self._memory_size = 0
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+
+def _copy(source: IO[bytes], destination, length: int) -> int:
+    copied = 0
+    while copied < length:
+        chunk = source.read(min(length - copied, 1024 * 1024))
+        if not chunk:
+            break
+        copied += destination.write(chunk)
+    return copied
+
+
+class LogStreamer:
+    """
+    Streams a Docker container's process output into a LogBuffer on a
+    background thread, until the container stops or `stop()` is called.
+    """
+
+    def __init__(self, container, buffer: LogBuffer, name: str):
+        self.buffer = buffer
+        self._stream = container.logs(stream=True, follow=True)
+        self._thread = threading.Thread(target=self._run,
+                                        name=f"logs-{name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for chunk in self._stream:
+                self.buffer.append(chunk)
+        except Exception as e:
+            # The stream is closed from another thread when the container is
+            # removed.
+            logger.debug("Log stream ended: %s", e)
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Wait for the log stream to end, which it does once the container has
+        been removed, and close it if it does not.
+        """
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+            self._thread.join(timeout)
@@ -0,0 +1,149 @@
+"""
+Strategies for choosing which combinations of images to test, from lists of
+images for each role.
+
+Testing every combination grows as the fourth power of the number of
+implementations. Most interoperability problems arise between two roles that
+talk to each other directly, so it is usually enough to test each pair of
+images for those roles together at least once, in some combination.
+"""
+import itertools
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Set, Tuple
+
+from .models import ImageSet
+
+ROLES = ("client", "leader", "helper", "collector")
+
+# Pairs of roles whose implementations interact directly. The client uploads
+# reports to the leader, using HPKE configurations from both aggregators; the
+# leader and helper run aggregation; and the collector collects from the
+# leader.
+INTERACTIONS: List[Tuple[str, str]] = [
+    ("client", "leader"),
+    ("client", "helper"),
+    ("leader", "helper"),
+    ("leader", "collector"),
+]
+
+FULL = "full"
+PAIRWISE = "pairwise"
+LEADER_HELPER = "leader-helper"
+STRATEGIES = (FULL, PAIRWISE, LEADER_HELPER)
+
+
+@dataclass(frozen=True)
+class ImageLists:
+    "Lists of images to test for each role."
+    client: Sequence[str]
+    leader: Sequence[str]
+    helper: Sequence[str]
+    collector: Sequence[str]
+
+
+def full_matrix(lists: ImageLists) -> List[ImageSet]:
+    "Every combination of images."
+    return [ImageSet(*combination) for combination in itertools.product(
+        lists.client, lists.leader, lists.helper, lists.collector)]
+
+
+def pairwise_matrix(lists: ImageLists) -> List[ImageSet]:
+    """
+    Choose image sets such that each pair of images for every pair of roles
+    in INTERACTIONS appears together in at least one image set.
+
+    This builds image sets one at a time. Each starts from the first pair of
+    images not yet covered, and then fills the remaining roles one at a time,
+    choosing the image that covers the most new pairs. The result is not
+    minimal, but is close to the size of the largest pair of lists.
+    """
+    uncovered = _all_pairs(lists)
+    image_sets = []
+    while uncovered:
+        (role_a, role_b), (image_a, image_b) = min(uncovered)
+        chosen = {role_a: image_a, role_b: image_b}
+        for role in ROLES:
+            if role in chosen:
+                continue
+            chosen[role] = max(
+                getattr(lists, role),
+                key=lambda image: _new_pairs({**chosen, role: image},
+                                             uncovered),
+            )
+        uncovered -= _pairs_of(chosen)
+        image_sets.append(ImageSet(**chosen))
+    return image_sets
+
+
+def leader_helper_matrix(lists: ImageLists) -> List[ImageSet]:
+    """
+    Test every pair of leader and helper images, cycling through the client
+    and collector images, so that each of them is still tested at least once.
+    """
+    pairs = list(itertools.product(lists.leader, lists.helper))
+    if not pairs or not lists.client or not lists.collector:
+        return []
+    count = max(len(pairs), len(lists.client), len(lists.collector))
+    return [
+        ImageSet(
+            lists.client[i % len(lists.client)],
+            pairs[i % len(pairs)][0],
+            pairs[i % len(pairs)][1],
+            lists.collector[i % len(lists.collector)],
+        )
+        for i in range(count)
+    ]
+
+
+def select_image_sets(lists: ImageLists, strategy: str) -> List[ImageSet]:
+    if strategy == FULL:
+        return full_matrix(lists)
+    elif strategy == PAIRWISE:
+        return pairwise_matrix(lists)
+    elif strategy == LEADER_HELPER:
+        return leader_helper_matrix(lists)
+    raise ValueError(f"Unknown matrix strategy {strategy}")
+
+
+def coverage(image_sets: Sequence[ImageSet], lists: ImageLists
+             ) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """
+    For each pair of roles in INTERACTIONS, count how many pairs of images for
+    those roles are tested together, and how many pairs there are in total.
+    """
+    all_pairs = _all_pairs(lists)
+    covered = set()
+    for image_set in image_sets:
+        covered |= _pairs_of({role: getattr(image_set, role)
+                              for role in ROLES})
+    return {
+        interaction: (
+            sum(1 for pair in covered if pair[0] == interaction),
+            sum(1 for pair in all_pairs if pair[0] == interaction),
+        )
+        for interaction in INTERACTIONS
+    }
+
+
+_Pair = Tuple[Tuple[str, str], Tuple[str, str]]
+
+
+def _all_pairs(lists: ImageLists) -> Set[_Pair]:
+    return {
+        ((role_a, role_b), (image_a, image_b))
+        for role_a, role_b in INTERACTIONS
+        for image_a in getattr(lists, role_a)
+        for image_b in getattr(lists, role_b)
+    }
+
+
+def _pairs_of(chosen: Dict[str, str]) -> Set[_Pair]:
+    return {
+        ((role_a, role_b), (chosen[role_a], chosen[role_b]))
+        for role_a, role_b in INTERACTIONS
+        if role_a in chosen and role_b in chosen
+    }
+
+
+def _new_pairs(chosen: Dict[str, str], uncovered: Set[_Pair]) -> int:
+    return len(_pairs_of(chosen) & uncovered)
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from enum import Enum
+from typing import Dict, Mapping, Optional
 
 
 class QueryType(Enum):
@@ -60,6 +61,40 @@ class TestCase:
     vdaf: dict
     measurement_count: int
     query_type: QueryType
+    # Maximum time in seconds to wait for collections to complete, once all
+    # reports have been uploaded.
+    collection_timeout: float = 150.0
+    # Number of equal batches the measurements are split into, each of which
+    # is collected separately. Only fixed size queries may use more than one
+    # batch.
+    batch_count: int = 1
+    # Maximum number of batches collected at once.
+    concurrent_collections: int = 1
+
+    def __post_init__(self):
+        if self.batch_count < 1 or self.concurrent_collections < 1:
+            raise ValueError(f"{self.name}: batch_count and "
+                             "concurrent_collections must be positive")
+        if self.batch_count > 1 and \
+                self.query_type != QueryType.FIXED_SIZE:
+            raise ValueError(f"{self.name}: only fixed size queries may "
+                             "use more than one batch")
+        if self.measurement_count % self.batch_count:
+            raise ValueError(f"{self.name}: measurement_count must be a "
+                             "multiple of batch_count")
+
+    @property
+    def batch_size(self) -> int:
+        "Number of measurements in each batch."
+        return self.measurement_count // self.batch_count
+
+    def with_measurement_count(self, count: int) -> "TestCase":
+        """
+        Copy this test case with `count` measurements, rounded down to a
+        multiple of the number of batches, but at least one per batch.
+        """
+        batches = max(count // self.batch_count, 1)
+        return replace(self, measurement_count=batches * self.batch_count)
 
 
 @dataclass(frozen=True)
@@ -68,3 +103,65 @@ class ImageSet:
     leader: str
     helper: str
     collector: str
+
+
+@dataclass(frozen=True)
+class RunOptions:
+    # Number of reports uploaded concurrently through the client.
+    upload_concurrency: int = 1
+    # Maximum number of reports sent in each request, for clients that
+    # support batch uploads.
+    upload_batch_size: int = 100
+    # Whether to upload reports from an asyncio event loop, rather than a
+    # pool of threads.
+    async_uploads: bool = False
+    # Time in seconds to wait for each container to become ready, unless
+    # overridden for its image in `readiness_timeouts`.
+    readiness_timeout: float = 120.0
+    readiness_timeouts: Mapping[str, float] = field(default_factory=dict)
+    # Seed from which each test case's measurements are derived, or None to
+    # generate different measurements on every run.
+    seed: Optional[int] = None
+    # Directory in which generated measurements are stored and reused, or
+    # None to generate measurements while they are uploaded.
+    corpus_directory: Optional[str] = None
+    # Maximum number of bytes of logs saved from each container when a test
+    # case fails, separately for its /logs directory and its process output.
+    max_log_bytes: int = 64 * 1024 * 1024
+
+    def readiness_timeout_for(self, image: str) -> float:
+        return self.readiness_timeouts.get(image, self.readiness_timeout)
+
+
+@dataclass
+class TestMetrics:
+    # Time in seconds from starting collection to receiving the aggregate
+    # result.
+    collection_latency: float
+    # Time in seconds each container took to become ready, keyed by role.
+    # Only recorded for containers that were started for this test case.
+    startup_times: Dict[str, float] = field(default_factory=dict)
+    # Number of reports uploaded.
+    upload_count: int = 0
+    # Time in seconds from starting uploads until every report was
+    # acknowledged.
+    upload_time: float = 0.0
+    # Time in seconds spent generating or reading measurements while
+    # uploading. This is part of `upload_time`, unless uploads were
+    # concurrent with it.
+    generation_time: float = 0.0
+
+
+@dataclass(frozen=True)
+class ProvisionedTask:
+    "A task that has been set up in each of the containers."
+    task_id: bytes
+    leader_endpoint: str
+    helper_endpoint: str
+    time_precision: int
+    # Query to collect all reports uploaded after the task was set up.
+    query: Query
+    # Time in seconds each container took to become ready, keyed by role.
+    startup_times: Dict[str, float]
+    # Arguments added to trace spans for work done on this task.
+    trace_tags: Dict[str, str]
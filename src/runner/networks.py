@@ -0,0 +1,174 @@
+"""
+Docker networks for container sets, leased from a pool so that a network need
+not be created and removed for every test case.
+
+Networks are labeled with the host name and process ID of the test runner
+that created them. Networks left behind by a test runner that was killed are
+found by their name prefix the next time the test runner starts, and removed
+along with their containers.
+"""
+import atexit
+import contextlib
+import logging
+import os
+import random
+import socket
+import string
+import threading
+from typing import Dict, Iterator, List
+
+from .concurrency import run_concurrently
+from .tracing import span
+
+NETWORK_PREFIX = "dap-interop-"
+
+# Labels recording which test runner process created a network.
+HOSTNAME_LABEL = "dap-interop.hostname"
+PID_LABEL = "dap-interop.pid"
+
+logger = logging.getLogger(__name__)
+
+
+def owner_labels() -> Dict[str, str]:
+    "Labels identifying this process, for networks it creates."
+    return {HOSTNAME_LABEL: socket.gethostname(), PID_LABEL: str(os.getpid())}
+
+
+def _owner_alive(labels: Dict[str, str]) -> bool:
+    """
+    Whether the test runner that created a network may still be running.
+    Processes on other hosts cannot be checked, so they are assumed to be.
+    """
+    pid = labels.get(PID_LABEL)
+    if pid is None:
+        return False
+    if labels.get(HOSTNAME_LABEL) != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+def cleanup_orphaned_networks(client) -> int:
+    """
+    Remove networks left behind by test runners that are no longer running,
+    and return how many were removed. Their containers are removed first.
+    Networks without labels, from older versions of the test runner, are
+    only removed if no containers are attached to them.
+    """
+    removed = 0
+    for network in client.networks.list(names=[NETWORK_PREFIX]):
+        if not network.name.startswith(NETWORK_PREFIX):
+            continue
+        try:
+            network.reload()
+        except Exception:
+            # The network was removed since it was listed.
+            continue
+        labels = network.attrs.get("Labels") or {}
+        attached = network.attrs.get("Containers") or {}
+        if _owner_alive(labels) or (attached and PID_LABEL not in labels):
+            continue
+        with span("remove_orphaned_network", network=network.name):
+            for container_id in attached:
+                try:
+                    client.containers.get(container_id).remove(force=True)
+                except Exception as e:
+                    logger.warning("Could not remove orphaned container "
+                                   "%s: %s", container_id, e)
+            try:
+                network.remove()
+            except Exception as e:
+                logger.warning("Could not remove orphaned network %s: %s",
+                               network.name, e)
+                continue
+        logger.info("Removed orphaned network %s", network.name)
+        removed += 1
+    return removed
+
+
+class NetworkPool:
+    """
+    Docker networks leased to one container set at a time. `size` networks
+    are created up front, and more are created whenever none are idle. When a
+    network is returned, it is checked to have no containers attached, and
+    is dropped from the pool if it does. Idle networks are removed by
+    `close()`, which is also called at exit.
+    """
+
+    def __init__(self, client, size: int = 0):
+        self._client = client
+        self._lock = threading.Lock()
+        self._idle: List = []
+        self._closed = False
+        atexit.register(self.close)
+        if size:
+            run_concurrently([self._create] * size, self._return)
+
+    def _create(self):
+        name = NETWORK_PREFIX + "".join(
+            random.choices(string.ascii_lowercase + string.digits, k=10))
+        with span("create_network", network=name):
+            return self._client.networks.create(
+                name,
+                driver="bridge",
+                check_duplicate=True,
+                labels=owner_labels(),
+            )
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator:
+        with self._lock:
+            network = self._idle.pop() if self._idle else None
+        if network is None:
+            network = self._create()
+        try:
+            yield network
+        finally:
+            self._release(network)
+
+    def _release(self, network):
+        with span("check_network", network=network.name):
+            try:
+                network.reload()
+                attached = network.attrs.get("Containers") or {}
+            except Exception as e:
+                logger.warning("Could not inspect network %s: %s",
+                               network.name, e)
+                return
+        if attached:
+            # Removing the network would fail. It will be cleaned up along
+            # with its containers by a later run.
+            logger.warning("Network %s still has %d containers attached, "
+                           "and will not be reused", network.name,
+                           len(attached))
+            return
+        self._return(network)
+
+    def _return(self, network):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(network)
+                return
+        self._remove(network)
+
+    def _remove(self, network):
+        with span("remove_network", network=network.name):
+            try:
+                network.remove()
+            except Exception as e:
+                logger.warning("Could not remove network %s: %s",
+                               network.name, e)
+
+    def close(self):
+        "Remove idle networks. Networks still leased are removed on return."
+        atexit.unregister(self.close)
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for network in idle:
+            self._remove(network)
@@ -0,0 +1,38 @@
+import random
+import time
+
+
+class Backoff:
+    """
+    Produces delays between retries, starting at `initial` seconds and
+    growing by `multiplier` each time, up to `maximum` seconds. Each delay is
+    jittered downwards by up to half, so that concurrent pollers spread out.
+    """
+
+    def __init__(self, initial: float = 0.05, maximum: float = 2.0,
+                 multiplier: float = 2.0):
+        self._current = initial
+        self._maximum = maximum
+        self._multiplier = multiplier
+
+    def next_delay(self) -> float:
+        delay = random.uniform(self._current / 2, self._current)
+        self._current = min(self._current * self._multiplier, self._maximum)
+        return delay
+
+
+class Deadline:
+    "A point in time, a fixed timeout after the Deadline was created."
+
+    def __init__(self, timeout: float):
+        self._end = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(self._end - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self._end
+
+    def sleep(self, delay: float):
+        "Sleep for the given delay, without sleeping past the deadline."
+        time.sleep(min(delay, self.remaining()))
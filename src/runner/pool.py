@@ -0,0 +1,192 @@
+import contextlib
+import functools
+import logging
+import random
+import string
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import requests.adapters
+
+from . import containers
+from .concurrency import run_concurrently
+from .containers import (
+    LOCAL_ADDRESS, AggregatorContainer, ClientContainer, CollectorContainer,
+    DAPContainer,
+)
+from .models import ImageSet, RunOptions
+from .networks import NETWORK_PREFIX, NetworkPool
+
+IDENTIFIER_ALPHABET = string.ascii_lowercase + string.digits
+
+logger = logging.getLogger(__name__)
+
+
+class ContainerSet:
+    """
+    A Docker network, with one container running for each DAP role, as
+    specified by an ImageSet. If `pool_size` is given, each container keeps
+    up to that many connections open to its interop API. Otherwise, the
+    client container's pool fits `options.upload_concurrency` requests. If
+    a NetworkPool is given, the network is leased from it, rather than
+    created for this container set. Interop API requests are sent to the
+    containers' published ports at `host_address`, the address of the Docker
+    host.
+    """
+
+    def __init__(self, client, image_set: ImageSet,
+                 options: RunOptions = RunOptions(),
+                 pool_size: Optional[int] = None,
+                 networks: Optional[NetworkPool] = None,
+                 host_address: str = LOCAL_ADDRESS):
+        self.image_set = image_set
+        self.random_id = "".join(random.choices(IDENTIFIER_ALPHABET, k=10))
+        # Number of test cases that have been run using these containers.
+        self.uses = 0
+        self._stack = contextlib.ExitStack()
+        try:
+            self._start(client, options, pool_size, networks, host_address)
+        except BaseException:
+            self._stack.close()
+            raise
+
+    def _start(self, client, options: RunOptions, pool_size: Optional[int],
+               networks: Optional[NetworkPool], host_address: str):
+        random_id = self.random_id
+        image_set = self.image_set
+        if pool_size is None:
+            client_pool_size = options.upload_concurrency
+            pool_size = requests.adapters.DEFAULT_POOLSIZE
+        else:
+            client_pool_size = pool_size
+        if networks is not None:
+            network = self._stack.enter_context(networks.lease())
+        else:
+            network = self._stack.enter_context(
+                containers.container_network(
+                    client, f"{NETWORK_PREFIX}{random_id}")
+            )
+        # Start all four containers at once. If any of them fail to start,
+        # the others are still registered for cleanup before the error is
+        # raised.
+        (
+            self.client,
+            self.leader,
+            self.helper,
+            self.collector,
+        ) = run_concurrently(
+            [
+                functools.partial(
+                    containers.start_container,
+                    client,
+                    image_set.client,
+                    f"dap-client-{random_id}",
+                    network,
+                    ClientContainer,
+                    client_pool_size,
+                    host_address,
+                ),
+                functools.partial(
+                    containers.start_container,
+                    client,
+                    image_set.leader,
+                    f"dap-leader-{random_id}",
+                    network,
+                    AggregatorContainer,
+                    pool_size,
+                    host_address,
+                ),
+                functools.partial(
+                    containers.start_container,
+                    client,
+                    image_set.helper,
+                    f"dap-helper-{random_id}",
+                    network,
+                    AggregatorContainer,
+                    pool_size,
+                    host_address,
+                ),
+                functools.partial(
+                    containers.start_container,
+                    client,
+                    image_set.collector,
+                    f"dap-collector-{random_id}",
+                    network,
+                    CollectorContainer,
+                    pool_size,
+                    host_address,
+                ),
+            ],
+            lambda container: self._stack.callback(container.remove),
+        )
+
+    def roles(self) -> List[Tuple[str, DAPContainer]]:
+        return [
+            ("client", self.client),
+            ("leader", self.leader),
+            ("helper", self.helper),
+            ("collector", self.collector),
+        ]
+
+    def close(self):
+        for name, container in self.roles():
+            stats = container.connection_stats()
+            logger.info("%s %s: %d connections opened, %d reused",
+                        name, container.original_image, stats.opened,
+                        stats.reused)
+        self._stack.close()
+
+
+class ContainerPool:
+    """
+    Keeps container sets running between test cases, so that each ImageSet's
+    containers can be reused for multiple tasks. A container set is closed
+    instead of being returned to the pool if a test case using it fails, or
+    once it has been used `max_uses` times. If `max_uses` is None, container
+    sets may be reused any number of times.
+    """
+
+    def __init__(self, client, options: RunOptions = RunOptions(),
+                 max_uses: Optional[int] = None,
+                 networks: Optional[NetworkPool] = None,
+                 host_address: str = LOCAL_ADDRESS):
+        self._client = client
+        self._host_address = host_address
+        self._options = options
+        self._networks = networks
+        self._max_uses = max_uses
+        self._lock = threading.Lock()
+        self._idle: Dict[ImageSet, List[ContainerSet]] = {}
+
+    def acquire(self, image_set: ImageSet) -> ContainerSet:
+        with self._lock:
+            idle = self._idle.get(image_set)
+            container_set = idle.pop() if idle else None
+        if container_set is None:
+            container_set = ContainerSet(self._client, image_set,
+                                         self._options,
+                                         networks=self._networks,
+                                         host_address=self._host_address)
+        container_set.uses += 1
+        return container_set
+
+    def release(self, container_set: ContainerSet, healthy: bool):
+        if not healthy or (self._max_uses is not None and
+                           container_set.uses >= self._max_uses):
+            container_set.close()
+            return
+        with self._lock:
+            self._idle.setdefault(container_set.image_set, []).append(
+                container_set)
+
+    def close(self):
+        with self._lock:
+            idle = [container_set
+                    for container_sets in self._idle.values()
+                    for container_set in container_sets]
+            self._idle.clear()
+        for container_set in idle:
+            try:
+                container_set.close()
+            except Exception:
+                logger.exception("Error removing containers")
@@ -0,0 +1,155 @@
+"""
+A record of test results from previous runs, so that combinations of images
+and test cases that already passed need not be run again.
+
+Results are keyed by the IDs of the four images, rather than their names, so
+that a result no longer applies once any of its images has been updated. The
+key also covers the full definition of the test case, and the options that
+change what it exercises, so changing either invalidates its results.
+"""
+import dataclasses
+import enum
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from .files import atomic_write
+from .images import image_set_images
+from .models import ImageSet, RunOptions, TestCase
+
+# RunOptions fields that change what a test case exercises. Timeouts and log
+# limits are left out, since they do not change whether a test case passes
+# once it has passed.
+BEHAVIOR_OPTIONS = ("upload_concurrency", "upload_batch_size",
+                    "async_uploads", "seed", "corpus_directory")
+
+# Maximum number of results kept in the file. The oldest results are dropped
+# first, so that results for images that are no longer tested do not
+# accumulate forever.
+MAX_RESULTS = 10000
+
+# Minimum time in seconds between writes of the file while results are being
+# recorded. Remaining results are written by `close()`.
+FLUSH_INTERVAL = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class RerunPolicy(enum.Enum):
+    "Which test cases to run, given their results from previous runs."
+    # Run test cases unless they passed previously.
+    UNLESS_PASSED = "unless_passed"
+    # Only run test cases that failed previously.
+    FAILED = "failed"
+    # Run every test case.
+    ALL = "all"
+
+    def should_run(self, previous: Optional[bool]) -> bool:
+        if self is RerunPolicy.UNLESS_PASSED:
+            return previous is not True
+        elif self is RerunPolicy.FAILED:
+            return previous is False
+        return True
+
+
+def test_case_digest(test_case: TestCase) -> str:
+    "Hash the definition of a test case."
+    definition = json.dumps(dataclasses.asdict(test_case), sort_keys=True,
+                            default=str)
+    return hashlib.sha256(definition.encode()).hexdigest()
+
+
+def options_digest(options: RunOptions, reuse_containers: bool) -> str:
+    "Hash the options that change what a test case exercises."
+    behavior = {name: getattr(options, name) for name in BEHAVIOR_OPTIONS}
+    behavior["reuse_containers"] = reuse_containers
+    definition = json.dumps(behavior, sort_keys=True, default=str)
+    return hashlib.sha256(definition.encode()).hexdigest()
+
+
+def result_key(client, image_set: ImageSet, test_case: TestCase,
+               options: RunOptions = RunOptions(),
+               reuse_containers: bool = False) -> Optional[str]:
+    """
+    Compute the key for the result of running a test case with an image set
+    and options, from the IDs of the local images. Returns None if any image
+    is not present locally, since its ID is not known until it has been
+    pulled.
+    """
+    image_ids = []
+    for image in image_set_images(image_set):
+        try:
+            image_ids.append(client.images.get(image).id)
+        except Exception:
+            return None
+    return "/".join(image_ids + [test_case_digest(test_case),
+                                 options_digest(options, reuse_containers)])
+
+
+class ResultCache:
+    """
+    A JSON file recording whether each test case passed, keyed by result_key.
+    The file holds up to MAX_RESULTS of the most recent results. It is
+    written at most every FLUSH_INTERVAL seconds as results are recorded, and
+    `close()` must be called to write the rest.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_write = time.monotonic()
+        self._entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                logger.warning("Ignoring malformed result cache %s", path)
+
+    def get(self, key: str) -> Optional[bool]:
+        """
+        Return whether the test case passed the last time it was run, or None
+        if there is no result for it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry["passed"]
+
+    def record(self, key: str, image_set: ImageSet, test_case: TestCase,
+               passed: bool):
+        with self._lock:
+            # Keep entries in the order they were recorded.
+            self._entries.pop(key, None)
+            self._entries[key] = {
+                "passed": passed,
+                "recorded_at": time.time(),
+                # The following are informational only.
+                "images": list(image_set_images(image_set)),
+                "test_case": test_case.name,
+            }
+            self._dirty = True
+            if time.monotonic() - self._last_write >= FLUSH_INTERVAL:
+                self._write()
+
+    def _write(self):
+        if len(self._entries) > MAX_RESULTS:
+            newest = sorted(self._entries.items(),
+                            key=lambda item: item[1]["recorded_at"])
+            self._entries = dict(newest[-MAX_RESULTS:])
+        with atomic_write(self._path) as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        self._dirty = False
+        self._last_write = time.monotonic()
+
+    def close(self):
+        "Write any results not yet written to the file."
+        with self._lock:
+            if self._dirty:
+                self._write()
@@ -0,0 +1,191 @@
+"""
+Scheduling test cases across multiple Docker hosts.
+
+Each host runs up to a fixed number of work items at once. Items are taken
+from a shared queue in order, so faster hosts take on more of them. If an
+item fails and its host no longer responds, the host is taken out of
+rotation, and the item is put back on the queue to be run on another host.
+"""
+import collections
+import concurrent.futures
+import logging
+import threading
+from typing import (
+    Callable, Deque, Generic, List, Optional, Sequence, Tuple, TypeVar,
+)
+
+from .containers import LOCAL_ADDRESS
+from .images import ImagePuller
+from .networks import NetworkPool
+from .pool import ContainerPool
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyHostsError(Exception):
+    "All Docker hosts became unhealthy before a work item could be run."
+
+
+class DockerHost:
+    """
+    A Docker daemon that test cases can be run on, with its own container
+    pool, network pool, and image puller, if those are in use. Ports
+    published by the daemon are reached at `address`.
+    """
+
+    def __init__(self, name: str, client, slots: int,
+                 pool: Optional[ContainerPool] = None,
+                 puller: Optional[ImagePuller] = None,
+                 networks: Optional[NetworkPool] = None,
+                 address: str = LOCAL_ADDRESS):
+        self.name = name
+        self.client = client
+        self.address = address
+        # Maximum number of work items run on this host at once.
+        self.slots = slots
+        self.pool = pool
+        self.puller = puller
+        self.networks = networks
+        self.healthy = True
+
+    def check_health(self) -> bool:
+        "Check whether the Docker daemon is still responding."
+        try:
+            self.client.ping()
+            return True
+        except Exception as e:
+            logger.warning("Docker host %s is unhealthy: %s", self.name, e)
+            return False
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+        # Containers from the pool have been removed, so their networks are
+        # idle.
+        if self.networks is not None:
+            self.networks.close()
+        if self.puller is not None:
+            self.puller.close()
+
+
+class Scheduler(Generic[T, R]):
+    """
+    Runs `run(host, item)` for each work item, on worker threads for each
+    slot of each host. If `failed(result)` is true, and the host fails its
+    health check, the item is rescheduled on another host. Results are
+    delivered through the futures returned by `futures()`, in the same order
+    as the items.
+    """
+
+    def __init__(self, hosts: Sequence[DockerHost], items: Sequence[T],
+                 run: Callable[[DockerHost, T], R],
+                 failed: Callable[[R], bool]):
+        self._hosts = list(hosts)
+        self._run = run
+        self._failed = failed
+        self._condition = threading.Condition()
+        self._queue: Deque[Tuple[T, concurrent.futures.Future]] = \
+            collections.deque()
+        self._futures: List[concurrent.futures.Future] = []
+        for item in items:
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            self._futures.append(future)
+            self._queue.append((item, future))
+        self._stopping = False
+        self._busy = 0
+        self._threads = []
+        for host in self._hosts:
+            if not host.check_health():
+                host.healthy = False
+                continue
+            for slot in range(host.slots):
+                thread = threading.Thread(
+                    target=self._work, args=(host,),
+                    name=f"{host.name}-{slot}", daemon=True)
+                self._threads.append(thread)
+        self._check_abandoned()
+        for thread in self._threads:
+            thread.start()
+
+    def futures(self) -> List[concurrent.futures.Future]:
+        return list(self._futures)
+
+    def _take(self, host: DockerHost
+              ) -> Optional[Tuple[T, concurrent.futures.Future]]:
+        with self._condition:
+            while True:
+                if self._stopping or not host.healthy:
+                    return None
+                while self._queue:
+                    item, future = self._queue.popleft()
+                    # Futures are left pending while their items run, since
+                    # an item may be put back on the queue.
+                    if not future.cancelled():
+                        self._busy += 1
+                        return item, future
+                # Items being run elsewhere may yet be put back on the queue.
+                if not self._busy:
+                    return None
+                self._condition.wait()
+
+    def _work(self, host: DockerHost):
+        while True:
+            taken = self._take(host)
+            if taken is None:
+                return
+            item, future = taken
+            try:
+                result = self._run(host, item)
+            except Exception as e:
+                _resolve(future, exception=e)
+                self._finish()
+                continue
+            if self._failed(result) and not host.check_health():
+                logger.warning("Rescheduling work from unhealthy Docker "
+                               "host %s", host.name)
+                with self._condition:
+                    host.healthy = False
+                    self._queue.appendleft((item, future))
+                self._finish()
+                self._check_abandoned()
+                return
+            _resolve(future, result=result)
+            self._finish()
+
+    def _finish(self):
+        with self._condition:
+            self._busy -= 1
+            self._condition.notify_all()
+
+    def _check_abandoned(self):
+        "Fail queued work items if no healthy hosts remain to run them."
+        with self._condition:
+            if any(host.healthy for host in self._hosts):
+                return
+            while self._queue:
+                _, future = self._queue.popleft()
+                _resolve(future, exception=NoHealthyHostsError(
+                    "No healthy Docker hosts remain"))
+            self._condition.notify_all()
+
+    def stop(self):
+        "Stop starting new work items, and wait for running ones to finish."
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+def _resolve(future: concurrent.futures.Future, result=None,
+             exception: Optional[BaseException] = None):
+    "Set the result of a future, unless it was cancelled."
+    if future.cancelled():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
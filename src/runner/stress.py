@@ -0,0 +1,267 @@
+"""
+Stress tests of DAP implementations with many tasks active at once, run with
+`python -m runner stress`.
+
+For each combination of images, one set of containers is started, and
+`--tasks` tasks are provisioned on it, cycling through the VDAFs and query
+types of the selected test cases. Once every task has been set up, reports
+are uploaded to all of them, and they are collected, concurrently. Each
+task's result is checked separately. Results are written as one JSON object
+per line, per image set.
+"""
+import argparse
+import concurrent.futures
+import dataclasses
+import datetime
+import itertools
+import json
+import sys
+import time
+import traceback
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+from . import provision_task, save_error_logs, upload_and_collect
+from .benchmark import latency_summary
+from .cli import (
+    add_image_arguments, add_measurement_arguments, add_upload_arguments,
+    add_verbose_argument, check_positive, configure_logging, docker_client,
+    docker_host_address, load_image_sets, run_options,
+)
+from .containers import LOCAL_ADDRESS, encode_base64url
+from .images import ImagePuller, image_set_images
+from .models import ImageSet, ProvisionedTask, RunOptions, TestCase
+from .networks import cleanup_orphaned_networks
+from .pool import ContainerSet
+from .test_cases import TEST_CASES
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass
+class TaskResult:
+    test_case: str
+    task_id: Optional[str] = None
+    passed: bool = False
+    error: Optional[str] = None
+    # Time in seconds to set up the task in each container.
+    provision_latency: Optional[float] = None
+    # Time in seconds from starting uploads to receiving the aggregate result.
+    task_latency: Optional[float] = None
+    # Time in seconds from starting collection to receiving the aggregate
+    # result.
+    collection_latency: Optional[float] = None
+
+
+def stress_test_cases(test_cases: Sequence[TestCase], tasks: int,
+                      uploads: Optional[int]) -> List[TestCase]:
+    """
+    Choose a test case for each task, cycling through the given test cases,
+    with about `uploads` measurements each if given.
+    """
+    chosen = list(itertools.islice(itertools.cycle(test_cases), tasks))
+    if uploads is not None:
+        chosen = [test_case.with_measurement_count(uploads)
+                  for test_case in chosen]
+    return chosen
+
+
+def _run_all(functions: Sequence[Callable[[], T]]
+             ) -> List[Tuple[Optional[T], Optional[Exception]]]:
+    """
+    Call each function on its own thread, and return the result or exception
+    from each, in order.
+    """
+    outcomes: List[Tuple[Optional[T], Optional[Exception]]] = []
+    if not functions:
+        return outcomes
+    with concurrent.futures.ThreadPoolExecutor(len(functions)) as executor:
+        futures = [executor.submit(function) for function in functions]
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                assert isinstance(error, Exception)
+                outcomes.append((None, error))
+            else:
+                outcomes.append((future.result(), None))
+    return outcomes
+
+
+def run_tasks(container_set: ContainerSet, test_cases: Sequence[TestCase],
+              options: RunOptions) -> List[TaskResult]:
+    """
+    Provision a task for each test case on one set of containers, and then
+    upload to and collect all of them concurrently.
+    """
+    results = [TaskResult(test_case.name) for test_case in test_cases]
+
+    def provision(result: TaskResult,
+                  test_case: TestCase) -> Callable[[], ProvisionedTask]:
+        def run():
+            started = time.perf_counter()
+            task = provision_task(container_set.client, container_set.leader,
+                                  container_set.helper,
+                                  container_set.collector, test_case, options)
+            result.provision_latency = time.perf_counter() - started
+            result.task_id = encode_base64url(task.task_id)
+            return task
+        return run
+
+    provisioned = _run_all([provision(result, test_case)
+                            for result, test_case in zip(results,
+                                                         test_cases)])
+
+    def upload(result: TaskResult, task: ProvisionedTask,
+               test_case: TestCase) -> Callable[[], None]:
+        def run():
+            started = time.perf_counter()
+            metrics = upload_and_collect(container_set.client,
+                                         container_set.collector, task,
+                                         test_case, options)
+            result.task_latency = time.perf_counter() - started
+            result.collection_latency = metrics.collection_latency
+            result.passed = True
+        return run
+
+    uploads = []
+    for result, test_case, (task, error) in zip(results, test_cases,
+                                                provisioned):
+        if error is not None:
+            result.error = f"Provisioning failed: {error}"
+        else:
+            assert task is not None
+            uploads.append((result, upload(result, task, test_case)))
+    for (result, _), (_, error) in zip(
+            uploads, _run_all([function for _, function in uploads])):
+        if error is not None:
+            result.error = str(error)
+    return results
+
+
+def stress_image_set(client, image_set: ImageSet,
+                     test_cases: Sequence[TestCase], options: RunOptions,
+                     host_address: str = LOCAL_ADDRESS) -> dict:
+    # Every task may have requests in flight to a container at once.
+    container_set = ContainerSet(
+        client, image_set, options,
+        pool_size=len(test_cases) * options.upload_concurrency,
+        host_address=host_address)
+    for role, container in container_set.roles():
+        container.trace_tags = {"role": role, "stress": "true"}
+    started_at = datetime.datetime.now(datetime.timezone.utc) - \
+        datetime.timedelta(seconds=1)
+    try:
+        started = time.perf_counter()
+        results = run_tasks(container_set, test_cases, options)
+        elapsed = time.perf_counter() - started
+        failed = [result for result in results if not result.passed]
+        if failed:
+            # The logs cover every task, so save them once, under the name
+            # of the first test case that failed.
+            test_case = next(
+                test_case
+                for test_case, result in zip(test_cases, results)
+                if not result.passed)
+            directory = save_error_logs(container_set, test_case,
+                                        started_at, options.max_log_bytes)
+            print(f"Saved logs from failed tasks to {directory}",
+                  file=sys.stderr)
+    finally:
+        container_set.close()
+
+    def latencies(field: str) -> List[float]:
+        return [getattr(result, field) for result in results
+                if getattr(result, field) is not None]
+
+    return {
+        "passed": len(results) - len(failed),
+        "failed": len(failed),
+        "elapsed": elapsed,
+        "provision_latency": latency_summary(latencies("provision_latency")),
+        "task_latency": latency_summary(latencies("task_latency")),
+        "collection_latency": latency_summary(
+            latencies("collection_latency")),
+        "tasks": [dataclasses.asdict(result) for result in results],
+    }
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="python -m runner stress",
+        description="Run many tasks concurrently on one set of containers. "
+        "Results are written to standard output as one JSON object per image "
+        "set.")
+    add_image_arguments(parser)
+    parser.add_argument("--tasks", type=int, default=8,
+                        help="Number of tasks provisioned on each set of "
+                        "containers. Defaults to 8.")
+    parser.add_argument("--uploads", type=int,
+                        help="Number of reports uploaded to each task, "
+                        "rounded down to a whole number of batches. Defaults "
+                        "to each test case's own number of measurements.")
+    add_upload_arguments(parser)
+    add_measurement_arguments(parser)
+    add_verbose_argument(parser)
+    parser.add_argument("test_case_filter", metavar="FILTER", nargs="*",
+                        help="Filter to select the test cases whose VDAFs "
+                        "and query types are used. By default, all test "
+                        "cases are used.")
+    args = parser.parse_args(argv)
+
+    configure_logging(args.verbose)
+
+    check_positive(args.tasks, "--tasks")
+    if args.uploads is not None:
+        check_positive(args.uploads, "--uploads")
+    check_positive(args.upload_concurrency, "--upload-concurrency")
+    check_positive(args.upload_batch_size, "--upload-batch-size")
+    check_positive(args.pull_jobs, "--pull-jobs")
+
+    selected = [test_case for test_case in TEST_CASES
+                if not args.test_case_filter or
+                any(filter in test_case.name
+                    for filter in args.test_case_filter)]
+    if not selected:
+        print("No test cases match the filters", file=sys.stderr)
+        sys.exit(2)
+    test_cases = stress_test_cases(selected, args.tasks, args.uploads)
+
+    client = docker_client(args)
+    cleanup_orphaned_networks(client)
+
+    image_sets, _, readiness_timeouts = load_image_sets(args)
+    options = run_options(args, readiness_timeouts)
+
+    if args.pull:
+        puller = ImagePuller(client, args.pull_jobs, args.pull_cache)
+        try:
+            images = sorted({image for image_set in image_sets
+                             for image in image_set_images(image_set)})
+            puller.pull(images)
+            puller.wait(images)
+        finally:
+            puller.close()
+
+    any_failure = False
+    for image_set in image_sets:
+        record: dict = {
+            "client": image_set.client,
+            "leader": image_set.leader,
+            "helper": image_set.helper,
+            "collector": image_set.collector,
+            "task_count": args.tasks,
+            "upload_concurrency": options.upload_concurrency,
+            "upload_batch_size": options.upload_batch_size,
+        }
+        try:
+            record.update(stress_image_set(client, image_set, test_cases,
+                                           options,
+                                           docker_host_address(args)))
+            any_failure = any_failure or record["failed"] > 0
+        except Exception as e:
+            traceback.print_exc()
+            record["error"] = str(e)
+            any_failure = True
+        print(json.dumps(record), flush=True)
+
+    if any_failure:
+        sys.exit(1)
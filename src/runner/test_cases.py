@@ -153,4 +153,35 @@ TEST_CASES = [
         10,
         QueryType.FIXED_SIZE,
     ),
+    TestCase(
+        "fixed_prio3_count_multi_batch",
+        {"type": "Prio3Count"},
+        1000,
+        QueryType.FIXED_SIZE,
+        batch_count=10,
+    ),
+    TestCase(
+        "fixed_prio3_sum_8_bits_concurrent_collections",
+        {
+            "type": "Prio3Sum",
+            "bits": "8",
+        },
+        1000,
+        QueryType.FIXED_SIZE,
+        batch_count=10,
+        concurrent_collections=5,
+    ),
+    TestCase(
+        "fixed_prio3_histogram_12_buckets_many_batches",
+        {
+            "type": "Prio3Histogram",
+            "length": "12",
+            "chunk_length": "4",
+        },
+        20000,
+        QueryType.FIXED_SIZE,
+        collection_timeout=600.0,
+        batch_count=100,
+        concurrent_collections=10,
+    ),
 ]
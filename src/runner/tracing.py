@@ -0,0 +1,80 @@
+"""
+Timing traces of test runs, written in the Chrome trace event format. Trace
+files can be loaded in chrome://tracing or https://ui.perfetto.dev/.
+
+Tracing is disabled unless a Tracer has been installed with `set_tracer()`.
+While disabled, `span()` returns a shared no-op context manager.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import ContextManager, Optional
+
+_NULL_SPAN: ContextManager[None] = contextlib.nullcontext()
+
+
+class Tracer:
+    "Writes spans to a trace file, as complete events."
+
+    def __init__(self, path: str):
+        self._file = open(path, "w")
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._file.write("[\n")
+        self._first = True
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            self._write({
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": args,
+            })
+
+    def _write(self, event: dict):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            if not self._first:
+                self._file.write(",\n")
+            self._first = False
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.write("\n]\n")
+            self._file.close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global _tracer
+    _tracer = tracer
+
+
+def span(name: str, **args) -> ContextManager[None]:
+    """
+    Return a context manager that records a span with the given name and
+    arguments, covering the time spent inside it.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, **args)
@@ -0,0 +1,254 @@
+import asyncio
+import concurrent.futures
+import itertools
+import time
+from typing import (
+    Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union,
+)
+
+from .async_containers import AsyncClientContainer
+from .containers import ClientContainer
+
+# Maximum number of error messages included in an UploadError's message.
+MAX_REPORTED_ERRORS = 5
+
+# Maximum number of per-report errors kept in an UploadError, so that memory
+# use stays bounded even if every upload fails.
+MAX_RETAINED_ERRORS = 1000
+
+
+class UploadError(Exception):
+    "An error from one or more report uploads."
+
+    def __init__(self, errors: List[Tuple[int, Exception]], failed: int,
+                 total: int):
+        self.errors = errors
+        self.failed = failed
+        self.total = total
+        details = "\n".join(
+            f"report {index}: {error}"
+            for index, error in errors[:MAX_REPORTED_ERRORS]
+        )
+        if failed > MAX_REPORTED_ERRORS:
+            details += f"\n(and {failed - MAX_REPORTED_ERRORS} more)"
+        super().__init__(
+            f"{failed} out of {total} report uploads failed:\n{details}"
+        )
+
+
+def _chunks(measurements: Iterable[Union[str, List[str]]], size: int
+            ) -> Iterator[List[Union[str, List[str]]]]:
+    iterator = iter(measurements)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _UploadTally:
+    "Counts acknowledged and failed reports, and keeps some of the errors."
+
+    def __init__(self):
+        self.acknowledged = 0
+        self.errors: List[Tuple[int, Exception]] = []
+        self.failed = 0
+        self.total = 0
+
+    def record(self, start: int, chunk: List[Union[str, List[str]]],
+               error: Union[BaseException, None]):
+        if error is not None:
+            assert isinstance(error, Exception)
+            # A failed batch request fails every report it carried.
+            self.failed += len(chunk)
+            for index in range(start, start + len(chunk)):
+                if len(self.errors) < MAX_RETAINED_ERRORS:
+                    self.errors.append((index, error))
+        else:
+            self.acknowledged += len(chunk)
+
+    def finish(self) -> int:
+        "Raise an UploadError if any uploads failed."
+        if self.errors:
+            self.errors.sort(key=lambda error: error[0])
+            raise UploadError(self.errors, self.failed, self.total)
+        return self.acknowledged
+
+
+def upload_measurements(client_container: ClientContainer, task_id: bytes,
+                        leader_endpoint: str, helper_endpoint: str,
+                        vdaf: dict,
+                        measurements: Iterable[Union[str, List[str]]],
+                        time_precision: int, concurrency: int = 1,
+                        batch_size: int = 1,
+                        latencies: Optional[List[float]] = None,
+                        ) -> int:
+    """
+    Upload each measurement through the client container, with up to
+    `concurrency` requests in flight at once. If `batch_size` is greater than
+    one and the client supports batch uploads, measurements are sent in
+    batches of up to that many per request. Measurements are consumed from
+    the iterable only as fast as they are uploaded, and are not retained once
+    their upload completes.
+
+    Returns the number of measurements that were acknowledged by the client.
+    If any upload fails, the remaining uploads are still attempted, and then
+    an UploadError describing the failures is raised.
+
+    If a `latencies` list is provided, the duration in seconds of each
+    successful upload request is appended to it.
+    """
+    if batch_size > 1 and not client_container.supports_batch_upload(
+            task_id, leader_endpoint, helper_endpoint, vdaf, time_precision):
+        batch_size = 1
+
+    tally = _UploadTally()
+
+    def upload(chunk: List[Union[str, List[str]]]):
+        start = time.perf_counter()
+        if batch_size > 1:
+            client_container.upload_batch(
+                task_id,
+                leader_endpoint,
+                helper_endpoint,
+                vdaf,
+                chunk,
+                None,
+                time_precision,
+            )
+        else:
+            client_container.upload(
+                task_id,
+                leader_endpoint,
+                helper_endpoint,
+                vdaf,
+                chunk[0],
+                None,
+                time_precision,
+            )
+        if latencies is not None:
+            latencies.append(time.perf_counter() - start)
+
+    chunks = _chunks(measurements, batch_size)
+    if concurrency <= 1:
+        for chunk in chunks:
+            start = tally.total
+            tally.total += len(chunk)
+            try:
+                upload(chunk)
+            except Exception as e:
+                tally.record(start, chunk, e)
+            else:
+                tally.record(start, chunk, None)
+    else:
+        # Bound the number of outstanding uploads, so that measurements are
+        # consumed from the iterable only as fast as they can be uploaded,
+        # and memory use does not grow with the number of measurements.
+        window = concurrency * 2
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            pending: Set[concurrent.futures.Future] = set()
+            submitted: Dict[
+                concurrent.futures.Future,
+                Tuple[int, List[Union[str, List[str]]]],
+            ] = {}
+
+            def reap(futures):
+                for future in futures:
+                    start, chunk = submitted.pop(future)
+                    tally.record(start, chunk, future.exception())
+
+            for chunk in chunks:
+                start = tally.total
+                tally.total += len(chunk)
+                if len(pending) >= window:
+                    done, pending = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    reap(done)
+                future = executor.submit(upload, chunk)
+                submitted[future] = (start, chunk)
+                pending.add(future)
+            done, pending = concurrent.futures.wait(pending)
+            reap(done)
+
+    return tally.finish()
+
+
+async def upload_measurements_async(
+        client_container: AsyncClientContainer, task_id: bytes,
+        leader_endpoint: str, helper_endpoint: str, vdaf: dict,
+        measurements: Iterable[Union[str, List[str]]], time_precision: int,
+        concurrency: int = 1, batch_size: int = 1,
+        latencies: Optional[List[float]] = None) -> int:
+    """
+    Like `upload_measurements()`, but sends requests from the running event
+    loop, with up to `concurrency` requests in flight at once as tasks
+    rather than threads.
+    """
+    if batch_size > 1 and not await client_container.supports_batch_upload(
+            task_id, leader_endpoint, helper_endpoint, vdaf, time_precision):
+        batch_size = 1
+
+    tally = _UploadTally()
+
+    async def upload(start: int, chunk: List[Union[str, List[str]]]):
+        began = time.perf_counter()
+        try:
+            if batch_size > 1:
+                await client_container.upload_batch(
+                    task_id, leader_endpoint, helper_endpoint, vdaf, chunk,
+                    None, time_precision)
+            else:
+                await client_container.upload(
+                    task_id, leader_endpoint, helper_endpoint, vdaf,
+                    chunk[0], None, time_precision)
+        except Exception as e:
+            tally.record(start, chunk, e)
+            return
+        if latencies is not None:
+            latencies.append(time.perf_counter() - began)
+        tally.record(start, chunk, None)
+
+    # As with threads, only take measurements from the iterable as fast as
+    # they can be uploaded.
+    pending: Set[asyncio.Future] = set()
+    try:
+        for chunk in _chunks(measurements, batch_size):
+            if len(pending) >= concurrency:
+                _done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.ensure_future(upload(tally.total, chunk)))
+            tally.total += len(chunk)
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return tally.finish()
+
+
+def upload_measurements_with_asyncio(
+        client_container: ClientContainer, task_id: bytes,
+        leader_endpoint: str, helper_endpoint: str, vdaf: dict,
+        measurements: Iterable[Union[str, List[str]]], time_precision: int,
+        concurrency: int = 1, batch_size: int = 1,
+        latencies: Optional[List[float]] = None) -> int:
+    """
+    Like `upload_measurements()`, but runs `upload_measurements_async()` in
+    a new event loop on the calling thread, instead of starting a thread per
+    concurrent upload.
+    """
+    async_container = AsyncClientContainer(client_container, concurrency)
+
+    async def run() -> int:
+        try:
+            return await upload_measurements_async(
+                async_container, task_id, leader_endpoint, helper_endpoint,
+                vdaf, measurements, time_precision, concurrency, batch_size,
+                latencies)
+        finally:
+            await async_container.aclose()
+
+    return asyncio.run(run())
@@ -1,28 +1,17 @@
+import array
 import random
 import secrets
-from typing import List, Union
+import sys
+from typing import Iterator, List, Optional, Union
 
+try:
+    import numpy  # type: ignore
+except ModuleNotFoundError:
+    numpy = None  # type: ignore
 
-def generate_measurement(vdaf_dict: dict) -> Union[str, List[str]]:
-    """
-    Randomly generate a valid measurement for the given VDAF.
-    """
-    vdaf_type = vdaf_dict["type"]
-    if vdaf_type == "Prio3Count":
-        return str(random.randint(0, 1))
-    elif vdaf_type == "Prio3Sum":
-        bits = int(vdaf_dict["bits"])
-        return str(random.randrange(0, 1 << bits))
-    elif vdaf_type == "Prio3SumVec":
-        length = int(vdaf_dict["length"])
-        bits = int(vdaf_dict["bits"])
-        limit = 1 << bits
-        return [str(random.randrange(0, limit)) for _ in range(length)]
-    elif vdaf_type == "Prio3Histogram":
-        length = int(vdaf_dict["length"])
-        return str(random.randrange(0, length))
-    else:
-        raise Exception(f"Unsupported VDAF: {vdaf_type}")
+# Number of measurements converted to the wire format at a time, when
+# iterating over a MeasurementBatch.
+WIRE_CHUNK_SIZE = 4096
 
 
 def aggregate_measurements(vdaf_dict: dict, _aggregation_param: None,
@@ -63,6 +52,226 @@ def aggregate_measurements(vdaf_dict: dict, _aggregation_param: None,
     raise Exception(f"Unsupported VDAF: {vdaf_type}")
 
 
+def vector_length(vdaf_dict: dict) -> int:
+    "Number of integers in each measurement, or zero for scalar VDAFs."
+    vdaf_type = vdaf_dict["type"]
+    if vdaf_type in ("Prio3Count", "Prio3Sum", "Prio3Histogram"):
+        return 0
+    elif vdaf_type == "Prio3SumVec":
+        return int(vdaf_dict["length"])
+    raise Exception(f"Unsupported VDAF: {vdaf_type}")
+
+
+class MeasurementBatch:
+    """
+    A batch of measurements for a VDAF, stored compactly as integers. When
+    NumPy is installed, measurements are kept in a NumPy array, of shape
+    (count,) for scalar VDAFs, or (count, length) for Prio3SumVec. Otherwise,
+    they are kept in a flat `array.array` of unsigned 64-bit integers.
+
+    Iterating over a batch yields measurements in the wire format accepted by
+    the client interop API, converting them lazily.
+    """
+
+    def __init__(self, vdaf_dict: dict, values):
+        self.vdaf_dict = vdaf_dict
+        self.values = values
+        self._width = vector_length(vdaf_dict)
+
+    def __len__(self) -> int:
+        if numpy is not None and isinstance(self.values, numpy.ndarray):
+            return self.values.shape[0]
+        return len(self.values) // max(self._width, 1)
+
+    def __iter__(self) -> Iterator[Union[str, List[str]]]:
+        width = self._width
+        for start in range(0, len(self), WIRE_CHUNK_SIZE):
+            end = min(start + WIRE_CHUNK_SIZE, len(self))
+            if numpy is not None and isinstance(self.values, numpy.ndarray):
+                chunk = self.values[start:end].tolist()
+                if width:
+                    for row in chunk:
+                        yield [str(value) for value in row]
+                else:
+                    for value in chunk:
+                        yield str(value)
+            elif width:
+                for i in range(start, end):
+                    yield [str(value) for value in
+                           self.values[i * width:(i + 1) * width]]
+            else:
+                for value in self.values[start:end]:
+                    yield str(value)
+
+    def aggregate(self) -> Union[str, List[str]]:
+        """
+        Compute the expected aggregate result over all measurements in the
+        batch, in the wire format returned by the collector interop API.
+        """
+        return format_aggregate(self.totals())
+
+    def totals(self) -> Union[int, List[int]]:
+        "Compute the aggregate result over all measurements, as integers."
+        vdaf_type = self.vdaf_dict["type"]
+        if vdaf_type == "Prio3Histogram":
+            length = int(self.vdaf_dict["length"])
+            if numpy is not None and isinstance(self.values, numpy.ndarray):
+                return numpy.bincount(self.values, minlength=length).tolist()
+            counts = [0] * length
+            for value in self.values:
+                counts[value] += 1
+            return counts
+        elif numpy is not None and isinstance(self.values, numpy.ndarray):
+            return _sum_uint64(self.values)
+        elif self._width:
+            return [sum(self.values[i::self._width])
+                    for i in range(self._width)]
+        else:
+            return sum(self.values)
+
+    def to_bytes(self) -> bytes:
+        "Serialize all values as little-endian unsigned 64-bit integers."
+        if numpy is not None and isinstance(self.values, numpy.ndarray):
+            return self.values.astype("<u8").tobytes()
+        values = array.array("Q", self.values)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tobytes()
+
+
+def format_aggregate(totals: Union[int, List[int]]) -> Union[str, List[str]]:
+    "Convert an aggregate result to the wire format."
+    if isinstance(totals, list):
+        return [str(total) for total in totals]
+    return str(totals)
+
+
+def parse_aggregate(result: Union[str, List[str]]
+                    ) -> Union[int, List[int]]:
+    "Convert an aggregate result from the wire format to integers."
+    if isinstance(result, list):
+        return [int(total) for total in result]
+    return int(result)
+
+
+def add_aggregates(a: Union[int, List[int]], b: Union[int, List[int]]
+                   ) -> Union[int, List[int]]:
+    "Add two aggregate results for the same VDAF, given as integers."
+    if isinstance(a, list) and isinstance(b, list):
+        return [x + y for x, y in zip(a, b)]
+    assert isinstance(a, int) and isinstance(b, int)
+    return a + b
+
+
+def _sum_uint64(values):
+    """
+    Sum a NumPy array of unsigned 64-bit integers along its first axis,
+    without overflow. The low and high 32-bit halves are summed separately,
+    which is exact for up to 2^32 rows, and then combined as Python integers.
+    """
+    low = numpy.sum(values & numpy.uint64(0xFFFFFFFF), axis=0,
+                    dtype=numpy.uint64)
+    high = numpy.sum(values >> numpy.uint64(32), axis=0, dtype=numpy.uint64)
+    if values.ndim == 1:
+        return int(low) + (int(high) << 32)
+    return [lo + (hi << 32) for lo, hi in zip(low.tolist(), high.tolist())]
+
+
+def make_rng(seed: Optional[int] = None):
+    """
+    Create a random number generator for `generate_measurements()`. This is a
+    NumPy Generator if NumPy is installed, or a `random.Random` otherwise. If
+    a seed is given, the same measurements will be generated each time, given
+    the same choice of generator.
+    """
+    if numpy is not None:
+        return numpy.random.default_rng(seed)
+    return random.Random(seed)
+
+
+def generate_measurements(vdaf_dict: dict, count: int,
+                          rng=None) -> MeasurementBatch:
+    """
+    Randomly generate a batch of `count` valid measurements for the given
+    VDAF. This uses NumPy to generate all measurements at once, if it is
+    installed. The random number generator should come from `make_rng()`.
+    """
+    if rng is None:
+        rng = make_rng()
+    vdaf_type = vdaf_dict["type"]
+    width = vector_length(vdaf_dict)
+    if vdaf_type == "Prio3Count":
+        bits = 1
+    elif vdaf_type in ("Prio3Sum", "Prio3SumVec"):
+        bits = int(vdaf_dict["bits"])
+    elif vdaf_type == "Prio3Histogram":
+        length = int(vdaf_dict["length"])
+
+    if numpy is not None and isinstance(rng, numpy.random.Generator):
+        if vdaf_type == "Prio3Histogram":
+            values = rng.integers(0, length, size=count, dtype=numpy.int64)
+        else:
+            shape = (count, width) if width else (count,)
+            values = rng.integers(0, 1 << bits, size=shape,
+                                  dtype=numpy.uint64)
+        return MeasurementBatch(vdaf_dict, values)
+
+    if vdaf_type == "Prio3Histogram":
+        fallback = array.array("Q", (rng.randrange(0, length)
+                                     for _ in range(count)))
+    else:
+        fallback = array.array("Q", (rng.getrandbits(bits)
+                                     for _ in range(count * max(width, 1))))
+    return MeasurementBatch(vdaf_dict, fallback)
+
+
+def generate_measurement_stream(vdaf_dict: dict, count: int,
+                                seed: Optional[int] = None,
+                                accumulator: Optional["Accumulator"] = None
+                                ) -> Iterator[Union[str, List[str]]]:
+    """
+    Lazily generate `count` random measurements for the given VDAF, in the
+    wire format. Measurements are generated in batches of WIRE_CHUNK_SIZE, so
+    memory use does not depend on `count`. If an accumulator is given, each
+    batch is added to it as it is generated.
+    """
+    rng = make_rng(seed)
+    for start in range(0, count, WIRE_CHUNK_SIZE):
+        batch = generate_measurements(
+            vdaf_dict, min(WIRE_CHUNK_SIZE, count - start), rng)
+        if accumulator is not None:
+            accumulator.add_batch(batch)
+        yield from batch
+
+
+class Accumulator:
+    """
+    Computes the expected aggregate result for a VDAF incrementally, as
+    batches of measurements are added.
+    """
+
+    def __init__(self, vdaf_dict: dict):
+        self.vdaf_dict = vdaf_dict
+        self.count = 0
+        vdaf_type = vdaf_dict["type"]
+        self._totals: Union[int, List[int]]
+        if vdaf_type in ("Prio3Count", "Prio3Sum"):
+            self._totals = 0
+        elif vdaf_type in ("Prio3SumVec", "Prio3Histogram"):
+            self._totals = [0] * int(vdaf_dict["length"])
+        else:
+            raise Exception(f"Unsupported VDAF: {vdaf_type}")
+
+    def add_batch(self, batch: MeasurementBatch):
+        "Add every measurement in a batch, without converting them to strings."
+        self.count += len(batch)
+        self._totals = add_aggregates(self._totals, batch.totals())
+
+    def result(self) -> Union[str, List[str]]:
+        "Return the aggregate result over all measurements added so far."
+        return format_aggregate(self._totals)
+
+
 def generate_vdaf_verify_key(vdaf_dict: dict) -> bytes:
     """Generate a verification key for a VDAF"""
     vdaf_type = vdaf_dict["type"]
@@ -0,0 +1,225 @@
+import asyncio
+import socket
+import unittest
+from typing import List
+from unittest import mock
+
+from runner import provision_task
+from runner.async_containers import (
+    AsyncAggregatorContainer, AsyncClientContainer, AsyncCollectorContainer,
+    HTTPConnectionPool,
+)
+from runner.containers import (
+    BadStatusError, ClientContainer, InteropAPIError,
+)
+from runner.fake import FAKE_IMAGE_SET, FakeDockerClient
+from runner.pool import ContainerSet
+from runner.test_cases import TEST_CASES
+from runner.upload import upload_measurements_async
+from runner.vdaf import generate_measurements
+
+
+class TestAsyncContainers(unittest.TestCase):
+    def setUp(self):
+        self.container_set = ContainerSet(FakeDockerClient(), FAKE_IMAGE_SET)
+        self.addCleanup(self.container_set.close)
+
+    def test_upload_and_collect(self):
+        test_case = TEST_CASES[0]
+        container_set = self.container_set
+        task = provision_task(container_set.client, container_set.leader,
+                              container_set.helper, container_set.collector,
+                              test_case)
+        measurements = generate_measurements(test_case.vdaf, 100)
+
+        async def run():
+            client = AsyncClientContainer(container_set.client)
+            leader = AsyncAggregatorContainer(container_set.leader)
+            collector = AsyncCollectorContainer(container_set.collector)
+            try:
+                self.assertEqual(
+                    await leader.endpoint_for_task(task.task_id, "leader"),
+                    task.leader_endpoint)
+                acknowledged = await upload_measurements_async(
+                    client, task.task_id, task.leader_endpoint,
+                    task.helper_endpoint, test_case.vdaf, measurements,
+                    task.time_precision, concurrency=8)
+                self.assertEqual(acknowledged, 100)
+                handle = await collector.collection_start(
+                    task.task_id, None, task.query)
+                while True:
+                    result = await collector.collection_poll(handle)
+                    if result is not None:
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(result, measurements.aggregate())
+                # Connections are kept alive between requests.
+                stats = client.connection_stats()
+                self.assertLessEqual(stats.opened, 8)
+                self.assertGreater(stats.reused, 0)
+            finally:
+                for container in (client, leader, collector):
+                    await container.aclose()
+
+        asyncio.run(run())
+
+    def test_interop_api_error(self):
+        container_set = self.container_set
+        container_set.client.wait_for_ready()
+
+        async def run():
+            client = AsyncClientContainer(container_set.client)
+            try:
+                with self.assertRaises(InteropAPIError):
+                    await client.upload(
+                        b"\0" * 32, container_set.leader.container_base_url(),
+                        container_set.helper.container_base_url(),
+                        {"type": "Prio3Count"}, "1", None, 3600)
+            finally:
+                await client.aclose()
+
+        asyncio.run(run())
+
+    def test_batch_upload_probe(self):
+        # Probe results are remembered for the whole process.
+        patcher = mock.patch.dict(ClientContainer._batch_upload_support,
+                                  clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        container = self.container_set.client
+        image = container.original_image
+        probe = (b"\0" * 32, "http://leader:8080/", "http://helper:8080/",
+                 {"type": "Prio3Count"}, 3600)
+        errors = [
+            ConnectionResetError("reset"),
+            BadStatusError(image, "upload_batch", 503, "starting"),
+            InteropAPIError(image, "upload_batch", "unknown task"),
+            BadStatusError(image, "upload_batch", 404, "not found"),
+        ]
+        bodies = []
+
+        def fail(path, body):
+            bodies.append(body)
+            raise errors.pop(0)
+
+        with mock.patch.object(container, "make_request", fail):
+            # Other errors are not remembered, so the probe is repeated.
+            for _ in range(3):
+                self.assertFalse(container.supports_batch_upload(*probe))
+                self.assertIsNone(
+                    ClientContainer.cached_batch_upload_support(image))
+            self.assertFalse(container.supports_batch_upload(*probe))
+        self.assertIs(ClientContainer.cached_batch_upload_support(image),
+                      False)
+        # The probe is a complete request for the task, with no reports.
+        self.assertEqual(bodies[0]["task_id"], "A" * 43)
+        self.assertEqual(bodies[0]["leader"], "http://leader:8080/")
+        self.assertEqual(bodies[0]["measurements"], [])
+
+        ClientContainer._batch_upload_support.clear()
+        async_errors = [
+            ConnectionResetError("reset"),
+            BadStatusError(image, "upload_batch", 501, "not implemented"),
+        ]
+
+        async def fail_async(path, body):
+            raise async_errors.pop(0)
+
+        async def run():
+            client = AsyncClientContainer(container)
+            try:
+                with mock.patch.object(client, "make_request", fail_async):
+                    self.assertFalse(
+                        await client.supports_batch_upload(*probe))
+                    self.assertIsNone(
+                        ClientContainer.cached_batch_upload_support(image))
+                    self.assertFalse(
+                        await client.supports_batch_upload(*probe))
+            finally:
+                await client.aclose()
+
+        asyncio.run(run())
+        self.assertIs(ClientContainer.cached_batch_upload_support(image),
+                      False)
+
+
+class TestHTTPConnectionPool(unittest.TestCase):
+    def serve(self, responses, host="127.0.0.1", requests=None):
+        """
+        Run the pool against a server that sends the given responses in turn,
+        closing the connection after each response listed as None. The
+        request headers received are appended to `requests`, if given.
+        """
+        async def handle(reader, writer):
+            while responses:
+                request = await reader.readuntil(b"\r\n\r\n")
+                if requests is not None:
+                    requests.append(request)
+                length = int(request.split(b"Content-Length: ")[1]
+                             .split(b"\r\n")[0])
+                await reader.readexactly(length)
+                response = responses.pop(0)
+                writer.write(response)
+                await writer.drain()
+                if responses and responses[0] is None:
+                    responses.pop(0)
+                    break
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, host, 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = HTTPConnectionPool(host, port, 1)
+            try:
+                results = [await pool.post("/", b"{}") for _ in range(3)]
+            finally:
+                await pool.aclose()
+                server.close()
+                await server.wait_closed()
+            return results, pool.opened
+
+        return asyncio.run(run())
+
+    def test_keep_alive(self):
+        results, opened = self.serve([
+            b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok",
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"2\r\nch\r\n5;ext=1\r\nunked\r\n0\r\n\r\n",
+            b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n",
+        ])
+        self.assertEqual(results, [(200, b"ok"), (200, b"chunked"),
+                                   (404, b"")])
+        self.assertEqual(opened, 1)
+
+    def test_closed_connections(self):
+        results, opened = self.serve([
+            b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nuntil close",
+            None,
+            # The server closes this connection without saying so, and the
+            # next request is retried on a new connection.
+            b"HTTP/1.1 200 OK\r\nContent-Length: 1\r\n\r\na",
+            None,
+            b"HTTP/1.1 200 OK\r\nContent-Length: 1\r\n\r\nb",
+        ])
+        self.assertEqual(results, [(200, b"until close"), (200, b"a"),
+                                   (200, b"b")])
+        self.assertEqual(opened, 3)
+
+    def test_status_line_without_reason(self):
+        results, _ = self.serve([
+            b"HTTP/1.1 200\r\nContent-Length: 2\r\n\r\nok",
+            b"HTTP/1.1 404 \r\nContent-Length: 0\r\n\r\n",
+            b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n",
+        ])
+        self.assertEqual(results, [(200, b"ok"), (404, b""), (503, b"")])
+
+    def test_ipv6_host_header(self):
+        if not socket.has_ipv6:
+            self.skipTest("IPv6 is not supported")
+        requests: List[bytes] = []
+        responses = [b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"] * 3
+        try:
+            self.serve(responses, "::1", requests)
+        except OSError as e:
+            self.skipTest(f"Cannot listen on ::1: {e}")
+        self.assertRegex(requests[0], rb"\r\nHost: \[::1\]:\d+\r\n")
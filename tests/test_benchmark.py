@@ -0,0 +1,32 @@
+import dataclasses
+import unittest
+
+from runner.benchmark import percentile, run_iteration
+from runner.fake import FAKE_IMAGE_SET, FakeDockerClient
+from runner.models import RunOptions
+from runner.pool import ContainerSet
+from runner.test_cases import TEST_CASES
+
+
+class TestPercentile(unittest.TestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([3.0], 0.99), 3.0)
+        values = [5.0, 1.0, 4.0, 2.0, 3.0]
+        self.assertEqual(percentile(values, 0.0), 1.0)
+        self.assertEqual(percentile(values, 0.5), 3.0)
+        self.assertEqual(percentile(values, 1.0), 5.0)
+        self.assertAlmostEqual(percentile(values, 0.95), 4.8)
+
+
+class TestRunIteration(unittest.TestCase):
+    def test_run_iteration(self):
+        container_set = ContainerSet(FakeDockerClient(), FAKE_IMAGE_SET)
+        self.addCleanup(container_set.close)
+        test_case = dataclasses.replace(TEST_CASES[0], measurement_count=20)
+        result = run_iteration(container_set, test_case, 2,
+                               RunOptions(upload_batch_size=5))
+        self.assertEqual(len(result.upload_latencies), 8)
+        self.assertEqual(len(result.collection_latencies), 2)
+        self.assertGreater(result.uploads_per_second, 0)
+        self.assertGreater(result.generation_seconds, 0)
@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from runner.concurrency import run_concurrently, run_graph
+
+
+class TestRunConcurrently(unittest.TestCase):
+    def test_results_in_order(self):
+        self.assertEqual(
+            run_concurrently([lambda: 1, lambda: 2, lambda: 3]),
+            [1, 2, 3],
+        )
+
+    def test_cleanup_on_partial_failure(self):
+        def fail():
+            raise ValueError("failed")
+
+        cleaned_up = []
+        with self.assertRaises(ValueError):
+            run_concurrently([lambda: "a", fail, lambda: "c"],
+                             cleaned_up.append)
+        self.assertEqual(cleaned_up, ["a", "c"])
+
+
+class TestRunGraph(unittest.TestCase):
+    def test_dependencies(self):
+        # "b" and "c" can only both finish if they run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait(value):
+            def step(results):
+                barrier.wait()
+                return results["a"] + value
+            return step
+
+        results = run_graph({
+            "a": ((), lambda _: 1),
+            "b": (("a",), wait(10)),
+            "c": (("a",), wait(100)),
+            "d": (("b", "c"), lambda results: results["b"] + results["c"]),
+        })
+        self.assertEqual(results, {"a": 1, "b": 11, "c": 101, "d": 112})
+
+    def test_failure_stops_dependents(self):
+        ran = []
+
+        def fail(_):
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            run_graph({
+                "a": ((), fail),
+                "b": (("a",), lambda _: ran.append("b")),
+            })
+        self.assertEqual(ran, [])
+
+    def test_invalid_graphs(self):
+        with self.assertRaises(ValueError):
+            run_graph({"a": (("missing",), lambda _: None)})
+        with self.assertRaises(ValueError):
+            run_graph({
+                "a": (("b",), lambda _: None),
+                "b": (("a",), lambda _: None),
+            })
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from runner import vdaf
+from runner.corpus import (
+    Corpus, CorpusError, load_or_create_corpus, open_measurements,
+    write_corpus,
+)
+from runner.models import RunOptions
+from runner.test_cases import TEST_CASES
+from runner.vdaf import aggregate_measurements
+
+VDAFS = list({str(test_case.vdaf): test_case.vdaf
+              for test_case in TEST_CASES}.values())
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def check_round_trip(self):
+        path = os.path.join(self.directory.name, "corpus")
+        for vdaf_dict in VDAFS:
+            with self.subTest(vdaf_dict):
+                # More than one chunk, ending with a partial chunk.
+                write_corpus(path, vdaf_dict, 5000, seed=1)
+                with Corpus(path) as corpus:
+                    self.assertEqual(len(corpus), 5000)
+                    measurements = list(corpus)
+                    self.assertEqual(len(measurements), 5000)
+                    self.assertEqual(
+                        corpus.expected_aggregate,
+                        aggregate_measurements(vdaf_dict, None,
+                                               measurements),
+                    )
+                    # Iterating a second time yields the same measurements.
+                    self.assertEqual(list(corpus), measurements)
+
+    def test_round_trip_numpy(self):
+        if vdaf.numpy is None:
+            self.skipTest("NumPy is not installed")
+        self.check_round_trip()
+
+    def test_round_trip_pure_python(self):
+        with mock.patch.object(vdaf, "numpy", None):
+            self.check_round_trip()
+
+    def test_reproducible(self):
+        first = os.path.join(self.directory.name, "first")
+        second = os.path.join(self.directory.name, "second")
+        write_corpus(first, VDAFS[0], 100, seed=5)
+        write_corpus(second, VDAFS[0], 100, seed=5)
+        with open(first, "rb") as f, open(second, "rb") as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_close_during_iteration(self):
+        path = os.path.join(self.directory.name, "corpus")
+        write_corpus(path, VDAFS[0], 10, seed=1)
+        corpus = Corpus(path)
+        iterator = iter(corpus)
+        next(iterator)
+        corpus.close()
+
+    def test_malformed(self):
+        path = os.path.join(self.directory.name, "corpus")
+        with open(path, "wb") as f:
+            f.write(b"not a corpus file")
+        with self.assertRaises(CorpusError):
+            Corpus(path)
+
+    def test_load_or_create(self):
+        test_case = TEST_CASES[0]
+        with load_or_create_corpus(self.directory.name, test_case,
+                                   3) as corpus:
+            path = corpus.path
+            measurements = list(corpus)
+        modified = os.stat(path).st_mtime_ns
+        with load_or_create_corpus(self.directory.name, test_case,
+                                   3) as corpus:
+            self.assertEqual(list(corpus), measurements)
+        self.assertEqual(os.stat(path).st_mtime_ns, modified)
+
+
+class TestOpenMeasurements(unittest.TestCase):
+    def test_seeded_stream(self):
+        test_case = TEST_CASES[0]
+        options = RunOptions(seed=9)
+        with open_measurements(test_case, options) as (first, expected):
+            self.assertIsNone(expected)
+            first = list(first)
+        with open_measurements(test_case, options) as (second, expected):
+            self.assertEqual(list(second), first)
+
+    def test_corpus_matches_stream(self):
+        test_case = TEST_CASES[0]
+        with tempfile.TemporaryDirectory() as directory:
+            options = RunOptions(seed=9, corpus_directory=directory)
+            with open_measurements(test_case, options) as (corpus, expected):
+                from_corpus = list(corpus)
+                self.assertEqual(
+                    expected,
+                    aggregate_measurements(test_case.vdaf, None,
+                                           from_corpus),
+                )
+        with open_measurements(test_case, RunOptions(seed=9)) as (stream, _):
+            self.assertEqual(list(stream), from_corpus)
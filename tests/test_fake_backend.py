@@ -0,0 +1,89 @@
+import asyncio
+import dataclasses
+import os
+import tarfile
+import tempfile
+import unittest
+
+import requests
+
+from runner import LOG_ON_ERROR_DIRECTORY, run_test
+from runner.async_containers import AsyncDAPContainer
+from runner.fake import (
+    FAKE_AGGREGATOR_IMAGE, FAKE_IMAGE_SET, FakeDockerClient,
+)
+from runner.models import RunOptions
+from runner.pool import ContainerPool, ContainerSet
+from runner.test_cases import TEST_CASES
+from runner.upload import UploadError
+
+
+class TestFakeBackend(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeDockerClient()
+
+    def test_all_test_cases(self):
+        options = RunOptions(upload_concurrency=4, upload_batch_size=7)
+        for test_case in TEST_CASES:
+            with self.subTest(test_case.name):
+                test_case = test_case.with_measurement_count(
+                    min(test_case.measurement_count, 50))
+                metrics = run_test(self.client, FAKE_IMAGE_SET, test_case,
+                                   options)
+                self.assertEqual(set(metrics.startup_times),
+                                 {"client", "leader", "helper", "collector"})
+
+    def test_async_uploads(self):
+        options = RunOptions(upload_concurrency=4, upload_batch_size=1,
+                             async_uploads=True)
+        for test_case in TEST_CASES[:2]:
+            run_test(self.client, FAKE_IMAGE_SET, test_case, options)
+
+    def test_container_pool(self):
+        pool = ContainerPool(self.client, max_uses=2)
+        try:
+            for test_case in TEST_CASES[:3]:
+                run_test(self.client, FAKE_IMAGE_SET, test_case, pool=pool)
+        finally:
+            pool.close()
+
+    def test_request_timeout(self):
+        container_set = ContainerSet(FakeDockerClient(latency=1.0),
+                                     FAKE_IMAGE_SET)
+        self.addCleanup(container_set.close)
+        container = container_set.client
+        container.request_timeout = 0.05
+        with self.assertRaises(requests.exceptions.Timeout):
+            container.make_request("internal/test/ready", {})
+
+        async def run():
+            async_container = AsyncDAPContainer(container)
+            try:
+                await async_container.make_request("internal/test/ready", {})
+            finally:
+                await async_container.aclose()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+
+    def test_failure_saves_logs(self):
+        image_set = dataclasses.replace(FAKE_IMAGE_SET,
+                                        client=FAKE_AGGREGATOR_IMAGE)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                for _ in range(2):
+                    with self.assertRaises(UploadError):
+                        run_test(self.client, image_set, TEST_CASES[0])
+                # Each failure is saved to its own directory.
+                failures = os.listdir(LOG_ON_ERROR_DIRECTORY)
+                self.assertEqual(len(failures), 2)
+                failure = os.path.join(LOG_ON_ERROR_DIRECTORY, failures[0])
+                self.assertTrue(os.path.exists(
+                    os.path.join(failure, "test_case.txt")))
+                with tarfile.open(os.path.join(
+                        failure, "leader_logs.tar.gz")) as tf:
+                    self.assertIn("logs/fake.log", tf.getnames())
+            finally:
+                os.chdir(cwd)
@@ -1,8 +1,14 @@
 import io
+import os
 import shutil
+import tarfile
+import tempfile
 import unittest
 
-from runner.containers import GeneratorStreamAdapter
+from runner.containers import (
+    ARCHIVE_CHUNK_SIZE, DAPContainer, GeneratorStreamAdapter, tar_stream,
+)
+from runner.fake import FAKE_CLIENT_IMAGE, FakeDockerClient
 
 
 def sample_generator():
@@ -24,3 +30,88 @@ class TestGeneratorStreamAdapter(unittest.TestCase):
         bio = io.BytesIO()
         shutil.copyfileobj(stream, bio, 5)
         self.assertEqual(bio.getvalue(), expected_output)
+
+    def test_chunk_and_buffer_sizes(self):
+        data = bytes(range(256)) * 40
+        for chunk_size in (1, 7, 512, 4096, len(data)):
+            chunks = [data[i:i + chunk_size]
+                      for i in range(0, len(data), chunk_size)]
+            for buffer_size in (1, 13, 4096, 65536):
+                if chunk_size * buffer_size == 1:
+                    continue
+                with self.subTest(chunk_size=chunk_size,
+                                  buffer_size=buffer_size):
+                    stream = GeneratorStreamAdapter(iter(chunks))
+                    bio = io.BytesIO()
+                    shutil.copyfileobj(stream, bio, buffer_size)
+                    self.assertEqual(bio.getvalue(), data)
+
+                    stream = GeneratorStreamAdapter(iter(chunks))
+                    buffer = bytearray(buffer_size)
+                    output = bytearray()
+                    while True:
+                        length = stream.readinto(buffer)
+                        if not length:
+                            break
+                        output += buffer[:length]
+                    self.assertEqual(output, data)
+
+    def test_large_chunk_small_reads(self):
+        # Reading a large chunk through a small buffer must not copy the
+        # rest of the chunk on each read, or this would take minutes.
+        data = b"x" * (16 * 1024 * 1024)
+        stream = GeneratorStreamAdapter(iter([data]))
+        total = 0
+        while True:
+            chunk = stream.read(1024)
+            if not chunk:
+                break
+            total += len(chunk)
+        self.assertEqual(total, len(data))
+
+    def test_empty_chunks(self):
+        stream = GeneratorStreamAdapter(iter([b"", b"abc", b"", b"", b"d"]))
+        self.assertEqual(stream.read(), b"abcd")
+
+
+class TestTarStream(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files = []
+            for name, size in [("empty", 0), ("small", 10),
+                               ("block", tarfile.BLOCKSIZE),
+                               ("nested/large", 3 * 1024 * 1024 + 1)]:
+                path = os.path.join(directory, name.replace("/", "_"))
+                with open(path, "wb") as f:
+                    f.write(os.urandom(size))
+                files.append((name, path))
+
+            for chunk_size in (1000, ARCHIVE_CHUNK_SIZE):
+                with self.subTest(chunk_size=chunk_size):
+                    stream = GeneratorStreamAdapter(
+                        tar_stream(files, chunk_size))
+                    with tarfile.open(fileobj=stream, mode="r|") as tf:
+                        contents = {}
+                        for entry in tf:
+                            extract_file = tf.extractfile(entry)
+                            assert extract_file is not None
+                            contents[entry.name] = extract_file.read()
+                    for name, path in files:
+                        with open(path, "rb") as f:
+                            self.assertEqual(contents[name], f.read())
+
+    def test_put_files(self):
+        client = FakeDockerClient()
+        network = client.networks.create("test-network")
+        self.addCleanup(network.remove)
+        fake_container = client.containers.run(
+            FAKE_CLIENT_IMAGE, detach=True, name="test-container",
+            network="test-network")
+        container = DAPContainer(fake_container, FAKE_CLIENT_IMAGE)
+        self.addCleanup(container.remove)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"configuration")
+            f.flush()
+            container.put_files("/etc/dap", [("config.toml", f.name)])
+        self.assertEqual(fake_container.files,
+                         {"/etc/dap/config.toml": b"configuration"})
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from runner.images import DigestCache, ImagePuller
+
+
+class StubImage:
+    def __init__(self, image_id: str, repo_digests):
+        self.id = image_id
+        self.attrs = {"RepoDigests": repo_digests}
+
+
+class StubRegistryData:
+    def __init__(self, digest: str):
+        self.id = digest
+
+
+class StubImages:
+    "Records pulls, and tracks how many are in progress at once."
+
+    def __init__(self, digests):
+        self.digests = digests
+        self.local = {}
+        self.pulled = []
+        self.lock = threading.Lock()
+        self.in_progress = 0
+        self.max_in_progress = 0
+        self.release = threading.Event()
+
+    def get_registry_data(self, image):
+        return StubRegistryData(self.digests[image])
+
+    def get(self, image):
+        if image not in self.local:
+            raise Exception("not found")
+        return self.local[image]
+
+    def pull(self, image):
+        if image.startswith("broken"):
+            raise Exception(f"cannot pull {image}")
+        with self.lock:
+            self.in_progress += 1
+            self.max_in_progress = max(self.max_in_progress,
+                                       self.in_progress)
+        self.release.wait(5)
+        with self.lock:
+            self.in_progress -= 1
+            self.pulled.append(image)
+            # Pulled images have no repository digests, so only the cache
+            # can show that they are up to date.
+            self.local[image] = StubImage(f"id-{self.digests[image]}", [])
+        return self.local[image]
+
+
+class StubClient:
+    def __init__(self, digests):
+        self.images = StubImages(digests)
+
+
+class TestImagePuller(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_path = os.path.join(directory.name, "digests.json")
+
+    def test_bounded_concurrency(self):
+        images = [f"image-{i}" for i in range(6)]
+        client = StubClient({image: "sha256:1" for image in images})
+        puller = ImagePuller(client, 2, self.cache_path)
+        try:
+            puller.pull(images)
+            client.images.release.set()
+            puller.wait(images)
+        finally:
+            puller.close()
+        self.assertEqual(sorted(client.images.pulled), images)
+        self.assertLessEqual(client.images.max_in_progress, 2)
+
+    def test_skips_unchanged_images(self):
+        client = StubClient({"a": "sha256:1", "b": "sha256:2",
+                             "c": "sha256:3"})
+        client.images.release.set()
+        # This image is present locally with the registry's digest.
+        client.images.local["c"] = StubImage("id-c", ["c@sha256:3"])
+        puller = ImagePuller(client, 2, self.cache_path)
+        try:
+            puller.pull(["a", "b", "c"])
+            puller.wait(["a", "b", "c"])
+        finally:
+            puller.close()
+        self.assertEqual(sorted(client.images.pulled), ["a", "b"])
+
+        # A new puller reads the digest cache, and only pulls the image whose
+        # digest has changed.
+        client.images.pulled.clear()
+        client.images.digests["b"] = "sha256:4"
+        puller = ImagePuller(client, 2, self.cache_path)
+        try:
+            puller.pull(["a", "b", "c"])
+            puller.wait(["a", "b", "c"])
+        finally:
+            puller.close()
+        self.assertEqual(client.images.pulled, ["b"])
+
+    def test_shared_cache(self):
+        # Pullers for two Docker hosts record their digests in one file.
+        cache = DigestCache(self.cache_path)
+        pullers = []
+        for image in ("a", "b"):
+            client = StubClient({image: "sha256:1"})
+            client.images.release.set()
+            puller = ImagePuller(client, 1, cache=cache)
+            pullers.append(puller)
+            puller.pull([image])
+        for puller in pullers:
+            puller.close()
+        reloaded = DigestCache(self.cache_path)
+        self.assertIsNotNone(reloaded.get("a"))
+        self.assertIsNotNone(reloaded.get("b"))
+
+    def test_error(self):
+        client = StubClient({"ok": "sha256:1", "broken": "sha256:2"})
+        client.images.release.set()
+        puller = ImagePuller(client, 2, None)
+        try:
+            puller.pull(["ok", "broken"])
+            puller.wait(["ok"])
+            with self.assertRaisesRegex(Exception, "cannot pull broken"):
+                puller.wait(["ok", "broken"])
+        finally:
+            puller.close()
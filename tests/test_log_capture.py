@@ -0,0 +1,103 @@
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from runner.containers import TRUNCATED_LOGS_NOTE, DAPContainer
+from runner.fake import FAKE_AGGREGATOR_IMAGE, FakeDockerClient
+
+
+class TestLogCapture(unittest.TestCase):
+    def setUp(self):
+        client = FakeDockerClient()
+        network = client.networks.create("test-network")
+        self.addCleanup(network.remove)
+        fake_container = client.containers.run(
+            FAKE_AGGREGATOR_IMAGE, detach=True, name="test-container",
+            network="test-network")
+        self.container = DAPContainer(fake_container, FAKE_AGGREGATOR_IMAGE)
+        self.addCleanup(fake_container.remove)
+        for i in range(1000):
+            fake_container.service.log(f"line {i}")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_archive(self):
+        path = os.path.join(self.directory.name, "logs.tar.gz")
+        self.container.save_logs_archive(path)
+        with tarfile.open(path) as tf:
+            self.assertEqual(tf.getnames(), ["logs/fake.log"])
+            log = tf.extractfile("logs/fake.log")
+            assert log is not None
+            self.assertEqual(log.read().count(b"\n"), 1000)
+
+    def test_archive_size_limit(self):
+        path = os.path.join(self.directory.name, "logs.tar.gz")
+        self.container.save_logs_archive(path, max_bytes=100)
+        with tarfile.open(path) as tf:
+            self.assertEqual(tf.getnames(),
+                             ["logs/fake.log", TRUNCATED_LOGS_NOTE])
+            log = tf.extractfile("logs/fake.log")
+            assert log is not None
+            self.assertEqual(len(log.read()), 100)
+
+    def test_process_logs(self):
+        path = os.path.join(self.directory.name, "process.log.gz")
+        self.container.save_process_logs(path)
+        with gzip.open(path) as f:
+            self.assertEqual(f.read().count(b"\n"), 1000)
+
+        self.container.save_process_logs(path, max_bytes=100)
+        with gzip.open(path) as f:
+            contents = f.read()
+        self.assertTrue(contents.endswith(b"[Truncated after 100 bytes]\n"))
+        self.assertLess(len(contents), 200)
+
+    def streamed(self) -> bytes:
+        assert self.container._log_streamer is not None
+        f = io.BytesIO()
+        self.container._log_streamer.buffer.write_to(f)
+        return f.getvalue()
+
+    def test_streamed_process_logs(self):
+        self.container.start_log_stream(memory_limit=1000, spill_limit=1000)
+        streamer = self.container._log_streamer
+        assert streamer is not None
+        deadline = time.monotonic() + 5
+        while not self.streamed().endswith(b"line 999\n") and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        path = os.path.join(self.directory.name, "process.log.gz")
+        self.container.save_process_logs(path)
+        with gzip.open(path) as f:
+            contents = f.read()
+        self.assertTrue(contents.startswith(b"test-container: line 0\n"))
+        self.assertIn(b"bytes of output discarded", contents)
+        self.assertTrue(contents.endswith(b"test-container: line 999\n"))
+
+        # Removing the container ends the log stream.
+        self.container.remove()
+        self.assertFalse(streamer._thread.is_alive())
+
+    def test_remove_failure_stops_log_stream(self):
+        self.container.start_log_stream()
+        streamer = self.container._log_streamer
+        assert streamer is not None
+        # The container is still running, so its log stream will not end by
+        # itself.
+        original_stop = streamer.stop
+        stop = mock.Mock(side_effect=lambda: original_stop(timeout=0.1))
+        close = mock.Mock(wraps=streamer.buffer.close)
+        with mock.patch.object(self.container._container, "remove",
+                               side_effect=Exception("daemon unavailable")), \
+                mock.patch.object(streamer, "stop", stop), \
+                mock.patch.object(streamer.buffer, "close", close):
+            with self.assertRaisesRegex(Exception, "daemon unavailable"):
+                self.container.remove()
+        stop.assert_called_once_with()
+        close.assert_called_once_with()
+        self.assertFalse(streamer._thread.is_alive())
@@ -0,0 +1,89 @@
+import io
+import time
+import unittest
+from unittest import mock
+
+from runner import logbuffer
+from runner.logbuffer import LogBuffer
+
+
+def saved(buffer, **kwargs) -> bytes:
+    f = io.BytesIO()
+    written = buffer.write_to(f, **kwargs)
+    assert written == len(f.getvalue())
+    return f.getvalue()
+
+
+class TestLogBuffer(unittest.TestCase):
+    def test_in_memory(self):
+        buffer = LogBuffer(memory_limit=100, spill_limit=100)
+        buffer.append(b"one\n")
+        buffer.append(b"")
+        buffer.append(b"two\n")
+        self.assertEqual(saved(buffer), b"one\ntwo\n")
+
+    def test_spill(self):
+        buffer = LogBuffer(memory_limit=10, spill_limit=1000)
+        lines = [f"line {i}\n".encode() for i in range(20)]
+        for line in lines:
+            buffer.append(line)
+        self.assertEqual(saved(buffer), b"".join(lines))
+        buffer.close()
+
+    def test_discard(self):
+        buffer = LogBuffer(memory_limit=10, spill_limit=20)
+        for i in range(100):
+            buffer.append(b"%07d\n" % i)
+        contents = saved(buffer)
+        # The start and end of the output are kept.
+        self.assertTrue(contents.startswith(b"0000000\n0000001\n0000"))
+        self.assertIn(b"bytes of output discarded", contents)
+        self.assertTrue(contents.endswith(b"0000099\n"))
+        buffer.close()
+
+    def test_max_bytes(self):
+        buffer = LogBuffer(memory_limit=16, spill_limit=1000)
+        for i in range(100):
+            buffer.append(b"%07d\n" % i)
+        contents = saved(buffer, max_bytes=40)
+        self.assertTrue(contents.startswith(b"0000000\n"))
+        self.assertTrue(contents.endswith(b"0000098\n0000099\n"))
+        self.assertIn(b"[760 bytes of output discarded]", contents)
+
+        # Only the end is kept if the limit is smaller than what is held in
+        # memory.
+        self.assertEqual(saved(buffer, max_bytes=4),
+                         b"\n[796 bytes of output discarded]\n099\n")
+        buffer.close()
+
+    def test_since(self):
+        buffer = LogBuffer(memory_limit=100, spill_limit=100)
+        buffer.append(b"before\n")
+        time.sleep(0.01)
+        since = time.time()
+        buffer.append(b"after\n")
+        self.assertEqual(saved(buffer, since=since), b"after\n")
+
+    def test_spilled_since(self):
+        buffer = LogBuffer(memory_limit=10, spill_limit=1000)
+        self.addCleanup(buffer.close)
+        now = [100.0]
+        with mock.patch.object(logbuffer.time, "time", lambda: now[0]):
+            # Output from an earlier test case on the same container.
+            for i in range(10):
+                buffer.append(b"old %d\n" % i)
+                now[0] += 0.5
+            now[0] = 110.0
+            new = [b"new %d\n" % i for i in range(10)]
+            for line in new:
+                buffer.append(line)
+                now[0] += 0.5
+        # The earlier output was moved to disk, and is left out.
+        self.assertEqual(saved(buffer, since=110.0), b"".join(new))
+        self.assertTrue(saved(buffer).startswith(b"old 0\n"))
+
+    def test_closed(self):
+        buffer = LogBuffer()
+        buffer.close()
+        buffer.append(b"ignored\n")
+        self.assertEqual(saved(buffer), b"")
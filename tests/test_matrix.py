@@ -0,0 +1,53 @@
+import unittest
+
+from runner.matrix import (
+    INTERACTIONS, ImageLists, coverage, full_matrix, leader_helper_matrix,
+    pairwise_matrix,
+)
+
+LISTS = ImageLists(
+    client=["client-1", "client-2", "client-3"],
+    leader=["aggregator-1", "aggregator-2", "aggregator-3", "aggregator-4"],
+    helper=["aggregator-1", "aggregator-2", "aggregator-3", "aggregator-4"],
+    collector=["collector-1", "collector-2"],
+)
+
+
+class TestMatrix(unittest.TestCase):
+    def test_full(self):
+        image_sets = full_matrix(LISTS)
+        self.assertEqual(len(image_sets), 3 * 4 * 4 * 2)
+        self.assertEqual(len(set(image_sets)), len(image_sets))
+
+    def test_pairwise(self):
+        image_sets = pairwise_matrix(LISTS)
+        for interaction, (covered, total) in \
+                coverage(image_sets, LISTS).items():
+            with self.subTest(interaction):
+                self.assertEqual(covered, total)
+        # Every leader and helper pair must be tested, so this is optimal.
+        self.assertEqual(len(image_sets), 16)
+
+    def test_pairwise_uneven(self):
+        lists = ImageLists(["c1", "c2", "c3", "c4", "c5"], ["l1"],
+                           ["h1", "h2"], ["k1", "k2", "k3"])
+        image_sets = pairwise_matrix(lists)
+        for covered, total in coverage(image_sets, lists).values():
+            self.assertEqual(covered, total)
+        self.assertLess(len(image_sets), len(full_matrix(lists)))
+
+    def test_leader_helper(self):
+        image_sets = leader_helper_matrix(LISTS)
+        report = coverage(image_sets, LISTS)
+        self.assertEqual(report[("leader", "helper")], (16, 16))
+        for role in ("client", "collector"):
+            self.assertEqual(
+                {getattr(image_set, role) for image_set in image_sets},
+                set(getattr(LISTS, role)),
+            )
+
+    def test_coverage_totals(self):
+        report = coverage([], LISTS)
+        self.assertEqual(list(report), INTERACTIONS)
+        self.assertEqual(report[("client", "leader")], (0, 12))
+        self.assertEqual(report[("leader", "collector")], (0, 8))
@@ -0,0 +1,76 @@
+import subprocess
+import sys
+import unittest
+
+from runner.fake import FAKE_CLIENT_IMAGE, FakeDockerClient
+from runner.networks import (
+    HOSTNAME_LABEL, PID_LABEL, NetworkPool, cleanup_orphaned_networks,
+    owner_labels,
+)
+
+
+def network_names(client):
+    return {network.name for network in client.networks.list()}
+
+
+class TestNetworkPool(unittest.TestCase):
+    def test_networks_are_reused(self):
+        client = FakeDockerClient()
+        pool = NetworkPool(client, 2)
+        self.assertEqual(len(network_names(client)), 2)
+        with pool.lease() as first:
+            with pool.lease() as second:
+                with pool.lease() as third:
+                    self.assertEqual(
+                        len({first.name, second.name, third.name}), 3)
+        self.assertEqual(len(network_names(client)), 3)
+        with pool.lease() as network:
+            self.assertIn(network.name, {first.name, second.name,
+                                         third.name})
+            self.assertEqual(network.labels, owner_labels())
+        pool.close()
+        self.assertEqual(network_names(client), set())
+
+    def test_network_with_containers_is_not_reused(self):
+        client = FakeDockerClient()
+        pool = NetworkPool(client)
+        with self.assertLogs("runner.networks", "WARNING"):
+            with pool.lease() as network:
+                container = client.containers.run(
+                    FAKE_CLIENT_IMAGE, name="leftover", network=network.name)
+        with pool.lease() as other:
+            self.assertNotEqual(other.name, network.name)
+        pool.close()
+        self.assertEqual(network_names(client), {network.name})
+        container.remove(force=True)
+
+
+class TestCleanupOrphanedNetworks(unittest.TestCase):
+    def test_cleanup(self):
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        dead = {**owner_labels(), PID_LABEL: str(exited.pid)}
+        client = FakeDockerClient()
+        networks = {
+            "dead": dead,
+            "dead-with-container": dead,
+            "alive": owner_labels(),
+            "other-host": {**dead, HOSTNAME_LABEL: "elsewhere"},
+            "unlabeled": None,
+            "unlabeled-with-container": None,
+        }
+        for name, labels in networks.items():
+            client.networks.create(f"dap-interop-{name}", labels=labels)
+        client.networks.create("unrelated")
+        for name in ("dead-with-container", "unlabeled-with-container"):
+            client.containers.run(FAKE_CLIENT_IMAGE, name=f"client-{name}",
+                                  network=f"dap-interop-{name}")
+
+        self.assertEqual(cleanup_orphaned_networks(client), 3)
+        self.assertEqual(network_names(client), {
+            "dap-interop-alive",
+            "dap-interop-other-host",
+            "dap-interop-unlabeled-with-container",
+            "unrelated",
+        })
+        client.containers.get("client-unlabeled-with-container").remove()
@@ -0,0 +1,22 @@
+import unittest
+
+from runner.polling import Backoff, Deadline
+
+
+class TestBackoff(unittest.TestCase):
+    def test_growth_and_cap(self):
+        backoff = Backoff(initial=0.1, maximum=1.0, multiplier=2.0)
+        bounds = [0.1, 0.2, 0.4, 0.8, 1.0, 1.0]
+        for bound in bounds:
+            delay = backoff.next_delay()
+            self.assertGreaterEqual(delay, bound / 2)
+            self.assertLessEqual(delay, bound)
+
+
+class TestDeadline(unittest.TestCase):
+    def test_deadline(self):
+        self.assertTrue(Deadline(0).expired())
+        self.assertEqual(Deadline(0).remaining(), 0)
+        deadline = Deadline(60)
+        self.assertFalse(deadline.expired())
+        self.assertGreater(deadline.remaining(), 59)
@@ -0,0 +1,109 @@
+import dataclasses
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from runner import results
+from runner.__main__ import run_test_capturing_errors
+from runner.fake import FAKE_IMAGE_SET, FakeDockerClient
+from runner.models import ImageSet, RunOptions
+from runner.results import RerunPolicy, ResultCache, result_key
+from runner.test_cases import TEST_CASES
+
+
+class TestResultCache(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            cache = ResultCache(path)
+            self.assertIsNone(cache.get("a"))
+            cache.record("a", FAKE_IMAGE_SET, TEST_CASES[0], True)
+            cache.record("b", FAKE_IMAGE_SET, TEST_CASES[1], False)
+            cache.close()
+
+            cache = ResultCache(path)
+            self.assertIs(cache.get("a"), True)
+            self.assertIs(cache.get("b"), False)
+            self.assertIsNone(cache.get("c"))
+
+    def test_bounded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            with mock.patch.object(results, "MAX_RESULTS", 3), \
+                    mock.patch.object(results, "FLUSH_INTERVAL", 3600):
+                cache = ResultCache(path)
+                for key in "abcde":
+                    cache.record(key, FAKE_IMAGE_SET, TEST_CASES[0], True)
+                # Results are written in batches.
+                self.assertFalse(os.path.exists(path))
+                cache.close()
+            with open(path) as f:
+                self.assertEqual(sorted(json.load(f)), ["c", "d", "e"])
+
+    def test_pull_failure_not_recorded(self):
+        class FailingPuller:
+            def wait(self, images):
+                raise Exception("pull failed")
+
+        client = FakeDockerClient()
+        test_case = TEST_CASES[0]
+        key = result_key(client, FAKE_IMAGE_SET, test_case)
+        assert key is not None
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(os.path.join(directory, "results.json"))
+            cache.record(key, FAKE_IMAGE_SET, test_case, True)
+            outcome = run_test_capturing_errors(
+                client, FAKE_IMAGE_SET, test_case, RunOptions(), None,
+                FailingPuller(), cache, RerunPolicy.ALL)
+            self.assertFalse(outcome.passed)
+            self.assertIn("pull failed", outcome.error)
+            # The earlier result for these images still stands.
+            self.assertIs(cache.get(key), True)
+
+    def test_key(self):
+        client = FakeDockerClient()
+        test_case = TEST_CASES[0]
+        key = result_key(client, FAKE_IMAGE_SET, test_case)
+        self.assertIsNotNone(key)
+        self.assertEqual(result_key(client, FAKE_IMAGE_SET, test_case), key)
+        self.assertNotEqual(
+            result_key(client, FAKE_IMAGE_SET,
+                       dataclasses.replace(test_case, measurement_count=11)),
+            key,
+        )
+        other_images = ImageSet(FAKE_IMAGE_SET.client,
+                                FAKE_IMAGE_SET.leader,
+                                FAKE_IMAGE_SET.leader + ":other",
+                                FAKE_IMAGE_SET.collector)
+        self.assertNotEqual(result_key(client, other_images, test_case), key)
+        self.assertEqual(
+            result_key(client, FAKE_IMAGE_SET, test_case,
+                       RunOptions(readiness_timeout=1)),
+            key,
+        )
+        for options, reuse_containers in [
+                (RunOptions(upload_concurrency=64), False),
+                (RunOptions(async_uploads=True), False),
+                (RunOptions(seed=1), False),
+                (RunOptions(), True)]:
+            self.assertNotEqual(
+                result_key(client, FAKE_IMAGE_SET, test_case, options,
+                           reuse_containers),
+                key,
+            )
+
+    def test_rerun_policy(self):
+        cases = [
+            (RerunPolicy.UNLESS_PASSED, [True, True, False]),
+            (RerunPolicy.FAILED, [False, True, False]),
+            (RerunPolicy.ALL, [True, True, True]),
+        ]
+        for policy, expected in cases:
+            with self.subTest(policy):
+                self.assertEqual(
+                    [policy.should_run(previous)
+                     for previous in (None, False, True)],
+                    expected,
+                )
@@ -0,0 +1,143 @@
+import argparse
+import collections
+import threading
+import time
+import unittest
+from unittest import mock
+
+from runner.async_containers import AsyncClientContainer
+from runner.cli import docker_host_address, parse_docker_host
+from runner.fake import FAKE_IMAGE_SET, FakeDockerClient
+from runner.pool import ContainerSet
+from runner.scheduler import DockerHost, NoHealthyHostsError, Scheduler
+
+
+class StubClient:
+    def __init__(self):
+        self.healthy = True
+
+    def ping(self):
+        if not self.healthy:
+            raise Exception("connection refused")
+        return True
+
+
+class TestScheduler(unittest.TestCase):
+    def test_results_in_order(self) -> None:
+        hosts = [DockerHost("a", StubClient(), 2),
+                 DockerHost("b", StubClient(), 3)]
+        lock = threading.Lock()
+        running: collections.Counter = collections.Counter()
+        most_running: collections.Counter = collections.Counter()
+
+        def run(host, item):
+            with lock:
+                running[host.name] += 1
+                most_running[host.name] = max(most_running[host.name],
+                                              running[host.name])
+            time.sleep(0.01)
+            with lock:
+                running[host.name] -= 1
+            return item * 2
+
+        scheduler = Scheduler(hosts, list(range(20)), run,
+                              lambda result: False)
+        results = [future.result() for future in scheduler.futures()]
+        scheduler.stop()
+        self.assertEqual(results, [item * 2 for item in range(20)])
+        self.assertEqual(most_running, {"a": 2, "b": 3})
+
+    def test_reschedule_from_unhealthy_host(self):
+        bad = DockerHost("bad", StubClient(), 1)
+        good = DockerHost("good", StubClient(), 1)
+        # Hold the healthy host's only slot until the bad host has failed.
+        failed = threading.Event()
+
+        def run(host, item):
+            if host is bad:
+                host.client.healthy = False
+                failed.set()
+                return ("fail", host.name)
+            failed.wait(5)
+            return ("pass", host.name)
+
+        with self.assertLogs("runner.scheduler", "WARNING"):
+            scheduler = Scheduler([bad, good], list(range(5)), run,
+                                  lambda result: result[0] == "fail")
+            results = [future.result() for future in scheduler.futures()]
+            scheduler.stop()
+        self.assertEqual(results, [("pass", "good")] * 5)
+        self.assertFalse(bad.healthy)
+
+    def test_failure_on_healthy_host(self):
+        host = DockerHost("a", StubClient(), 1)
+        scheduler = Scheduler([host], [1, 2], lambda host, item: "fail",
+                              lambda result: True)
+        results = [future.result() for future in scheduler.futures()]
+        scheduler.stop()
+        self.assertEqual(results, ["fail", "fail"])
+        self.assertTrue(host.healthy)
+
+    def test_no_healthy_hosts(self):
+        host = DockerHost("a", StubClient(), 1)
+
+        def run(host, item):
+            host.client.healthy = False
+            return "fail"
+
+        with self.assertLogs("runner.scheduler", "WARNING"):
+            scheduler = Scheduler([host], [1, 2, 3], run,
+                                  lambda result: True)
+            for future in scheduler.futures():
+                with self.assertRaises(NoHealthyHostsError):
+                    future.result(5)
+            scheduler.stop()
+
+    def test_exception(self):
+        def run(host, item):
+            raise ValueError(item)
+
+        scheduler = Scheduler([DockerHost("a", StubClient(), 1)], [1], run,
+                              lambda result: False)
+        with self.assertRaises(ValueError):
+            scheduler.futures()[0].result(5)
+        scheduler.stop()
+
+
+class TestParseDockerHost(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_docker_host("tcp://build-1:2376=4"),
+                         ("tcp://build-1:2376", 4))
+        self.assertEqual(parse_docker_host("ssh://user@build-2"),
+                         ("ssh://user@build-2", None))
+        self.assertEqual(parse_docker_host("unix:///var/run/docker.sock=0"),
+                         ("unix:///var/run/docker.sock=0", None))
+
+
+class TestDockerHostAddress(unittest.TestCase):
+    def test_address(self):
+        args = argparse.Namespace(fake=False)
+        self.assertEqual(docker_host_address(args, "tcp://build-1:2376"),
+                         "build-1")
+        self.assertEqual(docker_host_address(args, "ssh://user@build-2"),
+                         "build-2")
+        self.assertEqual(docker_host_address(args, "tcp://[fd00::1]:2375"),
+                         "fd00::1")
+        self.assertEqual(
+            docker_host_address(args, "unix:///var/run/docker.sock"),
+            "127.0.0.1")
+        with mock.patch.dict("os.environ", {"DOCKER_HOST": "tcp://build-3"}):
+            self.assertEqual(docker_host_address(args), "build-3")
+            self.assertEqual(
+                docker_host_address(argparse.Namespace(fake=True)),
+                "127.0.0.1")
+
+    def test_requests_sent_to_host(self):
+        container_set = ContainerSet(FakeDockerClient(), FAKE_IMAGE_SET,
+                                     host_address="fd00::1")
+        self.addCleanup(container_set.close)
+        for _, container in container_set.roles():
+            self.assertEqual(container.host_base_url(),
+                             f"http://[fd00::1]:{container.port()}/")
+        client = AsyncClientContainer(container_set.client)
+        self.assertEqual(client._pool._host, "fd00::1")
@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+
+from runner import stress
+from runner.fake import FAKE_IMAGE_SET, FakeDockerClient
+from runner.models import RunOptions
+from runner.pool import ContainerSet
+from runner.test_cases import TEST_CASES
+
+
+class TestStress(unittest.TestCase):
+    def setUp(self):
+        self.container_set = ContainerSet(FakeDockerClient(), FAKE_IMAGE_SET)
+        self.addCleanup(self.container_set.close)
+
+    def test_stress_test_cases(self):
+        chosen = stress.stress_test_cases(TEST_CASES[:3], 7, 10)
+        self.assertEqual([test_case.name for test_case in chosen],
+                         [TEST_CASES[i % 3].name for i in range(7)])
+        self.assertEqual({test_case.measurement_count
+                          for test_case in chosen}, {10})
+
+    def test_run_tasks(self):
+        test_cases = stress.stress_test_cases(TEST_CASES, 12, 20)
+        results = stress.run_tasks(self.container_set, test_cases,
+                                   RunOptions(upload_concurrency=2))
+        self.assertTrue(all(result.passed for result in results), results)
+        self.assertEqual(len({result.task_id for result in results}), 12)
+        for result in results:
+            self.assertIsNotNone(result.collection_latency)
+
+    def test_failures_are_separate(self):
+        test_cases = stress.stress_test_cases(TEST_CASES[:2], 4, 20)
+        upload_and_collect = stress.upload_and_collect
+
+        def fail_second(client, collector, task, test_case, options):
+            if test_case.name == TEST_CASES[1].name:
+                raise Exception("wrong result")
+            return upload_and_collect(client, collector, task, test_case,
+                                      options)
+
+        with mock.patch.object(stress, "upload_and_collect", fail_second):
+            results = stress.run_tasks(self.container_set, test_cases,
+                                       RunOptions())
+        self.assertEqual([result.passed for result in results],
+                         [True, False, True, False])
+        self.assertEqual(results[1].error, "wrong result")
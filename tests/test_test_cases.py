@@ -0,0 +1,25 @@
+import unittest
+
+from runner.models import QueryType, TestCase
+from runner.test_cases import TEST_CASES
+
+
+class TestTestCases(unittest.TestCase):
+    def test_names_are_unique(self):
+        names = [test_case.name for test_case in TEST_CASES]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_batches(self):
+        with self.assertRaises(ValueError):
+            TestCase("uneven", {"type": "Prio3Count"}, 10,
+                     QueryType.FIXED_SIZE, batch_count=3)
+        with self.assertRaises(ValueError):
+            TestCase("time", {"type": "Prio3Count"}, 10,
+                     QueryType.TIME_INTERVAL, batch_count=2)
+        test_case = TestCase("fixed", {"type": "Prio3Count"}, 1000,
+                             QueryType.FIXED_SIZE, batch_count=10)
+        self.assertEqual(test_case.batch_size, 100)
+        self.assertEqual(
+            test_case.with_measurement_count(55).measurement_count, 50)
+        self.assertEqual(
+            test_case.with_measurement_count(3).measurement_count, 10)
@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+import unittest
+
+from runner import tracing
+
+
+class TestTracing(unittest.TestCase):
+    def test_disabled(self):
+        self.assertIs(tracing.span("a"), tracing.span("b", key="value"))
+        with tracing.span("a"):
+            pass
+
+    def test_trace_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            tracer = tracing.Tracer(path)
+            tracing.set_tracer(tracer)
+            try:
+                with tracing.span("outer", test_case="example"):
+                    with tracing.span("inner"):
+                        pass
+                    with self.assertRaises(ValueError):
+                        with tracing.span("failed"):
+                            raise ValueError()
+            finally:
+                tracing.set_tracer(None)
+                tracer.close()
+
+            with open(path) as f:
+                events = json.load(f)
+        self.assertEqual([event["name"] for event in events],
+                         ["inner", "failed", "outer"])
+        for event in events:
+            self.assertEqual(event["ph"], "X")
+            self.assertGreaterEqual(event["dur"], 0)
+        self.assertEqual(events[1]["args"], {"error": "ValueError"})
+        self.assertEqual(events[2]["args"], {"test_case": "example"})
+        self.assertLessEqual(events[2]["ts"], events[0]["ts"])
@@ -0,0 +1,91 @@
+import threading
+import unittest
+
+from runner.upload import UploadError, upload_measurements
+
+
+class RecordingClient:
+    def __init__(self, fail_on=(), batch=False):
+        self.lock = threading.Lock()
+        self.uploaded = []
+        self.batches = 0
+        self.fail_on = fail_on
+        self.batch = batch
+
+    def supports_batch_upload(self, task_id, leader_endpoint,
+                              helper_endpoint, vdaf, time_precision):
+        return self.batch
+
+    def upload_batch(self, task_id, leader_endpoint, helper_endpoint, vdaf,
+                     measurements, time, time_precision):
+        if any(measurement in self.fail_on for measurement in measurements):
+            raise Exception("rejected batch")
+        with self.lock:
+            self.uploaded.extend(measurements)
+            self.batches += 1
+
+    def upload(self, task_id, leader_endpoint, helper_endpoint, vdaf,
+               measurement, time, time_precision):
+        if measurement in self.fail_on:
+            raise Exception(f"rejected {measurement}")
+        with self.lock:
+            self.uploaded.append(measurement)
+
+
+class TestUploadMeasurements(unittest.TestCase):
+    def test_all_acknowledged(self):
+        measurements = [str(i) for i in range(100)]
+        for concurrency in (1, 8):
+            client = RecordingClient()
+            acknowledged = upload_measurements(
+                client, b"", "", "", {}, iter(measurements), 3600,
+                concurrency,
+            )
+            self.assertEqual(acknowledged, 100)
+            self.assertEqual(sorted(client.uploaded), sorted(measurements))
+
+    def test_errors_collected(self):
+        measurements = [str(i) for i in range(20)]
+        for concurrency in (1, 4):
+            client = RecordingClient(fail_on=("3", "17"))
+            with self.assertRaises(UploadError) as cm:
+                upload_measurements(
+                    client, b"", "", "", {}, measurements, 3600,
+                    concurrency,
+                )
+            self.assertEqual([index for index, _ in cm.exception.errors],
+                             [3, 17])
+            self.assertEqual(cm.exception.failed, 2)
+            self.assertEqual(cm.exception.total, 20)
+            self.assertEqual(len(client.uploaded), 18)
+
+    def test_batches(self):
+        measurements = [str(i) for i in range(95)]
+        for concurrency in (1, 4):
+            client = RecordingClient(batch=True)
+            acknowledged = upload_measurements(
+                client, b"", "", "", {}, measurements, 3600, concurrency, 10,
+            )
+            self.assertEqual(acknowledged, 95)
+            self.assertEqual(sorted(client.uploaded), sorted(measurements))
+            self.assertEqual(client.batches, 10)
+
+    def test_batch_errors(self):
+        measurements = [str(i) for i in range(30)]
+        client = RecordingClient(fail_on=("12",), batch=True)
+        with self.assertRaises(UploadError) as cm:
+            upload_measurements(
+                client, b"", "", "", {}, measurements, 3600, 2, 10,
+            )
+        self.assertEqual([index for index, _ in cm.exception.errors],
+                         list(range(10, 20)))
+
+    def test_batch_fallback(self):
+        measurements = [str(i) for i in range(15)]
+        client = RecordingClient(batch=False)
+        acknowledged = upload_measurements(
+            client, b"", "", "", {}, measurements, 3600, 1, 10,
+        )
+        self.assertEqual(acknowledged, 15)
+        self.assertEqual(client.uploaded, measurements)
+        self.assertEqual(client.batches, 0)
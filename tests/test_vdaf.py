@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+from runner import vdaf
+from runner.test_cases import TEST_CASES
+from runner.vdaf import (
+    Accumulator, MeasurementBatch, add_aggregates, aggregate_measurements,
+    format_aggregate, generate_measurement_stream, generate_measurements,
+    parse_aggregate,
+)
+
+VDAFS = list({str(test_case.vdaf): test_case.vdaf
+              for test_case in TEST_CASES}.values())
+
+
+class TestMeasurementBatch(unittest.TestCase):
+    def check_vdafs(self):
+        for vdaf_dict in VDAFS:
+            with self.subTest(vdaf_dict):
+                batch = generate_measurements(vdaf_dict, 5000)
+                self.assertEqual(len(batch), 5000)
+                measurements = list(batch)
+                self.assertEqual(len(measurements), 5000)
+                self.assertEqual(
+                    batch.aggregate(),
+                    aggregate_measurements(vdaf_dict, None, measurements),
+                )
+
+    def test_numpy(self):
+        if vdaf.numpy is None:
+            self.skipTest("NumPy is not installed")
+        self.check_vdafs()
+
+    def test_pure_python(self):
+        with mock.patch.object(vdaf, "numpy", None):
+            self.check_vdafs()
+
+    def test_sum_does_not_overflow(self):
+        vdaf_dict = {"type": "Prio3Sum", "bits": "64"}
+        values = [(1 << 64) - 1] * 3
+        if vdaf.numpy is not None:
+            batch = MeasurementBatch(
+                vdaf_dict, vdaf.numpy.array(values, dtype=vdaf.numpy.uint64))
+            self.assertEqual(batch.aggregate(), str(((1 << 64) - 1) * 3))
+        batch = MeasurementBatch(vdaf_dict, vdaf.array.array("Q", values))
+        self.assertEqual(batch.aggregate(), str(((1 << 64) - 1) * 3))
+
+
+class TestAccumulator(unittest.TestCase):
+    def check_stream_adds_batches(self):
+        for vdaf_dict in VDAFS:
+            with self.subTest(vdaf_dict):
+                accumulator = Accumulator(vdaf_dict)
+                measurements = list(generate_measurement_stream(
+                    vdaf_dict, 10000, seed=1, accumulator=accumulator))
+                self.assertEqual(accumulator.count, 10000)
+                self.assertEqual(
+                    accumulator.result(),
+                    aggregate_measurements(vdaf_dict, None, measurements),
+                )
+
+    def test_stream_adds_batches(self):
+        self.check_stream_adds_batches()
+        with mock.patch.object(vdaf, "numpy", None):
+            self.check_stream_adds_batches()
+
+    def test_sum_of_batches(self):
+        for vdaf_dict in VDAFS:
+            with self.subTest(vdaf_dict):
+                measurements = list(
+                    generate_measurement_stream(vdaf_dict, 100))
+                batches = [
+                    parse_aggregate(aggregate_measurements(
+                        vdaf_dict, None, measurements[i:i + 10]))
+                    for i in range(0, 100, 10)
+                ]
+                total = batches[0]
+                for batch in batches[1:]:
+                    total = add_aggregates(total, batch)
+                self.assertEqual(
+                    format_aggregate(total),
+                    aggregate_measurements(vdaf_dict, None, measurements),
+                )